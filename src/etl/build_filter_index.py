@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# src/etl/build_filter_index.py
+
+import argparse
+import happybase
+import logging
+import sys
+import os
+import time
+
+# Bitmap layout and attribute normalization are shared with the web service's search filters
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ustc_spider'))
+from ustc_spider.filters import (build_filter_data, inherit_attributes, parent_row_key, row_attributes,
+                                 write_filter_index)
+
+# Configuration
+HBASE_HOST = os.environ.get('HBASE_HOST', 'localhost')
+HBASE_PORT = int(os.environ.get('HBASE_PORT', '9090'))
+SOURCE_TABLE = 'ustc_web_data'
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'rag', 'filter_index.json')
+
+# Logging setup
+logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+logger = logging.getLogger('filter_index_builder')
+
+def connect_hbase():
+    """Connect to HBase with required transport and protocol settings."""
+    try:
+        connection = happybase.Connection(
+            host=HBASE_HOST,
+            port=HBASE_PORT,
+            timeout=20000,
+            transport='framed',
+            protocol='compact'
+        )
+        connection.open()
+        logger.info(f"Connected to HBase at {HBASE_HOST}:{HBASE_PORT}")
+        return connection
+    except Exception as e:
+        logger.error(f"Failed to connect to HBase: {e}")
+        sys.exit(1)
+
+def load_attributes(connection):
+    """Return {doc_id: {'project', 'type', 'month'}} for every document row."""
+    table = connection.table(SOURCE_TABLE)
+    documents = {}
+    parents = {}
+    columns = [b'info:project', b'info:type', b'info:date', b'info:parent_url']
+    for row_key, data in table.scan(columns=columns):
+        doc_id = row_key.decode('utf-8')
+        documents[doc_id] = row_attributes(data)
+        parent_id = parent_row_key(data)
+        if parent_id:
+            parents[doc_id] = parent_id
+        if len(documents) % 10000 == 0:
+            logger.info(f"Read {len(documents)} documents...")
+
+    # Attachment rows carry neither project nor date; inherit them from the page that links the file
+    # (the search service applies the same rule when it verifies rows that are not in the bitmaps yet)
+    inherited = 0
+    for doc_id, parent_id in parents.items():
+        parent = documents.get(parent_id)
+        if parent and inherit_attributes(documents[doc_id], parent):
+            inherited += 1
+    logger.info(f"{len(documents)} documents, {len(parents)} attachments without their own project or date "
+                f"({inherited} inherited their page's project)")
+    return documents
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Build the project/type/date bitmaps used for search filters and facets')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='filter index file (default: src/rag/filter_index.json)')
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    started = time.time()
+    connection = connect_hbase()
+    try:
+        documents = load_attributes(connection)
+    finally:
+        connection.close()
+
+    data = build_filter_data(documents.items())
+    write_filter_index(args.output, data)
+    logger.info(f"Filter index complete: {len(data['doc_ids'])} documents, "
+                f"{', '.join(f'{len(v)} {a} values' for a, v in data['bitmaps'].items())}, "
+                f"{time.time() - started:.1f}s -> {args.output}")
+
+if __name__ == "__main__":
+    main()
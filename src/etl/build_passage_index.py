@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# src/etl/build_passage_index.py
+
+import argparse
+import happybase
+import json
+import logging
+import sys
+import os
+
+# Passage splitting and encoding are shared with the RAG service's passage retrieval
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ustc_spider'))
+from ustc_spider.indexing import changed_at_timestamp, changed_since_filter
+from ustc_spider.passages import (PASSAGE_FAMILIES, PASSAGE_INDEX_TABLE, PASSAGE_TABLE, passage_id,
+                                  passage_terms, posting_column, posting_value, split_passages)
+
+# Configuration
+HBASE_HOST = os.environ.get('HBASE_HOST', 'localhost')
+HBASE_PORT = int(os.environ.get('HBASE_PORT', '9090'))
+SOURCE_TABLE = 'ustc_web_data'
+BATCH_SIZE = 1000
+
+# Logging setup
+logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+logger = logging.getLogger('passage_index_builder')
+
+def connect_hbase():
+    """Connect to HBase with required transport and protocol settings."""
+    try:
+        connection = happybase.Connection(
+            host=HBASE_HOST,
+            port=HBASE_PORT,
+            timeout=20000,
+            transport='framed',
+            protocol='compact'
+        )
+        connection.open()
+        logger.info(f"Connected to HBase at {HBASE_HOST}:{HBASE_PORT}")
+        return connection
+    except Exception as e:
+        logger.error(f"Failed to connect to HBase: {e}")
+        sys.exit(1)
+
+def create_target_tables(connection):
+    """Create the passage store and passage index tables if they do not exist."""
+    try:
+        tables = [t.decode('utf-8') for t in connection.tables()]
+        for name in (PASSAGE_TABLE, PASSAGE_INDEX_TABLE):
+            if name not in tables:
+                logger.info(f"Creating table {name}...")
+                connection.create_table(name, PASSAGE_FAMILIES)
+                logger.info(f"Table {name} created.")
+            else:
+                logger.info(f"Table {name} already exists.")
+    except Exception as e:
+        logger.error(f"Error creating tables: {e}")
+        sys.exit(1)
+
+def load_old_passages(passage_table, doc_id):
+    """Return {passage_id: [terms]} for a document's previously indexed passages."""
+    old = {}
+    for pid_bytes, data in passage_table.scan(row_prefix=f'{doc_id}#'.encode('utf-8'), columns=[b'p:terms']):
+        try:
+            old[pid_bytes.decode('utf-8')] = json.loads(data.get(b'p:terms', b'[]'))
+        except json.JSONDecodeError:
+            old[pid_bytes.decode('utf-8')] = []
+    return old
+
+def remove_stale(index_batch, passage_batch, old, new):
+    """
+    Delete postings and passage rows that the new split no longer produces.
+    Only stale cells are deleted, so deletes never mask the puts for the same rows in this batch.
+    """
+    for pid, terms in old.items():
+        current = new.get(pid, ())
+        for term in terms:
+            if term not in current:
+                index_batch.delete(term.encode('utf-8'), columns=[posting_column(pid)])
+        if pid not in new:
+            passage_batch.delete(pid.encode('utf-8'))
+
+def build_index(connection, since=None):
+    """Scan source table, split content:text into passages and index their terms."""
+    source_table = connection.table(SOURCE_TABLE)
+    passage_table = connection.table(PASSAGE_TABLE)
+    index_table = connection.table(PASSAGE_INDEX_TABLE)
+
+    logger.info(f"Scanning {SOURCE_TABLE}{f' for rows changed since {since}' if since else ''}...")
+
+    passage_batch = passage_table.batch(batch_size=BATCH_SIZE)
+    index_batch = index_table.batch(batch_size=BATCH_SIZE)
+    passages_written = 0
+    postings_written = 0
+    processed_docs = 0
+
+    try:
+        columns = [b'content:text', b'info:title', b'info:url', b'info:parent_url', b'info:type', b'info:canonical']
+        if since:
+            columns.append(b'info:changed_at')
+            scanner = source_table.scan(columns=columns, filter=changed_since_filter(since))
+        else:
+            scanner = source_table.scan(columns=columns)
+
+        for row_key, data in scanner:
+            doc_id = row_key.decode('utf-8') if isinstance(row_key, bytes) else row_key
+
+            # Passages written by an earlier run; the tables are never truncated, so full rebuilds must clean up too
+            old = load_old_passages(passage_table, doc_id)
+
+            # Near-duplicate rows point at their canonical page and are never used as context
+            if data.get(b'info:canonical'):
+                if old:
+                    remove_stale(index_batch, passage_batch, old, {})
+                continue
+
+            text = (data.get(b'content:text') or b'').decode('utf-8', 'ignore')
+            title = data.get(b'info:title') or b''
+            url = data.get(b'info:url') or data.get(b'info:parent_url') or b''
+            doc_type = data.get(b'info:type') or b'web'
+
+            new = {}
+
+            # Passage store:
+            # RowKey: {DocID}#{n}
+            # Index entries:
+            # RowKey: Term
+            # Column: p:{PassageID}
+            # Value: JSON {'f': term frequency, 'l': passage length in terms}
+            for n, passage in enumerate(split_passages(text)):
+                pid = passage_id(doc_id, n)
+                counts, length = passage_terms(passage)
+                if not counts:
+                    continue
+                new[pid] = counts
+                passage_batch.put(pid.encode('utf-8'), {
+                    b'p:text': passage.encode('utf-8'),
+                    b'p:doc': doc_id.encode('utf-8'),
+                    b'p:title': title,
+                    b'p:url': url,
+                    b'p:type': doc_type,
+                    b'p:terms': json.dumps(list(counts), ensure_ascii=False).encode('utf-8'),
+                })
+                passages_written += 1
+                column = posting_column(pid)
+                for term, tf in counts.items():
+                    index_batch.put(term.encode('utf-8'), {column: posting_value(tf, length)})
+                    postings_written += 1
+
+            if old:
+                remove_stale(index_batch, passage_batch, old, new)
+
+            processed_docs += 1
+            if processed_docs % 100 == 0:
+                logger.info(f"Processed {processed_docs} documents ({passages_written} passages)...")
+
+        # Send any remaining mutations
+        passage_batch.send()
+        index_batch.send()
+        logger.info(f"Passage index build complete. Processed {processed_docs} documents. "
+                    f"Passages: {passages_written}, postings: {postings_written}")
+
+    except Exception as e:
+        logger.error(f"Error building passage index: {e}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Split page text into passages and build the passage index')
+    parser.add_argument('--since', type=changed_at_timestamp,
+                        help="only process rows whose info:changed_at >= SINCE ('YYYY-MM-DD[ HH:MM:SS]'); "
+                             "their previous passages are replaced")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    connection = connect_hbase()
+    try:
+        create_target_tables(connection)
+        build_index(connection, since=args.since)
+    finally:
+        connection.close()
+
+if __name__ == "__main__":
+    main()
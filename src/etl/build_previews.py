@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+ETL 脚本：为已下载的附件预先生成轻量预览
+
+位置: src/etl/build_previews.py
+
+功能概要:
+- 遍历附件索引 (FILES_STORE/index.sqlite3) 中登记的全部对象
+- 生成首页文本预览 previews/ab/cd/<sha256>.txt：
+  PDF 用 PyMuPDF 只读取前几页，其它格式用 Tika 提取后截取开头部分
+- 安装了 PyMuPDF 时额外渲染 PDF 首页缩略图 previews/ab/cd/<sha256>.png
+- 对象按内容寻址，内容不变预览就不变：已有预览的对象跳过 (--force 重新生成)
+
+Web 端 /preview 优先返回这里生成的预览页 (几 KB 文本 + 一张缩略图)，
+用户确认后才加载完整文件，避免每次点击预览都把几十 MB 的 PDF 整个传出去。
+
+用法:
+    python build_previews.py [--force] [--limit N]
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+from typing import Optional
+
+# 复用爬虫包中的内容寻址附件存储
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ustc_spider'))
+from ustc_spider.filestore import AttachmentIndex, INDEX_FILENAME
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:  # 可选依赖：没有时 PDF 也用 Tika 提取文本，不生成缩略图
+    fitz = None
+
+
+# ---------- 配置 ----------
+# 与 Web 服务 (rag/app.py) 使用同一个下载目录
+FILES_STORE = os.environ.get(
+    'FILES_STORE', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ustc_spider', 'downloads'))
+
+PREVIEW_CHARS = 3000       # 文本预览最大字符数
+PREVIEW_PDF_PAGES = 2      # PDF 文本预览最多读取的页数
+THUMBNAIL_WIDTH = 600      # 缩略图宽度 (像素)
+# 能提取文本的附件类型
+TEXT_EXTS = {'.pdf', '.doc', '.docx', '.xls', '.xlsx', '.csv', '.ppt', '.pptx', '.txt', '.rtf', '.odt', '.wps'}
+
+
+# ---------- 日志 ----------
+logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+logger = logging.getLogger('previews')
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """先写临时文件再 os.replace，Web 端不会读到半个预览。"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def trim_text(text: str) -> str:
+    """压缩空行并截取开头 PREVIEW_CHARS 个字符 (保留换行，预览页按原排版显示)。"""
+    lines = [line.strip() for line in (text or '').replace('\x00', ' ').splitlines()]
+    text = '\n'.join(line for line in lines if line)
+    return text[:PREVIEW_CHARS]
+
+
+def pdf_preview(abs_path: str) -> tuple:
+    """用 PyMuPDF 读取前几页文本并渲染首页缩略图，返回 (文本, PNG 字节或 None)。"""
+    with fitz.open(abs_path) as doc:
+        if doc.page_count == 0:
+            return '', None
+        text = '\n'.join(doc[i].get_text() for i in range(min(PREVIEW_PDF_PAGES, doc.page_count)))
+        page = doc[0]
+        zoom = THUMBNAIL_WIDTH / max(page.rect.width, 1)
+        png = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom)).tobytes('png')
+        return text, png
+
+
+def tika_text(abs_path: str) -> str:
+    from tika import parser
+    parsed = parser.from_file(abs_path)
+    return parsed.get('content') or ''
+
+
+def build_preview(index: AttachmentIndex, sha256: str, ext: str) -> Optional[bool]:
+    """为单个对象生成预览；不支持的类型返回 None，成功返回 True。"""
+    if ext not in TEXT_EXTS:
+        return None
+    abs_path = index.object_abspath(sha256, ext)
+    if not os.path.exists(abs_path):
+        logger.warning(f"Object file missing: {abs_path}")
+        return None
+
+    png = None
+    if ext == '.pdf' and fitz is not None:
+        text, png = pdf_preview(abs_path)
+    else:
+        text = tika_text(abs_path)
+
+    text = trim_text(text)
+    if not text and png is None:
+        logger.warning(f"No preview content extracted for {abs_path}")
+        return None
+    if png is not None:
+        write_atomic(index.preview_abspath(sha256, '.png'), png)
+    # 文本预览最后写入，它的存在表示该对象的预览已完成
+    write_atomic(index.preview_abspath(sha256, '.txt'), text.encode('utf-8'))
+    return True
+
+
+def build_previews(index: AttachmentIndex, force: bool = False, limit: Optional[int] = None) -> None:
+    started = time.time()
+    built = skipped = unsupported = failed = 0
+    for sha256, ext, size in index.iter_objects():
+        if limit is not None and built >= limit:
+            break
+        if not force and os.path.exists(index.preview_abspath(sha256, '.txt')):
+            skipped += 1
+            continue
+        try:
+            if build_preview(index, sha256, ext or ''):
+                built += 1
+                if built % 50 == 0:
+                    logger.info(f"Built {built} previews...")
+            else:
+                unsupported += 1
+        except Exception:
+            logger.exception(f"Failed to build preview for {sha256}{ext}")
+            failed += 1
+    logger.info(f"Previews complete in {time.time() - started:.1f}s: built={built}, already present={skipped}, "
+                f"unsupported/empty={unsupported}, failed={failed}")
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description='Precompute lightweight attachment previews (first-page text, thumbnail)')
+    ap.add_argument('--force', action='store_true', help='rebuild previews that already exist')
+    ap.add_argument('--limit', type=int, help='stop after building N previews')
+    return ap.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    if not os.path.exists(os.path.join(FILES_STORE, INDEX_FILENAME)):
+        logger.error(f"Attachment index not found under {FILES_STORE}; run the crawler first")
+        return
+    if fitz is None:
+        logger.info("PyMuPDF not installed: PDF text is extracted with Tika and no thumbnails are rendered")
+    index = AttachmentIndex(FILES_STORE)
+    try:
+        build_previews(index, force=args.force, limit=args.limit)
+    finally:
+        index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# src/etl/build_suggest_index.py
+
+import argparse
+import happybase
+import logging
+import sys
+import os
+import time
+
+# Prefix structure, weighting and the query log format are shared with the web service's /api/suggest
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ustc_spider'))
+from ustc_spider.indexing import INDEX_TABLE, MIN_WORD_LENGTH, STOP_WORDS
+from ustc_spider.suggest import (MIN_QUERY_COUNT, QueryLog, build_suggest_data, normalize, term_weight,
+                                 write_suggest_index)
+
+# Configuration
+HBASE_HOST = os.environ.get('HBASE_HOST', 'localhost')
+HBASE_PORT = int(os.environ.get('HBASE_PORT', '9090'))
+RAG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'rag')
+DEFAULT_OUTPUT = os.path.join(RAG_DIR, 'suggest_index.json')
+DEFAULT_QUERY_LOG = os.path.join(RAG_DIR, 'logs', 'queries.log')
+
+# Logging setup
+logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+logger = logging.getLogger('suggest_index_builder')
+
+def connect_hbase():
+    """Connect to HBase with required transport and protocol settings."""
+    try:
+        connection = happybase.Connection(
+            host=HBASE_HOST,
+            port=HBASE_PORT,
+            timeout=20000,
+            transport='framed',
+            protocol='compact'
+        )
+        connection.open()
+        logger.info(f"Connected to HBase at {HBASE_HOST}:{HBASE_PORT}")
+        return connection
+    except Exception as e:
+        logger.error(f"Failed to connect to HBase: {e}")
+        sys.exit(1)
+
+def load_document_frequencies(connection):
+    """Return {term: document frequency}, counting postings per index row (values are not transferred)."""
+    table = connection.table(INDEX_TABLE)
+    frequencies = {}
+    for row_key, data in table.scan(filter=b'KeyOnlyFilter()'):
+        term = normalize(row_key.decode('utf-8', 'ignore'))
+        if len(term) < MIN_WORD_LENGTH or term in STOP_WORDS:
+            continue
+        frequencies[term] = frequencies.get(term, 0) + len(data)
+        if len(frequencies) % 100000 == 0:
+            logger.info(f"Read {len(frequencies)} index terms...")
+    return frequencies
+
+def build_weights(frequencies, query_counts, min_query_count=MIN_QUERY_COUNT):
+    """Merge index terms and popular logged queries into {term: weight}."""
+    weights = {}
+    for term, df in frequencies.items():
+        weights[term] = term_weight(df=df, query_count=query_counts.get(term, 0))
+    popular = 0
+    for query, count in query_counts.items():
+        # One-off queries are never suggested to other users
+        if count < min_query_count or query in weights:
+            continue
+        weights[query] = term_weight(df=frequencies.get(query, 0), query_count=count)
+        popular += 1
+    logger.info(f"{len(frequencies)} index terms, {popular} additional popular queries")
+    return weights
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Build the in-memory autocomplete dictionary for /api/suggest')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='suggest index file (default: src/rag/suggest_index.json)')
+    parser.add_argument('--query-log', default=os.environ.get('RAG_QUERY_LOG', DEFAULT_QUERY_LOG),
+                        help='web service query log used to boost popular terms')
+    parser.add_argument('--query-log-since', help="only count queries logged at or after 'YYYY-MM-DD HH:MM:SS'")
+    parser.add_argument('--min-query-count', type=int, default=MIN_QUERY_COUNT,
+                        help='times a full query must be logged before it is suggested itself')
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    started = time.time()
+    connection = connect_hbase()
+    try:
+        frequencies = load_document_frequencies(connection)
+    finally:
+        connection.close()
+    query_counts = QueryLog.read_counts(args.query_log, since=args.query_log_since)
+    logger.info(f"Read {sum(query_counts.values())} logged queries ({len(query_counts)} distinct) from {args.query_log}")
+
+    data = build_suggest_data(build_weights(frequencies, query_counts, args.min_query_count))
+    write_suggest_index(args.output, data)
+    logger.info(f"Suggest index complete: {len(data['terms'])} terms, {len(data['top'])} precomputed prefixes, "
+                f"{time.time() - started:.1f}s -> {args.output}")
+
+if __name__ == "__main__":
+    main()
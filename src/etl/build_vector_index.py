@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# src/etl/build_vector_index.py
+
+import argparse
+import happybase
+import logging
+import sys
+import os
+import time
+
+# Embedders and the on-disk vector index format are shared with the search engine
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ustc_spider'))
+from ustc_spider.passages import PASSAGE_TABLE
+from ustc_spider.vectors import VectorIndexWriter, get_embedder
+
+# Configuration
+HBASE_HOST = os.environ.get('HBASE_HOST', 'localhost')
+HBASE_PORT = int(os.environ.get('HBASE_PORT', '9090'))
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'rag', 'vector_index')
+EMBED_BATCH_SIZE = 64
+
+# Logging setup
+logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+logger = logging.getLogger('vector_index_builder')
+
+def connect_hbase():
+    """Connect to HBase with required transport and protocol settings."""
+    try:
+        connection = happybase.Connection(
+            host=HBASE_HOST,
+            port=HBASE_PORT,
+            timeout=20000,
+            transport='framed',
+            protocol='compact'
+        )
+        connection.open()
+        logger.info(f"Connected to HBase at {HBASE_HOST}:{HBASE_PORT}")
+        return connection
+    except Exception as e:
+        logger.error(f"Failed to connect to HBase: {e}")
+        sys.exit(1)
+
+def iter_passages(connection):
+    """Yield (passage_id, text) from the passage table; the title is prepended so it is embedded too."""
+    table = connection.table(PASSAGE_TABLE)
+    for row_key, data in table.scan(columns=[b'p:text', b'p:title']):
+        text = (data.get(b'p:text') or b'').decode('utf-8', 'ignore')
+        if not text:
+            continue
+        title = (data.get(b'p:title') or b'').decode('utf-8', 'ignore')
+        yield row_key.decode('utf-8'), f"{title}\n{text}" if title else text
+
+def build_index(connection, output, embedder_spec, nlist):
+    """Embed every passage and write a fresh vector index to OUTPUT (replaced atomically)."""
+    embedder = get_embedder(embedder_spec)
+    writer = None
+    batch_ids, batch_texts = [], []
+    started = time.time()
+
+    def flush():
+        nonlocal writer
+        vectors = embedder.embed(batch_texts)
+        if writer is None:
+            writer = VectorIndexWriter(output, vectors.shape[1], embedder.name)
+        writer.add(batch_ids, vectors)
+        batch_ids.clear()
+        batch_texts.clear()
+        if len(writer) % (EMBED_BATCH_SIZE * 50) == 0:
+            logger.info(f"Embedded {len(writer)} passages...")
+
+    for pid, text in iter_passages(connection):
+        batch_ids.append(pid)
+        batch_texts.append(text)
+        if len(batch_ids) >= EMBED_BATCH_SIZE:
+            flush()
+    if batch_ids:
+        flush()
+
+    if writer is None:
+        logger.warning(f"No passages found in {PASSAGE_TABLE}; run build_passage_index.py first")
+        return
+    if nlist == -1:
+        # auto: a brute-force scan is memory-bandwidth bound (~10 ms per 100k x 256 on one core),
+        # so partition into ~sqrt(N) lists from 50k vectors up
+        nlist = int(len(writer) ** 0.5) if len(writer) >= 50000 else 0
+    meta = writer.finalize(nlist=nlist)
+    logger.info(f"Vector index complete: {meta['count']} vectors, dim {meta['dim']}, nlist {meta['nlist']}, "
+                f"embedder {meta['embedder']}, {time.time() - started:.1f}s -> {output}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Embed passages and build the dense vector index')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='index directory (default: src/rag/vector_index)')
+    parser.add_argument('--embedder', default=os.environ.get('RAG_EMBEDDER', 'hashing'),
+                        help="'hashing[:dim]' (deterministic, no model) or 'ollama:<model>' (e.g. ollama:bge-m3)")
+    parser.add_argument('--ivf-lists', type=int, default=-1,
+                        help='IVF partitions (0 = brute force, -1 = auto: sqrt(N) from 50k vectors)')
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    connection = connect_hbase()
+    try:
+        build_index(connection, args.output, args.embedder, args.ivf_lists)
+    finally:
+        connection.close()
+
+if __name__ == "__main__":
+    main()
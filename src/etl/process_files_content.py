@@ -8,8 +8,14 @@ ETL 脚本：处理本地下载的附件，提取文本并写入 HBase（每个
 - 扫描 HBase 表 `ustc_web_data` 中有 `files:path` 的父网页记录
 - 遍历文件，使用 Tika 提取全文（parser.from_file）
 - 根据优先级生成智能标题
-- 使用 jieba TF-IDF 提取关键词（含权重）
+- 使用共享关键词提取组件（ustc_spider/keywords.py，进程池批量 TF-IDF）提取关键词（含权重）
 - 将每个文件以 RowKey=MD5(file_bytes) 写入 HBase
+- 定期将扫描进度写入检查点文件，`--resume` 可从中断处继续；
+  配合 `--row-start/--row-stop` 可把一次全量回填拆分到多台机器
+
+用法:
+    python process_files_content.py [--row-start KEY] [--row-stop KEY] [--checkpoint PATH] [--resume]
+                                    [--since 'YYYY-MM-DD[ HH:MM:SS]']
 
 注意：脚本使用 framed/compact 连接 HBase（happybase），请确保 HBase thrift 服务已按要求启动。
 """
@@ -17,14 +23,21 @@ ETL 脚本：处理本地下载的附件，提取文本并写入 HBase（每个
 import os
 import sys
 import json
+import time
 import logging
 import hashlib
+import argparse
+import signal
 import re
 from typing import Optional
 
 import happybase
 from tika import parser
-import jieba.analyse
+
+# 复用爬虫包中的共享关键词提取组件
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ustc_spider'))
+from ustc_spider.indexing import changed_at_timestamp, changed_since_filter
+from ustc_spider.keywords import KeywordExtractor
 
 
 # ---------- 配置 ----------
@@ -38,6 +51,12 @@ FILES_STORE = os.environ.get('FILES_STORE', '/home/plx/USTC-BigData-Search/src/u
 # 解析与写入限制
 MAX_CONTENT_STORE = 50000  # 存入 HBase 的文本最大长度
 KEYWORDS_TOPK = 20
+# 关键词提取进程数（0 表示在当前进程内提取）
+KEYWORDS_WORKERS = int(os.environ.get('KEYWORDS_WORKERS', str(max(1, (os.cpu_count() or 2) - 1))))
+
+# 检查点：每处理 N 行或每隔 T 秒（先到者为准）落盘一次
+CHECKPOINT_EVERY_ROWS = 50
+CHECKPOINT_EVERY_SECONDS = 30
 
 # Tika 服务器端点（可选）
 # 如果你希望使用已有的 Tika Server（通过 docker 或独立进程启动），
@@ -51,6 +70,112 @@ logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s %
 logger = logging.getLogger('etl')
 
 
+class ScanCheckpoint:
+    """记录扫描进度的检查点文件（JSON）。
+
+    - last_row:    最后一个已完整处理的父网页 RowKey
+    - current_row: 正在处理的父网页 RowKey（无则为 None）
+    - in_flight:   current_row 中尚未写入 HBase 的附件相对路径
+    写入时先写临时文件再 os.replace，保证进程被杀时文件不会半写。
+    """
+
+    def __init__(self, path: str, row_start: Optional[str] = None, row_stop: Optional[str] = None,
+                 every_rows: int = CHECKPOINT_EVERY_ROWS, every_seconds: float = CHECKPOINT_EVERY_SECONDS):
+        self.path = path
+        self.row_start = row_start
+        self.row_stop = row_stop
+        self.every_rows = every_rows
+        self.every_seconds = every_seconds
+
+        self.last_row = None
+        self.current_row = None
+        self.in_flight = set()
+        self.rows_done = 0
+        self.files_done = 0
+
+        self._rows_since_save = 0
+        self._last_save = time.monotonic()
+
+    def load(self) -> bool:
+        """读取已有检查点，返回是否成功。行范围必须与本次运行一致。"""
+        if not os.path.exists(self.path):
+            logger.warning(f"Checkpoint not found: {self.path}, starting from the beginning")
+            return False
+        with open(self.path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+
+        if (state.get('row_start'), state.get('row_stop')) != (self.row_start, self.row_stop):
+            raise ValueError(
+                f"Checkpoint {self.path} was written for range "
+                f"[{state.get('row_start')}, {state.get('row_stop')}), not [{self.row_start}, {self.row_stop})"
+            )
+
+        self.last_row = state.get('last_row')
+        self.current_row = state.get('current_row')
+        self.in_flight = set(state.get('in_flight') or [])
+        self.rows_done = state.get('rows_done', 0)
+        self.files_done = state.get('files_done', 0)
+        logger.info(f"Resuming from checkpoint: last_row={self.last_row} current_row={self.current_row} "
+                    f"in_flight={len(self.in_flight)} rows_done={self.rows_done} files_done={self.files_done}")
+        return True
+
+    def scan_start(self) -> Optional[str]:
+        """本次扫描的起始 RowKey（HBase scan 的 row_start 为闭区间）。"""
+        if self.current_row:
+            # 中断时该行尚未处理完，从该行重新开始，只补做 in_flight 中的文件
+            return self.current_row
+        if self.last_row:
+            # 紧随 last_row 之后的最小 RowKey
+            return self.last_row + '\x00'
+        return self.row_start
+
+    def pending_files(self, row_key: str, files_list: list) -> list:
+        """恢复运行时，对中断的那一行只返回尚未完成的文件（全部完成时为空）。"""
+        if row_key == self.current_row:
+            return [f for f in files_list if f in self.in_flight]
+        return files_list
+
+    def begin_row(self, row_key: str, files_list: list) -> None:
+        self.current_row = row_key
+        self.in_flight = set(files_list)
+
+    def file_done(self, rel_path: str) -> None:
+        self.in_flight.discard(rel_path)
+        self.files_done += 1
+        self.maybe_save()
+
+    def end_row(self, row_key: str) -> None:
+        self.last_row = row_key
+        self.current_row = None
+        self.in_flight = set()
+        self.rows_done += 1
+        self._rows_since_save += 1
+        self.maybe_save()
+
+    def maybe_save(self) -> None:
+        if (self._rows_since_save >= self.every_rows
+                or time.monotonic() - self._last_save >= self.every_seconds):
+            self.save()
+
+    def save(self) -> None:
+        state = {
+            'row_start': self.row_start,
+            'row_stop': self.row_stop,
+            'last_row': self.last_row,
+            'current_row': self.current_row,
+            'in_flight': sorted(self.in_flight),
+            'rows_done': self.rows_done,
+            'files_done': self.files_done,
+            'updated_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+        self._rows_since_save = 0
+        self._last_save = time.monotonic()
+
+
 def connect_hbase(host: str, port: int) -> Optional[happybase.Connection]:
     """建立到 HBase 的连接，使用 framed/compact（严格要求）。"""
     try:
@@ -112,35 +237,26 @@ def smart_title(metadata: dict, extracted_text: str, parent_title: str) -> str:
     return f"【附件】{parent_title or ''}".strip()
 
 
-def extract_keywords(text: str, topk: int = KEYWORDS_TOPK):
-    try:
-        tags = jieba.analyse.extract_tags(text, topK=topk, withWeight=True,
-                                          allowPOS=('n', 'nz', 'v', 'vd', 'vn', 'l', 'a', 'd'))
-        return [{'word': w, 'weight': float(wt)} for w, wt in tags]
-    except Exception:
-        logger.exception('Failed to extract keywords')
-        return []
-
-
-def process_file(abs_path: str, rel_path: str, parent_url: str, parent_title: str, table) -> None:
+def parse_file(abs_path: str, rel_path: str, parent_url: str, parent_title: str) -> Optional[dict]:
+    """用 Tika 解析单个附件，返回待写入的中间结果（不含关键词），失败返回 None。"""
     logger.info(f"Processing file: {abs_path}")
     try:
         if not os.path.exists(abs_path):
             logger.warning(f"File not found: {abs_path}")
-            return
+            return None
 
         # compute row key by MD5 of file bytes
         row_key_md5 = compute_md5_of_file(abs_path)
         if not row_key_md5:
             logger.warning(f"Skipping file due to MD5 failure: {abs_path}")
-            return
+            return None
 
         # parse with Tika
         parsed = parser.from_file(abs_path)
         raw_content = parsed.get('content') or ''
         if not raw_content or not raw_content.strip():
             logger.warning(f"Empty content extracted for {abs_path}, skipping")
-            return
+            return None
 
         # clean
         cleaned = clean_text(raw_content)
@@ -149,37 +265,100 @@ def process_file(abs_path: str, rel_path: str, parent_url: str, parent_title: st
         # metadata
         metadata = parsed.get('metadata') or {}
 
-        # smart title
-        title = smart_title(metadata, cleaned, parent_title)
+        return {
+            'row_key': row_key_md5,
+            'rel_path': rel_path,
+            'parent_url': parent_url,
+            'title': smart_title(metadata, cleaned, parent_title),
+            'text': cleaned,
+        }
+
+    except Exception:
+        logger.exception(f"Error processing file {abs_path}")
+        return None
 
-        # keywords
-        keywords = extract_keywords(cleaned)
 
+def write_file_row(parsed: dict, keywords: list, table) -> bool:
+    """写入一个附件行，返回是否成功（失败时记录日志，由调用方决定是否重试）。"""
+    try:
         # assemble data for HBase
         data = {
             b'info:type': b'file',
-            b'info:title': title.encode('utf-8', 'ignore'),
-            b'info:parent_url': (parent_url or '').encode('utf-8', 'ignore'),
-            b'content:text': cleaned[:MAX_CONTENT_STORE].encode('utf-8', 'ignore'),
+            b'info:title': parsed['title'].encode('utf-8', 'ignore'),
+            b'info:parent_url': (parsed['parent_url'] or '').encode('utf-8', 'ignore'),
+            b'content:text': parsed['text'][:MAX_CONTENT_STORE].encode('utf-8', 'ignore'),
             b'info:keywords': json.dumps(keywords, ensure_ascii=False).encode('utf-8'),
             # Store the relative path so we can download it later
-            b'files:path': json.dumps([rel_path], ensure_ascii=False).encode('utf-8')
+            b'files:path': json.dumps([parsed['rel_path']], ensure_ascii=False).encode('utf-8')
         }
 
         # write row
-        table.put(row_key_md5, data)
-        logger.info(f"Wrote file row {row_key_md5} to HBase (title: {title})")
+        table.put(parsed['row_key'], data)
+        logger.info(f"Wrote file row {parsed['row_key']} to HBase (title: {parsed['title']})")
+        return True
 
     except Exception:
-        logger.exception(f"Error processing file {abs_path}")
+        logger.exception(f"Error writing file row for {parsed['rel_path']}")
+        return False
+
 
+def process_files(files_list, parent_url: str, parent_title: str, table, extractor: KeywordExtractor,
+                  checkpoint: Optional[ScanCheckpoint] = None) -> bool:
+    """处理同一父网页下的一批附件：逐个解析后批量提取关键词，再逐行写入。
 
-def scan_and_process(table):
-    logger.info('Starting table scan for rows with files:path...')
+    返回是否全部写入成功；写入失败的文件留在检查点的 in_flight 中，--resume 时重试。
+    """
+    parsed_files = []
+    for rel_path in files_list:
+        # construct absolute path
+        abs_path = os.path.join(FILES_STORE, rel_path)
+        parsed = parse_file(abs_path, rel_path, parent_url, parent_title)
+        if parsed:
+            parsed_files.append(parsed)
+        elif checkpoint:
+            # 解析失败的文件重跑也不会成功，视为已完成
+            checkpoint.file_done(rel_path)
+
+    if not parsed_files:
+        return True
+
+    # keywords (整批送入进程池并行提取)
+    try:
+        keywords_list = extractor.extract_batch([p['text'] for p in parsed_files])
+    except Exception:
+        logger.exception('Failed to extract keywords')
+        keywords_list = [[] for _ in parsed_files]
+
+    all_written = True
+    for parsed, keywords in zip(parsed_files, keywords_list):
+        if not write_file_row(parsed, keywords, table):
+            all_written = False
+            continue
+        if checkpoint:
+            checkpoint.file_done(parsed['rel_path'])
+    return all_written
+
+
+def scan_and_process(table, extractor: KeywordExtractor, checkpoint: ScanCheckpoint, since: Optional[str] = None):
+    row_start = checkpoint.scan_start()
+    logger.info(f"Starting table scan for rows with files:path... range=[{row_start}, {checkpoint.row_stop})")
     # We scan for files:path and get parent info
     try:
         # columns: files:path, info:url, info:title
-        for key, data in table.scan(columns=[b'files:path', b'info:url', b'info:title']):
+        columns = [b'files:path', b'info:url', b'info:title']
+        scan_filter = None
+        if since:
+            # 只处理爬虫标记为新增/变化 (info:changed_at >= since) 的父网页
+            columns.append(b'info:changed_at')
+            scan_filter = changed_since_filter(since)
+        scanner = table.scan(
+            row_start=row_start.encode('utf-8') if row_start else None,
+            row_stop=checkpoint.row_stop.encode('utf-8') if checkpoint.row_stop else None,
+            columns=columns,
+            filter=scan_filter,
+        )
+        for key, data in scanner:
+            row_key = key.decode('utf-8') if isinstance(key, bytes) else key
             try:
                 files_path_bytes = data.get(b'files:path')
                 if not files_path_bytes:
@@ -197,21 +376,50 @@ def scan_and_process(table):
                 parent_url = (data.get(b'info:url') or b'').decode('utf-8', 'ignore')
                 parent_title = (data.get(b'info:title') or b'').decode('utf-8', 'ignore')
 
-                logger.info(f"Row {key.decode('utf-8') if isinstance(key, bytes) else key}: Found {len(files_list)} files. Parent title: {parent_title}")
+                files_list = checkpoint.pending_files(row_key, files_list)
+                logger.info(f"Row {row_key}: Found {len(files_list)} files. Parent title: {parent_title}")
 
-                for rel_path in files_list:
-                    # construct absolute path
-                    abs_path = os.path.join(FILES_STORE, rel_path)
-                    process_file(abs_path, rel_path, parent_url, parent_title, table)
+                checkpoint.begin_row(row_key, files_list)
+                completed = process_files(files_list, parent_url, parent_title, table, extractor, checkpoint)
 
             except Exception:
                 logger.exception(f"Failed to process row {key}")
+                completed = False
+
+            if not completed:
+                # 该行保留为 current_row（未写入的文件留在 in_flight），停止扫描，--resume 时从这里重试
+                logger.error(f"Row {row_key} is incomplete ({len(checkpoint.in_flight)} files not written), "
+                             f"stopping the scan; rerun with --resume to retry")
+                break
+            checkpoint.end_row(row_key)
 
     except Exception:
         logger.exception('Failed to scan HBase table')
 
 
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description='Extract attachment text into HBase (resumable)')
+    ap.add_argument('--row-start', help='first parent RowKey to process (inclusive)')
+    ap.add_argument('--row-stop', help='RowKey to stop at (exclusive)')
+    ap.add_argument('--checkpoint', help='checkpoint file path (default: derived from the row range)')
+    ap.add_argument('--resume', action='store_true', help='continue from the checkpoint file')
+    ap.add_argument('--checkpoint-every', type=int, default=CHECKPOINT_EVERY_ROWS,
+                    help='save the checkpoint every N parent rows')
+    ap.add_argument('--since', type=changed_at_timestamp,
+                    help="only process parent rows whose info:changed_at >= SINCE ('YYYY-MM-DD[ HH:MM:SS]')")
+    return ap.parse_args(argv)
+
+
 def main():
+    args = parse_args()
+    checkpoint_path = args.checkpoint or f"process_files_content.{args.row_start or 'begin'}-{args.row_stop or 'end'}.ckpt.json"
+    checkpoint = ScanCheckpoint(checkpoint_path, args.row_start, args.row_stop, every_rows=args.checkpoint_every)
+    if args.resume:
+        checkpoint.load()
+
+    # kill/SIGTERM 也走 finally 落盘检查点
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+
     conn = connect_hbase(HBASE_HOST, HBASE_PORT)
     if not conn:
         logger.error('Cannot proceed without HBase connection')
@@ -224,9 +432,15 @@ def main():
         conn.close()
         return
 
+    extractor = KeywordExtractor(workers=KEYWORDS_WORKERS, topk=KEYWORDS_TOPK)
     try:
-        scan_and_process(table)
+        scan_and_process(table, extractor, checkpoint, since=args.since)
     finally:
+        # 无论正常结束、异常还是 Ctrl+C，都把最新进度落盘
+        checkpoint.save()
+        logger.info(f"Checkpoint saved to {checkpoint.path} (rows_done={checkpoint.rows_done}, "
+                    f"files_done={checkpoint.files_done})")
+        extractor.close()
         try:
             conn.close()
         except Exception:
@@ -0,0 +1,93 @@
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# 归一化时去掉的空白与句末标点 ("选课时间？" 与 "选课时间" 视为同一问题)
+_SPACE_RE = re.compile(r'\s+')
+_TRAILING_PUNCT = '?？!！.。~～'
+
+
+class AnswerCache:
+    """
+    LLM 回答缓存 (进程内 LRU + TTL)
+
+    选课、考试安排等时间点前后大量同学会问同一个问题，检索到的参考资料也相同，
+    没必要每次都让 Ollama 重新生成。缓存键 = 归一化问题 + 上下文文档的 (doc_id, 版本)：
+    - 网页的版本是爬虫写入的 info:fingerprint (正文指纹)，附件的 RowKey 本身就是文件内容的 MD5，
+      参考资料内容一旦变化，键随之改变，不会返回过期的回答
+    - 缓存的是回答的 token 分块列表，命中时按原样逐块回放，前端收到的 SSE 流与实时生成一致
+    - 按总字节数 (max_bytes) LRU 淘汰，超过 ttl 秒的条目视为过期
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=3600):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, size, chunks)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(question):
+        text = unicodedata.normalize('NFKC', question or '').lower()
+        return _SPACE_RE.sub('', text).rstrip(_TRAILING_PUNCT)
+
+    def make_key(self, question, documents):
+        """documents: [(doc_id, version), ...]，顺序有意义 (决定了资料编号)。"""
+        h = hashlib.sha1(self.normalize(question).encode('utf-8'))
+        for doc_id, version in documents:
+            h.update(b'\x00')
+            h.update(f'{doc_id}@{version or ""}'.encode('utf-8'))
+        return h.hexdigest()
+
+    def get(self, key):
+        """返回缓存的 token 分块列表；未命中或已过期返回 None。"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, size, chunks = entry
+            if expires_at < time.time():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return chunks
+
+    def put(self, key, chunks):
+        chunks = list(chunks)
+        size = sum(len(c.encode('utf-8')) for c in chunks) + 64 * len(chunks) + 256
+        if not chunks or size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + self.ttl, size, chunks)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def record(self, key, stream):
+        """
+        包装 LLM 的流式生成器：原样逐块产出，完整生成结束后写入缓存。
+        客户端中途断开 (生成器被关闭) 或生成出错时不缓存不完整的回答。
+        """
+        chunks = []
+        for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+        self.put(key, chunks)
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -1,8 +1,20 @@
-from flask import Flask, render_template, request, jsonify, Response, stream_with_context, send_from_directory
+from flask import (Flask, render_template, request, jsonify, Response, stream_with_context, send_from_directory,
+                   send_file, redirect, url_for, abort, g)
 from rag_service import RAGService
+from query_metrics import REGISTRY, CONTENT_TYPE, REQUEST_SECONDS, QueryTimings
 import json
 import logging
 import os
+import sys
+import threading
+import time
+from urllib.parse import quote
+
+# 复用爬虫包中的附件索引 (内容寻址存储)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ustc_spider'))
+from ustc_spider.filestore import AttachmentIndex, INDEX_FILENAME, file_ext
+from ustc_spider.filters import SearchFilters
+from ustc_spider.suggest import QueryLog, SuggestIndex
 
 app = Flask(__name__)
 
@@ -10,9 +22,126 @@ app = Flask(__name__)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DOWNLOAD_FOLDER = os.path.join(BASE_DIR, '../ustc_spider/downloads')
 
-# 初始化 RAG 服务
+# 初始化 RAG 服务 (各请求线程共享；检索时从 HBase 连接池借用独立连接)
 rag_service = RAGService()
 
+# 同时进行中的 /api/search 上限 (含 LLM 流式输出的整个过程)，超出后最多等待 SEARCH_QUEUE_TIMEOUT 秒，
+# 仍无空位则返回 503，避免请求堆积把 Ollama 与 HBase 一起拖慢
+MAX_CONCURRENT_SEARCHES = int(os.environ.get('RAG_MAX_CONCURRENT_SEARCHES', '16'))
+SEARCH_QUEUE_TIMEOUT = float(os.environ.get('RAG_SEARCH_QUEUE_TIMEOUT', '5'))
+_search_slots = threading.BoundedSemaphore(MAX_CONCURRENT_SEARCHES)
+
+# 运行状态指标 (/metrics 抓取时更新)
+ACTIVE_SEARCHES = REGISTRY.gauge('rag_active_searches', '进行中的 /api/search (含流式输出)')
+LLM_QUEUE = REGISTRY.gauge('rag_llm_scheduler', 'LLM 调度器状态', ['state'])
+ANSWER_CACHE = REGISTRY.gauge('rag_answer_cache', 'AI 回答缓存', ['field'])
+
+
+def release_search_slot():
+    ACTIVE_SEARCHES.inc(-1)
+    _search_slots.release()
+
+# 查询日志 (etl/build_suggest_index.py 据此提升热门词的补全权重)
+query_log = QueryLog(os.environ.get('RAG_QUERY_LOG', os.path.join(BASE_DIR, 'logs', 'queries.log')))
+
+# 自动补全词典 (etl/build_suggest_index.py 生成)，启动时载入内存，文件被替换后自动重新加载
+SUGGEST_INDEX_PATH = os.environ.get('RAG_SUGGEST_INDEX', os.path.join(BASE_DIR, 'suggest_index.json'))
+_suggest_index = SuggestIndex.open(SUGGEST_INDEX_PATH)
+_suggest_checked_at = time.monotonic()
+
+# 附件索引 (爬虫首次下载附件后才会生成，按需打开)
+_attachment_index = None
+
+
+def get_suggest_index():
+    """返回已加载的补全词典；启动时尚未构建的，每 30 秒检查一次是否已生成。"""
+    global _suggest_index, _suggest_checked_at
+    if _suggest_index is not None:
+        _suggest_index.reload_if_changed()
+    elif time.monotonic() - _suggest_checked_at > 30:
+        _suggest_checked_at = time.monotonic()
+        _suggest_index = SuggestIndex.open(SUGGEST_INDEX_PATH)
+    return _suggest_index
+
+
+def get_attachment_index():
+    global _attachment_index
+    if _attachment_index is None and os.path.exists(os.path.join(DOWNLOAD_FOLDER, INDEX_FILENAME)):
+        _attachment_index = AttachmentIndex(DOWNLOAD_FOLDER)
+    return _attachment_index
+
+
+# 对象按内容寻址 (SHA-256)，同一 URL 永远对应同一内容：强 ETag 直接用哈希，浏览器与代理可长期缓存
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# 未登记的旧数据按路径读取，内容可能被覆盖，只短期缓存 (ETag 由 mtime/大小生成，仍可条件请求)
+LEGACY_MAX_AGE = 3600
+# 没有预计算预览时交给 Office Online 预览的格式 (需要公网访问)
+OFFICE_EXTS = {'.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx'}
+
+
+def resolve_object(filename):
+    """友好路径 -> (sha256, 对象绝对路径)；未登记或对象文件缺失时返回 None。"""
+    index = get_attachment_index()
+    row = index.lookup_path(filename) if index else None
+    if not row:
+        return None
+    object_path = index.object_abspath(*row)
+    return (row[0], object_path) if os.path.exists(object_path) else None
+
+
+def send_immutable(path, etag, as_attachment=False, download_name=None):
+    """
+    发送内容不可变的文件：conditional=True 时 Werkzeug 处理 Range (206 分段)、If-Range 与 If-None-Match (304)，
+    PDF 阅读器可以按需分段读取，不必先下载整个文件。
+    """
+    response = send_file(path, as_attachment=as_attachment, download_name=download_name,
+                         conditional=True, etag=etag, max_age=IMMUTABLE_MAX_AGE)
+    response.cache_control.immutable = True
+    return response
+
+
+def send_attachment(filename, as_attachment=False):
+    """
+    按友好路径 (HBase files:path 中的 project/文件名) 发送附件：
+    经索引解析到 objects/ 下的内容寻址文件；未登记的旧数据直接按路径读取。
+    """
+    resolved = resolve_object(filename)
+    if resolved is None:
+        return send_from_directory(DOWNLOAD_FOLDER, filename, as_attachment=as_attachment, max_age=LEGACY_MAX_AGE)
+    sha256, object_path = resolved
+    # 以友好文件名作为下载名，并据此推断 MIME 类型
+    return send_immutable(object_path, sha256, as_attachment=as_attachment, download_name=os.path.basename(filename))
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+    g.timings = QueryTimings()
+
+
+@app.after_request
+def record_timing(response):
+    """
+    记录请求耗时并添加 Server-Timing 头 (检索各阶段 + 总耗时)。
+    流式响应在发出响应头时就会经过这里，因此只包含排序完成前的阶段；之后的摘要、LLM 阶段见 /metrics。
+    """
+    elapsed = time.perf_counter() - g.request_start
+    REQUEST_SECONDS.observe(elapsed, endpoint=request.endpoint or 'unknown', status=response.status_code)
+    stages = g.timings.server_timing()
+    total = f'total;dur={elapsed * 1000:.1f}'
+    response.headers['Server-Timing'] = f'{stages}, {total}' if stages else total
+    return response
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus 指标 (查询各阶段耗时直方图、LLM 排队/首 token/生成耗时、缓存与调度器状态)"""
+    for state, value in rag_service.llm_scheduler.stats().items():
+        LLM_QUEUE.set(value, state=state)
+    cache = rag_service.answer_cache
+    for field, value in (('entries', len(cache)), ('hits', cache.hits), ('misses', cache.misses)):
+        ANSWER_CACHE.set(value, field=field)
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -20,33 +149,105 @@ def index():
 @app.route('/file/<path:filename>')
 def serve_file(filename):
     """提供文件预览 (浏览器默认行为，如PDF会打开)"""
-    return send_from_directory(DOWNLOAD_FOLDER, filename)
+    return send_attachment(filename)
 
 @app.route('/download/<path:filename>')
 def download_file(filename):
     """强制下载文件"""
-    return send_from_directory(DOWNLOAD_FOLDER, filename, as_attachment=True)
+    return send_attachment(filename, as_attachment=True)
 
 @app.route('/preview')
 def preview_file():
-    """预览文件接口"""
+    """
+    预览文件接口：有预计算预览 (etl/build_previews.py) 时返回轻量预览页 (首页文本 + 缩略图)，
+    用户点击后才加载完整文件；否则 Office 文档交给 Office Online，其它直接发送原文件。
+    """
     file_path = request.args.get('path')
     if not file_path:
         return "File path is required", 400
-    return send_from_directory(DOWNLOAD_FOLDER, file_path)
+
+    resolved = resolve_object(file_path)
+    if resolved is not None:
+        sha256 = resolved[0]
+        index = get_attachment_index()
+        text_path = index.preview_abspath(sha256, '.txt')
+        if os.path.exists(text_path):
+            with open(text_path, encoding='utf-8') as f:
+                text = f.read()
+            has_thumbnail = os.path.exists(index.preview_abspath(sha256, '.png'))
+            response = app.make_response(render_template(
+                'preview.html', name=os.path.basename(file_path), text=text, size=os.path.getsize(resolved[1]),
+                thumbnail_url=url_for('preview_thumbnail', sha256=sha256) if has_thumbnail else None,
+                file_url=url_for('serve_file', filename=file_path),
+                download_url=url_for('download_file', filename=file_path)))
+            # 预览内容随对象哈希固定，ETag 同样使用哈希
+            response.set_etag(f'preview-{sha256}')
+            response.cache_control.public = True
+            response.cache_control.max_age = LEGACY_MAX_AGE
+            return response.make_conditional(request)
+
+    if file_ext(file_path) in OFFICE_EXTS:
+        file_url = request.url_root + 'file/' + quote(file_path)
+        return redirect(f'https://view.officeapps.live.com/op/embed.aspx?src={quote(file_url, safe="")}')
+    return send_attachment(file_path)
+
+@app.route('/preview/thumbnail/<sha256>.png')
+def preview_thumbnail(sha256):
+    """预计算的首页缩略图"""
+    index = get_attachment_index()
+    if index is None or not sha256.isalnum():
+        abort(404)
+    path = index.preview_abspath(sha256, '.png')
+    if not os.path.exists(path):
+        abort(404)
+    return send_immutable(path, f'thumb-{sha256}')
+
+@app.route('/api/suggest', methods=['GET'])
+def suggest():
+    """
+    搜索框自动补全：前缀 -> 推荐词 (内存中的有序词典二分查找，不访问 HBase)
+    返回 {"q": 前缀, "suggestions": [词, ...]}；词典尚未构建时返回空列表。
+    """
+    prefix = request.args.get('q', '')[:40]
+    limit = min(max(request.args.get('k', 8, type=int), 1), 20)
+    index = get_suggest_index()
+    with g.timings.stage('suggest'):
+        suggestions = [term for term, _ in index.suggest(prefix, limit)] if index else []
+    response = jsonify({'q': prefix, 'suggestions': suggestions})
+    # 同一前缀短时间内结果不变，允许浏览器缓存，回删时不再请求
+    response.cache_control.public = True
+    response.cache_control.max_age = 300
+    return response
 
 @app.route('/api/search', methods=['GET'])
 def search():
     """
     搜索接口，使用 Server-Sent Events (SSE) 实现流式响应
+    过滤参数 (可选)：project (可重复，多个之间为“或”)、type (web / file)、from / to (YYYY、YYYY-MM 或 YYYY-MM-DD，按月过滤)
     """
     query = request.args.get('q', '')
     if not query:
         return jsonify({'error': 'Query is required'}), 400
+    filters = SearchFilters(
+        projects=request.args.getlist('project'),
+        doc_type=request.args.get('type'),
+        date_from=request.args.get('from'),
+        date_to=request.args.get('to'),
+    )
+
+    with g.timings.stage('slot_wait'):
+        acquired = _search_slots.acquire(timeout=SEARCH_QUEUE_TIMEOUT)
+    if not acquired:
+        response = jsonify({'error': 'Server is busy, please retry later'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    ACTIVE_SEARCHES.inc()
 
     try:
-        # 获取流式生成器和搜索结果
-        stream_gen, results = rag_service.get_answer_stream(query)
+        # 只排序、不读取正文，结果列表尽快发出；摘要与 AI 回答随后分阶段推送
+        facets = {}
+        results = rag_service.rank(query, timings=g.timings, filters=filters, facets=facets)
+        query_log.append(query, len(results))
         
         # 准备搜索结果数据
         simple_results = []
@@ -60,33 +261,47 @@ def search():
                 'type': res.get('type', 'web'),
                 'parent_url': res.get('parent_url', ''),
                 'file_paths': res.get('file_paths', []),
-                'date': res.get('date')
+                'date': res.get('date'),
+                'project': res.get('project', '')
             })
+        stages = rag_service.stream_answer(query, results)
 
         def generate():
             try:
                 # 1. 首先发送搜索结果元数据
                 # event: results
                 yield f"event: results\ndata: {json.dumps(simple_results, ensure_ascii=False)}\n\n"
+                # event: facets  data: {"filters": 当前条件, "project" / "type" / "year": [[值, 数量], ...]}
+                yield f"event: facets\ndata: {json.dumps({'filters': filters.to_dict(), **facets}, ensure_ascii=False)}\n\n"
                 
-                # 2. 发送 AI 回答的流式 Token
-                # event: token
-                for chunk in stream_gen:
-                    if chunk:
-                        # 使用 json.dumps 确保特殊字符被正确转义
-                        yield f"event: token\ndata: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                # 2. 摘要 (先第一页，其余分批) 与 AI 回答的流式 Token 交替发送
+                # event: snippets  data: {doc_id: snippet}
+                # event: token     data: 文本
+                for event, data in stages:
+                    if event == 'snippets' and not data:
+                        continue
+                    # 使用 json.dumps 确保特殊字符被正确转义
+                    yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
                 
                 # 3. 结束信号
                 yield "event: done\ndata: [DONE]\n\n"
             except Exception as e:
                 logging.error(f"Stream generation error: {e}")
                 yield f"event: error\ndata: {json.dumps(str(e), ensure_ascii=False)}\n\n"
+            finally:
+                # 客户端断开时停止后台生成
+                stages.close()
 
-        return Response(stream_with_context(generate()), mimetype='text/event-stream')
+        response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+        # 流结束或客户端断开 (WSGI close) 时释放名额
+        response.call_on_close(release_search_slot)
+        return response
 
     except Exception as e:
+        release_search_slot()
         logging.error(f"Search error: {repr(e)}")
         return jsonify({'error': str(e) if isinstance(e, str) else repr(e)}), 500
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # 开发模式；生产环境使用 python serve.py (多线程 WSGI 服务器)
+    app.run(debug=True, host='0.0.0.0', port=5000, threaded=True)
@@ -19,14 +19,15 @@ def search_specific_content(keyword):
     words = list(jieba.cut_for_search(keyword))
     print(f"分词结果: {words}")
     
-    if engine.index_table:
-        for w in words:
-            row = engine.index_table.row(w.encode('utf-8'))
-            if row:
-                print(f"✅ 词条 '{w}' 存在于索引中，关联文档数: {len(row)}")
-            else:
-                print(f"❌ 词条 '{w}' 未在索引中找到")
-    else:
+    try:
+        with engine.tables() as (_, index_table):
+            for w in words:
+                row = index_table.row(w.encode('utf-8'))
+                if row:
+                    print(f"✅ 词条 '{w}' 存在于索引中，关联文档数: {len(row)}")
+                else:
+                    print(f"❌ 词条 '{w}' 未在索引中找到")
+    except Exception:
         print("错误: 无法连接到索引表")
 
     # 2. 使用搜索引擎进行完整搜索
@@ -48,9 +49,9 @@ def search_specific_content(keyword):
     #3. (可选) 暴力扫描数据表标题 (仅当索引没找到时有用，用于调试)
     print(f"\n--- 3. 扫描数据表标题 (ustc_web_data) ---")
     count = 0
-    if engine.data_table:
+    with engine.tables() as (data_table, _):
         # 只扫描 info:title 列
-        scanner = engine.data_table.scan(columns=[b'info:title'])
+        scanner = data_table.scan(columns=[b'info:title'])
         for key, data in scanner:
             title = data.get(b'info:title', b'').decode('utf-8', errors='ignore')
             if keyword in title:
@@ -59,8 +60,8 @@ def search_specific_content(keyword):
                 if count >= 5:
                     print("... (仅显示前5条)")
                     break
-        if count == 0:
-            print("在所有文档标题中未找到该关键词。")
+    if count == 0:
+        print("在所有文档标题中未找到该关键词。")
 
     engine.close()
 
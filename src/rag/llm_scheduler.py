@@ -0,0 +1,119 @@
+import threading
+import time
+from collections import deque
+
+
+class LLMTicket:
+    """一次 LLM 调用在调度器中的排队凭证 (LLMScheduler.enter 返回)。"""
+
+    def __init__(self, scheduler, deadline):
+        self.scheduler = scheduler
+        self.deadline = deadline  # time.monotonic() 时间点
+        self.admitted = False
+        self.left = False
+        self.timed_out = False
+
+    @property
+    def position(self):
+        """排队位置 (1 表示下一个)；已获准执行返回 0。"""
+        return self.scheduler.position(self)
+
+    def remaining(self):
+        return self.deadline - time.monotonic()
+
+    def expired(self):
+        return time.monotonic() >= self.deadline
+
+    def wait(self, timeout):
+        """等待获准执行，最多 timeout 秒；返回是否已获准。"""
+        return self.scheduler.wait(self, timeout)
+
+    def leave(self):
+        """生成结束、放弃排队或出错时调用 (可重复调用)，空出的名额交给队首。"""
+        self.scheduler.leave(self)
+
+
+class LLMScheduler:
+    """
+    LLM 调用调度器 (准入控制 + FIFO 等待队列)
+
+    本地 Ollama 没有 GPU，同时生成的请求越多，每个请求都越慢。调度器限制同时生成的数量：
+    - max_concurrent 个请求同时生成，其余按到达顺序排队，排队位置可通过 ticket.position 反馈给前端
+    - 等待队列已满 (max_waiting) 时 enter 直接返回 None，调用方只返回检索结果、不生成回答
+    - queue_timeout 为最长排队时间；deadline 为从进入调度器起整个回答的时限 (排队 + 生成)
+    调度器只负责名额，生成、取消 (客户端断开) 与超时截断由调用方按 ticket 判断。
+    """
+
+    def __init__(self, max_concurrent=1, max_waiting=8, queue_timeout=30, deadline=120):
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.queue_timeout = queue_timeout
+        self.deadline = deadline
+        self._cond = threading.Condition()
+        self._waiting = deque()
+        self._running = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def enter(self):
+        """排队；等待队列已满返回 None (过载)。"""
+        with self._cond:
+            if self._running >= self.max_concurrent and len(self._waiting) >= self.max_waiting:
+                self.rejected += 1
+                return None
+            ticket = LLMTicket(self, time.monotonic() + self.deadline)
+            self._waiting.append(ticket)
+            self._dispatch()
+            return ticket
+
+    def wait(self, ticket, timeout):
+        with self._cond:
+            self._cond.wait_for(lambda: ticket.admitted or ticket.left, timeout)
+            return ticket.admitted and not ticket.left
+
+    def position(self, ticket):
+        with self._cond:
+            if ticket.admitted:
+                return 0
+            try:
+                return self._waiting.index(ticket) + 1
+            except ValueError:
+                return 0
+
+    def leave(self, ticket):
+        with self._cond:
+            if ticket.left:
+                return
+            ticket.left = True
+            if ticket.admitted:
+                self._running -= 1
+            else:
+                self._waiting.remove(ticket)
+            self._dispatch()
+
+    def record_timeout(self, ticket):
+        """
+        记录 ticket 排队超时或超过回答时限；同一 ticket 只记一次。
+        返回是否为第一次记录 (生成线程与转发方都会检查时限，只有先到的一方通知前端)。
+        """
+        with self._cond:
+            if ticket.timed_out:
+                return False
+            ticket.timed_out = True
+            self.timed_out += 1
+            return True
+
+    def stats(self):
+        with self._cond:
+            return {'running': self._running, 'waiting': len(self._waiting), 'admitted': self.admitted,
+                    'rejected': self.rejected, 'timed_out': self.timed_out}
+
+    def _dispatch(self):
+        """(持有锁时调用) 名额空出时按顺序放行队首请求。"""
+        while self._waiting and self._running < self.max_concurrent:
+            ticket = self._waiting.popleft()
+            ticket.admitted = True
+            self._running += 1
+            self.admitted += 1
+        self._cond.notify_all()
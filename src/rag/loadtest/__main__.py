@@ -0,0 +1,270 @@
+"""
+/api/search 压测：并发 SSE 客户端，统计吞吐、首结果时间 (TTFR)、首 token 时间 (TTFT) 与错误率
+
+默认在进程内启动完整的 Web 服务 (app.py + waitress，与 serve.py 相同配置)，
+HBase 与 Ollama 换成替身：内存存储 (合成语料，经 ETL 脚本建立索引) 与可配置速率的流式 LLM。
+也可以用 --url 压测已经在运行的服务 (真实 HBase / Ollama)。
+
+    cd src/rag
+    python -m loadtest --docs 5000 --clients 32 --duration 60 --ttft 0.8 --token-rate 15
+    python -m loadtest --url http://127.0.0.1:5000 --clients 16 --duration 120 --json report.json
+
+RAG_* 环境变量 (并发上限、LLM 队列等) 照常生效，可用来比较不同配置下的容量。
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from urllib.parse import quote, urlsplit
+
+RAG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(p / 100.0 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+class RequestResult:
+    __slots__ = ('query', 'status', 'outcome', 'ttfr', 'ttft', 'total', 'tokens', 'started_at')
+
+    def __init__(self, query, started_at):
+        self.query = query
+        self.started_at = started_at
+        self.status = None
+        self.outcome = 'exception'
+        self.ttfr = self.ttft = self.total = None
+        self.tokens = 0
+
+
+def run_request(host, port, query, timeout):
+    """发起一次 /api/search 并读完 SSE 流，记录各事件到达时间。"""
+    started = time.perf_counter()
+    result = RequestResult(query, time.time())
+    connection = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        connection.request('GET', f'/api/search?q={quote(query)}', headers={'Accept': 'text/event-stream'})
+        response = connection.getresponse()
+        result.status = response.status
+        if response.status != 200:
+            response.read()
+            result.outcome = 'busy' if response.status == 503 else 'http_error'
+            return result
+
+        buffer = b''
+        outcome = 'incomplete'
+        while True:
+            chunk = response.read1(65536)
+            if not chunk:
+                break
+            buffer += chunk
+            while b'\n\n' in buffer:
+                raw, buffer = buffer.split(b'\n\n', 1)
+                event = raw.split(b'\n', 1)[0][len(b'event: '):].decode('utf-8', 'ignore')
+                now = time.perf_counter() - started
+                if event == 'results' and result.ttfr is None:
+                    result.ttfr = now
+                elif event == 'token':
+                    result.tokens += 1
+                    if result.ttft is None:
+                        result.ttft = now
+                elif event == 'notice':
+                    outcome = 'no_answer'
+                elif event == 'error':
+                    outcome = 'stream_error'
+                elif event == 'done':
+                    if outcome == 'incomplete':
+                        outcome = 'ok'
+        result.outcome = outcome
+        return result
+    except Exception as e:
+        logging.debug(f"Request failed: {e!r}")
+        result.outcome = 'exception'
+        return result
+    finally:
+        result.total = time.perf_counter() - started
+        connection.close()
+
+
+def run_load(host, port, queries, clients, duration, think_time, timeout):
+    """闭环压测：clients 个线程各自循环发请求 (完成后等待 think_time 秒)，持续 duration 秒。"""
+    results = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    cursor = iter(range(sys.maxsize))
+
+    def client():
+        while time.perf_counter() < deadline:
+            with lock:
+                query = queries[next(cursor) % len(queries)]
+            result = run_request(host, port, query, timeout)
+            with lock:
+                results.append(result)
+            if think_time:
+                time.sleep(think_time)
+
+    threads = [threading.Thread(target=client, name=f'client-{i}', daemon=True) for i in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+def summarize(results, elapsed):
+    outcomes = Counter(r.outcome for r in results)
+    ok = [r for r in results if r.outcome in ('ok', 'no_answer')]
+    ttfr = [r.ttfr for r in results if r.ttfr is not None]
+    ttft = [r.ttft for r in results if r.ttft is not None]
+    total = [r.total for r in ok]
+    errors = sum(n for o, n in outcomes.items() if o not in ('ok', 'no_answer'))
+
+    def dist(values):
+        return {'p50': percentile(values, 50), 'p95': percentile(values, 95), 'p99': percentile(values, 99),
+                'max': max(values) if values else None, 'count': len(values)}
+
+    return {
+        'requests': len(results),
+        'elapsed_seconds': round(elapsed, 2),
+        'throughput_rps': round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        'outcomes': dict(outcomes),
+        'error_rate': round(errors / len(results), 4) if results else 0.0,
+        'busy_rate': round(outcomes.get('busy', 0) / len(results), 4) if results else 0.0,
+        'no_answer_rate': round(outcomes.get('no_answer', 0) / len(results), 4) if results else 0.0,
+        'ttfr_seconds': dist(ttfr),
+        'ttft_seconds': dist(ttft),
+        'total_seconds': dist(total),
+    }
+
+
+def print_report(summary, stream=sys.stdout):
+    def fmt(value):
+        return '-' if value is None else f'{value * 1000:8.1f} ms'
+
+    print('', file=stream)
+    print(f"Requests: {summary['requests']} in {summary['elapsed_seconds']} s  "
+          f"(throughput {summary['throughput_rps']} req/s)", file=stream)
+    print(f"Outcomes: {summary['outcomes']}", file=stream)
+    print(f"Error rate {summary['error_rate']:.2%}, busy (503) {summary['busy_rate']:.2%}, "
+          f"results without answer {summary['no_answer_rate']:.2%}", file=stream)
+    print(f"{'':18}{'p50':>11}{'p95':>11}{'p99':>11}{'max':>11}  n", file=stream)
+    for label, key in (('time to results', 'ttfr_seconds'), ('time to 1st token', 'ttft_seconds'),
+                       ('full response', 'total_seconds')):
+        d = summary[key]
+        print(f"{label:18}{fmt(d['p50']):>11}{fmt(d['p95']):>11}{fmt(d['p99']):>11}{fmt(d['max']):>11}  {d['count']}",
+              file=stream)
+
+
+def start_local_server(args):
+    """在进程内启动替身后端 + app.py，返回 (host, port, server, corpus)。"""
+    sys.path.insert(0, RAG_DIR)
+    from loadtest.corpus import SyntheticCorpus, seed
+    from loadtest.fake_hbase import FakeHBase, install
+    from loadtest.fake_llm import FakeStreamingLLM
+
+    # 替身没有向量索引；关闭回答缓存时每个请求都走 LLM
+    os.environ.setdefault('RAG_VECTOR_INDEX', os.path.join(RAG_DIR, 'loadtest', 'no_vector_index'))
+    # 合成查询不能混进真实的查询日志 (会影响自动补全的热门词)
+    os.environ.setdefault('RAG_QUERY_LOG', os.path.join(tempfile.gettempdir(), 'loadtest-queries.log'))
+    if args.no_answer_cache:
+        os.environ['RAG_ANSWER_CACHE_MB'] = '0'
+
+    hbase = FakeHBase(rpc_latency=0.0)
+    corpus = SyntheticCorpus(num_docs=args.docs, seed=args.seed)
+    started = time.perf_counter()
+    seed(hbase, corpus, passages=not args.no_passages)
+    logging.info(f"Seeded {args.docs} synthetic documents in {time.perf_counter() - started:.1f}s")
+    hbase.rpc_latency = args.rpc_ms / 1000.0
+    hbase.scan_row_cost = args.scan_row_us / 1e6
+    install(hbase)
+
+    import app as app_module
+    from waitress.server import create_server
+    app_module.rag_service.chain = FakeStreamingLLM(
+        ttft=args.ttft, token_rate=args.token_rate, answer_tokens=args.answer_tokens,
+        concurrency_penalty=args.llm_concurrency_penalty)
+
+    threads = args.threads or app_module.MAX_CONCURRENT_SEARCHES + 8
+    server = create_server(app_module.app, host='127.0.0.1', port=0, threads=threads,
+                           channel_timeout=300, connection_limit=max(200, args.clients * 2))
+    threading.Thread(target=server.run, name='waitress', daemon=True).start()
+    return '127.0.0.1', server.effective_port, server, corpus
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Load-test /api/search with concurrent SSE clients')
+    parser.add_argument('--url', help='target a running server instead of starting one with fake backends')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent SSE clients')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to run')
+    parser.add_argument('--think-time', type=float, default=0.0, help='pause between requests per client (s)')
+    parser.add_argument('--timeout', type=float, default=300, help='per-request socket timeout (s)')
+    parser.add_argument('--queries', type=int, default=400, help='size of the (Zipf-repeated) query list')
+    parser.add_argument('--query-file', help='one query per line (default: synthetic queries)')
+    parser.add_argument('--warmup', type=int, default=2, help='sequential requests before measuring')
+    parser.add_argument('--json', help='write the summary as JSON to this path')
+    group = parser.add_argument_group('fake backends (ignored with --url)')
+    group.add_argument('--docs', type=int, default=2000, help='synthetic documents')
+    group.add_argument('--seed', type=int, default=42)
+    group.add_argument('--no-passages', action='store_true', help='skip the passage index (context falls back to snippets)')
+    group.add_argument('--rpc-ms', type=float, default=1.0, help='simulated HBase round trip per RPC (ms)')
+    group.add_argument('--scan-row-us', type=float, default=2.0, help='simulated server-side cost per scanned row (us)')
+    group.add_argument('--ttft', type=float, default=0.5, help='fake LLM time to first token (s)')
+    group.add_argument('--token-rate', type=float, default=20.0, help='fake LLM tokens per second')
+    group.add_argument('--answer-tokens', type=int, default=120, help='tokens per fake answer')
+    group.add_argument('--llm-concurrency-penalty', type=float, default=0.0,
+                       help='slowdown per extra concurrent generation (models a CPU-bound Ollama)')
+    group.add_argument('--no-answer-cache', action='store_true', help='disable the answer cache')
+    group.add_argument('--threads', type=int, help='waitress worker threads (default: RAG_MAX_CONCURRENT_SEARCHES + 8)')
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+    server = corpus = None
+    if args.url:
+        target = urlsplit(args.url)
+        host, port = target.hostname, target.port or 80
+    else:
+        host, port, server, corpus = start_local_server(args)
+        logging.info(f"Serving the app with fake backends on http://{host}:{port}")
+        # 压测期间只保留警告，逐请求的 INFO 日志本身就会拖慢服务
+        logging.getLogger().setLevel(logging.WARNING)
+
+    if args.query_file:
+        with open(args.query_file, encoding='utf-8') as f:
+            queries = [line.strip() for line in f if line.strip()]
+    elif corpus is not None:
+        queries = corpus.queries(args.queries)
+    else:
+        from loadtest.corpus import SyntheticCorpus
+        queries = SyntheticCorpus(num_docs=0, seed=args.seed).queries(args.queries)
+
+    for query in queries[:args.warmup]:
+        run_request(host, port, query, args.timeout)
+
+    print(f"Running {args.clients} clients for {args.duration:.0f}s against http://{host}:{port} ...", flush=True)
+    results, elapsed = run_load(host, port, queries, args.clients, args.duration, args.think_time, args.timeout)
+    summary = summarize(results, elapsed)
+    print_report(summary)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    if server is not None:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
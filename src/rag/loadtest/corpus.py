@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import random
+import sys
+from collections import Counter
+
+# 倒排索引与段落索引直接用 ETL 脚本的 build_index 写入替身存储，编码与线上完全一致
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'etl'))
+
+SOURCE_TABLE = 'ustc_web_data'
+
+# 校园网页常见词 (合成语料的词表)；按 Zipf 分布抽样，少数高频词、长尾低频词
+VOCABULARY = (
+    '本科生', '研究生', '选课', '退选', '补选', '考试', '安排', '成绩', '查询', '奖学金', '助学金', '申请', '评审',
+    '公示', '名单', '通知', '公告', '办法', '细则', '管理', '规定', '实施', '学院', '教务处', '研究生院', '学工部',
+    '计算机', '物理', '化学', '数学', '生命科学', '工程科学', '信息科学', '核科学', '地球科学', '管理学院', '软件学院',
+    '学术报告', '讲座', '研讨会', '会议', '招生', '复试', '调剂', '推免', '夏令营', '交换', '留学', '国际交流',
+    '实验室', '课题组', '科研', '项目', '基金', '论文', '答辩', '学位', '毕业', '就业', '实习', '招聘', '宣讲会',
+    '宿舍', '食堂', '校园卡', '图书馆', '网络', '信息化', '邮箱', '账号', '密码', '系统', '平台', '服务', '维护',
+    '校历', '学期', '假期', '寒假', '暑假', '开学', '报到', '注册', '缴费', '学费', '住宿费', '医保', '体检',
+    '军训', '体育', '竞赛', '创新', '创业', '大赛', '志愿者', '社团', '活动', '晚会', '比赛', '获奖', '表彰',
+    '教师', '教授', '博士后', '人才', '引进', '职称', '岗位', '聘任', '培训', '考核', '年度', '总结', '计划',
+    '安全', '消防', '保卫', '疫情', '防控', '健康', '心理', '咨询', '辅导员', '班主任', '导师', '课程', '教材',
+    '教学', '评估', '督导', '实践', '暑期', '社会', '调研', '合作', '协议', '签约', '仪式', '开幕', '闭幕',
+)
+TITLE_SUFFIXES = ('通知', '公告', '办法', '安排', '名单', '公示', '细则', '报告会', '指南', '说明')
+FILE_EXTS = ('.pdf', '.docx', '.xlsx', '.doc')
+
+
+def _zipf_weights(n, s=1.1):
+    return [1.0 / (rank ** s) for rank in range(1, n + 1)]
+
+
+class SyntheticCorpus:
+    """
+    合成语料：按 Zipf 分布从校园常见词表抽词组成标题与正文 (同一随机种子结果可复现)，
+    一部分文档为附件 (info:type=file)、一部分网页带附件列表，与爬虫写入的字段一致。
+    """
+
+    def __init__(self, num_docs=2000, seed=42, paragraphs=(3, 8), file_ratio=0.2):
+        self.num_docs = num_docs
+        self.rng = random.Random(seed)
+        self.paragraphs = paragraphs
+        self.file_ratio = file_ratio
+        self.words = list(VOCABULARY)
+        self.rng.shuffle(self.words)
+        self.weights = _zipf_weights(len(self.words))
+
+    def _words(self, k):
+        return self.rng.choices(self.words, weights=self.weights, k=k)
+
+    def _sentence(self):
+        return '，'.join(''.join(self._words(self.rng.randint(2, 4))) for _ in range(self.rng.randint(1, 3))) + '。'
+
+    def _text(self):
+        paragraphs = []
+        for _ in range(self.rng.randint(*self.paragraphs)):
+            paragraphs.append(''.join(self._sentence() for _ in range(self.rng.randint(3, 8))))
+        return '\n'.join(paragraphs)
+
+    def documents(self):
+        for n in range(self.num_docs):
+            title = ''.join(self._words(self.rng.randint(2, 4))) + self.rng.choice(TITLE_SUFFIXES)
+            text = self._text()
+            url = f'https://www.ustc.edu.cn/synthetic/{n}.html'
+            doc_type = 'file' if self.rng.random() < self.file_ratio else 'web'
+            counts = Counter(w for w in self._words(60) if w in text or w in title)
+            total = sum(counts.values()) or 1
+            keywords = [{'word': w, 'weight': round(c / total, 4)} for w, c in counts.most_common(20)]
+            row = {
+                b'info:title': title.encode('utf-8'),
+                b'info:type': doc_type.encode('utf-8'),
+                b'info:date': f'20{self.rng.randint(18, 25)}-{self.rng.randint(1, 12):02d}-{self.rng.randint(1, 28):02d}'.encode('utf-8'),
+                b'info:keywords': json.dumps(keywords, ensure_ascii=False).encode('utf-8'),
+                b'info:fingerprint': hashlib.md5(text.encode('utf-8')).hexdigest().encode('utf-8'),
+                b'content:text': text.encode('utf-8'),
+            }
+            if doc_type == 'file':
+                row[b'info:parent_url'] = url.encode('utf-8')
+                row[b'files:path'] = json.dumps([f'synthetic/{n}{self.rng.choice(FILE_EXTS)}']).encode('utf-8')
+            else:
+                row[b'info:url'] = url.encode('utf-8')
+                if self.rng.random() < 0.3:
+                    row[b'files:path'] = json.dumps([f'synthetic/{n}_附件{i}{self.rng.choice(FILE_EXTS)}'
+                                                     for i in range(self.rng.randint(1, 3))],
+                                                    ensure_ascii=False).encode('utf-8')
+            yield hashlib.md5(url.encode('utf-8')).hexdigest(), row
+
+    def queries(self, count):
+        """压测查询：2~3 个词的组合，按 Zipf 分布重复 (热门问题反复出现，贴近真实流量)。"""
+        distinct = [''.join(self._words(self.rng.randint(2, 3))) for _ in range(max(1, count // 4))]
+        return self.rng.choices(distinct, weights=_zipf_weights(len(distinct), 0.9), k=count)
+
+
+def seed(hbase, corpus, passages=True):
+    """把合成语料写入替身存储，并用 ETL 脚本建立关键词倒排索引与 (可选) 段落索引。"""
+    connection = hbase.connection()
+    table = connection.table(SOURCE_TABLE)
+    with table.batch(batch_size=1000) as batch:
+        for row_key, row in corpus.documents():
+            batch.put(row_key.encode('utf-8'), row)
+
+    import build_inverted_index
+    build_inverted_index.create_target_table(connection)
+    build_inverted_index.build_index(connection)
+    if passages:
+        import build_passage_index
+        build_passage_index.create_target_tables(connection)
+        build_passage_index.build_index(connection)
@@ -0,0 +1,252 @@
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# 支持检索与 ETL 用到的两种服务端过滤器
+_SCV_FILTER_RE = re.compile(
+    r"SingleColumnValueFilter\('([^']*)',\s*'([^']*)',\s*(=|>=|<=|>|<),\s*'(substring|binary):([^']*)'")
+_PREFIX_FILTER_RE = re.compile(r"MultipleColumnPrefixFilter\((.*)\)")
+
+
+class FakeHBase:
+    """
+    内存中的 HBase 替身 (压测用)：{表名: {RowKey: {列: 值}}}
+
+    每次 RPC (row / rows / scan / batch 发送) 先睡眠 rpc_latency 秒，scan 额外按扫描行数计 scan_row_cost 秒，
+    近似 Thrift 往返与 RegionServer 上的过滤开销，使压测结果能反映检索路径中的 HBase 访问次数。
+    """
+
+    def __init__(self, rpc_latency=0.001, scan_row_cost=0.0):
+        self.rpc_latency = rpc_latency
+        self.scan_row_cost = scan_row_cost
+        self.tables = {}
+        self.rpc_count = 0
+        self._lock = threading.Lock()
+
+    def rpc(self, rows_scanned=0):
+        with self._lock:
+            self.rpc_count += 1
+        delay = self.rpc_latency + rows_scanned * self.scan_row_cost
+        if delay > 0:
+            time.sleep(delay)
+
+    def table_rows(self, name):
+        with self._lock:
+            return self.tables.setdefault(name, {})
+
+    def apply(self, name, mutations):
+        """mutations: [(put|delete, row_key, data 或 columns)]"""
+        rows = self.table_rows(name)
+        with self._lock:
+            for op, key, data in mutations:
+                if op == 'put':
+                    rows.setdefault(key, {}).update(data)
+                elif data is None:
+                    rows.pop(key, None)
+                else:
+                    row = rows.get(key, {})
+                    for column in data:
+                        row.pop(column, None)
+                    if key in rows and not row:
+                        del rows[key]
+
+    def connection(self, **kwargs):
+        return FakeConnection(self)
+
+    def connection_pool(self, size, **kwargs):
+        return FakeConnectionPool(self, size)
+
+
+def _to_bytes(value):
+    return value.encode('utf-8') if isinstance(value, str) else value
+
+
+def _select_columns(row, columns):
+    if not columns:
+        return dict(row)
+    wanted = {_to_bytes(c) for c in columns}
+    families = {c for c in wanted if b':' not in c}
+    return {c: v for c, v in row.items() if c in wanted or c.split(b':', 1)[0] in families}
+
+
+def _compile_filter(filter_bytes):
+    """把过滤器字符串转换为 (行过滤函数, 列过滤函数)；不支持的过滤器忽略。"""
+    if not filter_bytes:
+        return None, None
+    text = filter_bytes.decode('utf-8') if isinstance(filter_bytes, bytes) else filter_bytes
+
+    match = _SCV_FILTER_RE.search(text)
+    if match:
+        family, qualifier, op, kind, operand = match.groups()
+        column = f'{family}:{qualifier}'.encode('utf-8')
+        operand = operand.encode('utf-8')
+
+        def row_filter(row):
+            value = row.get(column)
+            if value is None:
+                return False
+            if kind == 'substring':
+                return (operand.lower() in value.lower()) == (op == '=')
+            return {'=': value == operand, '>=': value >= operand, '<=': value <= operand,
+                    '>': value > operand, '<': value < operand}[op]
+        return row_filter, None
+
+    match = _PREFIX_FILTER_RE.search(text)
+    if match:
+        prefixes = [p.encode('utf-8') for p in re.findall(r"'([^']*)'", match.group(1))]
+
+        def column_filter(column):
+            qualifier = column.split(b':', 1)[-1]
+            return any(qualifier.startswith(p) for p in prefixes)
+        return None, column_filter
+
+    return None, None
+
+
+class FakeBatch:
+    def __init__(self, table, batch_size=None):
+        self.table = table
+        self.batch_size = batch_size
+        self._mutations = []
+
+    def put(self, row, data):
+        self._mutations.append(('put', _to_bytes(row), {_to_bytes(k): _to_bytes(v) for k, v in data.items()}))
+        if self.batch_size and len(self._mutations) >= self.batch_size:
+            self.send()
+
+    def delete(self, row, columns=None):
+        self._mutations.append(('delete', _to_bytes(row), [_to_bytes(c) for c in columns] if columns else None))
+        if self.batch_size and len(self._mutations) >= self.batch_size:
+            self.send()
+
+    def send(self):
+        if self._mutations:
+            self.table.hbase.rpc()
+            self.table.hbase.apply(self.table.name, self._mutations)
+            self._mutations = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.send()
+
+
+class FakeTable:
+    def __init__(self, hbase, name):
+        self.hbase = hbase
+        self.name = name.decode('utf-8') if isinstance(name, bytes) else name
+
+    def batch(self, batch_size=None, **kwargs):
+        return FakeBatch(self, batch_size)
+
+    def put(self, row, data):
+        with self.batch() as batch:
+            batch.put(row, data)
+
+    def delete(self, row, columns=None):
+        with self.batch() as batch:
+            batch.delete(row, columns)
+
+    def row(self, row, columns=None):
+        self.hbase.rpc()
+        return _select_columns(self.hbase.table_rows(self.name).get(_to_bytes(row), {}), columns)
+
+    def rows(self, rows, columns=None):
+        self.hbase.rpc()
+        data = self.hbase.table_rows(self.name)
+        result = []
+        for key in rows:
+            row = data.get(_to_bytes(key))
+            if row:
+                selected = _select_columns(row, columns)
+                if selected:
+                    result.append((_to_bytes(key), selected))
+        return result
+
+    def scan(self, row_start=None, row_stop=None, row_prefix=None, columns=None, filter=None, limit=None,
+             batch_size=1000, **kwargs):
+        row_filter, column_filter = _compile_filter(filter)
+        data = self.hbase.table_rows(self.name)
+        if row_prefix is not None:
+            row_start, row_stop = _to_bytes(row_prefix), None
+        row_start, row_stop = _to_bytes(row_start), _to_bytes(row_stop)
+        # 行键有序：前缀 / 区间扫描先在排序后的键上截取
+        keys = sorted(data)
+        scanned = returned = 0
+        pending_cost = 0
+        for key in keys:
+            if row_start is not None and key < row_start:
+                continue
+            if row_prefix is not None and not key.startswith(row_start):
+                if key > row_start:
+                    break
+                continue
+            if row_stop is not None and key >= row_stop:
+                break
+            scanned += 1
+            pending_cost += 1
+            row = data.get(key)
+            if row is None or (row_filter and not row_filter(row)):
+                continue
+            selected = _select_columns(row, columns)
+            if column_filter:
+                selected = {c: v for c, v in selected.items() if column_filter(c)}
+            if not selected:
+                continue
+            # 每返回 batch_size 行计一次 RPC (scanner 的 next 调用)
+            if returned % batch_size == 0:
+                self.hbase.rpc(pending_cost)
+                pending_cost = 0
+            yield key, selected
+            returned += 1
+            if limit is not None and returned >= limit:
+                return
+        if returned == 0 or pending_cost:
+            self.hbase.rpc(pending_cost)
+
+
+class FakeConnection:
+    def __init__(self, hbase):
+        self.hbase = hbase
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def tables(self):
+        return [name.encode('utf-8') for name in self.hbase.tables]
+
+    def create_table(self, name, families):
+        self.hbase.table_rows(name)
+
+    def table(self, name):
+        return FakeTable(self.hbase, name)
+
+
+class FakeConnectionPool:
+    """与 happybase.ConnectionPool 接口一致：最多 size 个连接同时借出，超时抛出 NoConnectionsAvailable。"""
+
+    def __init__(self, hbase, size):
+        self.hbase = hbase
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        import happybase
+        if not self._slots.acquire(timeout=timeout if timeout is not None else -1):
+            raise happybase.NoConnectionsAvailable("No connection available from pool within specified timeout")
+        try:
+            yield FakeConnection(self.hbase)
+        finally:
+            self._slots.release()
+
+
+def install(hbase):
+    """用 hbase 替换 happybase.Connection / ConnectionPool (须在导入 app 之前调用)。"""
+    import happybase
+    happybase.Connection = lambda *args, **kwargs: hbase.connection(**kwargs)
+    happybase.ConnectionPool = lambda size, **kwargs: hbase.connection_pool(size, **kwargs)
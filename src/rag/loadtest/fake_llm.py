@@ -0,0 +1,44 @@
+import random
+import threading
+import time
+
+_FILLER = ('根据', '参考资料', '中', '的', '说明', '，', '同学', '可以', '在', '规定', '时间', '内', '通过', '系统',
+           '提交', '申请', '。', '具体', '要求', '请', '以', '学院', '通知', '为准', '相关', '材料')
+
+
+class FakeStreamingLLM:
+    """
+    流式 LLM 替身 (压测用)，接口与 RAGService.chain 相同：stream(inputs) 逐个产出 token。
+
+    - ttft: 收到请求到第一个 token 的时间 (模拟 prompt 预填充，按 context 长度线性增加 prefill_per_char)
+    - token_rate: 每秒产出的 token 数；answer_tokens: 每个回答的 token 数
+    - concurrency_penalty: 同时生成的请求越多每个越慢 (模拟无 GPU 的 Ollama 平分 CPU)，0 表示互不影响
+    """
+
+    def __init__(self, ttft=0.5, token_rate=20.0, answer_tokens=120, prefill_per_char=0.0, concurrency_penalty=0.0):
+        self.ttft = ttft
+        self.token_rate = token_rate
+        self.answer_tokens = answer_tokens
+        self.prefill_per_char = prefill_per_char
+        self.concurrency_penalty = concurrency_penalty
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def _slowdown(self):
+        return 1 + self.concurrency_penalty * max(0, self.active - 1)
+
+    def _enter(self, delta):
+        with self._lock:
+            self.active += delta
+
+    def stream(self, inputs):
+        self._enter(1)
+        try:
+            context = inputs.get('context', '') if isinstance(inputs, dict) else ''
+            time.sleep((self.ttft + len(context) * self.prefill_per_char) * self._slowdown())
+            rng = random.Random(hash(inputs.get('question', '')) if isinstance(inputs, dict) else 0)
+            for _ in range(self.answer_tokens):
+                yield rng.choice(_FILLER)
+                time.sleep(self._slowdown() / self.token_rate)
+        finally:
+            self._enter(-1)
@@ -0,0 +1,63 @@
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# 复用爬虫包中的极简 Prometheus 指标实现 (进程级注册表)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ustc_spider'))
+from ustc_spider.telemetry import REGISTRY, CONTENT_TYPE
+
+# 检索各阶段多为毫秒级，桶从 1ms 起
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+STAGE_SECONDS = REGISTRY.histogram('rag_stage_seconds', '查询各阶段耗时 (秒)', ['stage'], buckets=STAGE_BUCKETS)
+STAGE_ITEMS = REGISTRY.histogram('rag_stage_items', '查询各阶段的候选/结果数量', ['stage'], buckets=COUNT_BUCKETS)
+REQUEST_SECONDS = REGISTRY.histogram('rag_request_seconds', 'HTTP 请求处理耗时 (流式响应为发出响应头前的耗时)',
+                                     ['endpoint', 'status'], buckets=STAGE_BUCKETS)
+LLM_QUEUE_SECONDS = REGISTRY.histogram('rag_llm_queue_wait_seconds', '等待 LLM 名额的时间', buckets=LLM_BUCKETS)
+LLM_TTFT_SECONDS = REGISTRY.histogram('rag_llm_time_to_first_token_seconds', 'LLM 调用到第一个 token 的时间',
+                                      buckets=LLM_BUCKETS)
+LLM_GENERATION_SECONDS = REGISTRY.histogram('rag_llm_generation_seconds', 'LLM 完整生成耗时', buckets=LLM_BUCKETS)
+LLM_OUTCOMES = REGISTRY.counter('rag_llm_answers_total', 'AI 回答结果计数', ['outcome'])
+
+
+class QueryTimings:
+    """
+    单个请求的阶段耗时与候选数量
+
+    每个阶段结束时同时写入进程级直方图 (/metrics) 并累加到本对象，
+    用于生成该请求的 Server-Timing 响应头 (浏览器开发者工具可直接查看)。
+    每个阶段只多两次 perf_counter 与一次加锁，生产环境常开。
+    """
+
+    def __init__(self):
+        self.stages = {}  # 阶段 -> 累计秒数 (按首次出现的顺序)
+        self.items = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        STAGE_SECONDS.observe(seconds, stage=name)
+
+    def count(self, name, n):
+        self.items[name] = n
+        STAGE_ITEMS.observe(n, stage=name)
+
+    def server_timing(self):
+        """Server-Timing 头的值，如 "segment;dur=1.2, index;dur=8.4;desc=\"312\""。"""
+        parts = []
+        for name, seconds in self.stages.items():
+            part = f'{name};dur={seconds * 1000:.1f}'
+            if name in self.items:
+                part += f';desc="{self.items[name]}"'
+            parts.append(part)
+        return ', '.join(parts)
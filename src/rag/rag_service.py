@@ -2,20 +2,72 @@ from langchain_ollama import OllamaLLM
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from search_engine import USTCSearchEngine
+from answer_cache import AnswerCache
+from llm_scheduler import LLMScheduler
+from query_metrics import (LLM_GENERATION_SECONDS, LLM_OUTCOMES, LLM_QUEUE_SECONDS, LLM_TTFT_SECONDS,
+                           QueryTimings)
 import logging
+import os
+import queue
+import sys
+import threading
+import time
+
+# 与 search_engine.py 共用爬虫包中的 token 估算，不依赖其导入时的副作用
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ustc_spider'))
+from ustc_spider.passages import estimate_tokens
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 
+# 作为 LLM 上下文的文档数；第一批摘要与前端一页的条数一致，其余摘要按批读取
+CONTEXT_DOCS = 10
+SNIPPET_FIRST_BATCH = 10
+SNIPPET_BATCH = 100
+
+# 排队位置未变化时重复通知的间隔 (秒)；同时作为心跳，客户端断开后能及时发现
+QUEUE_HEARTBEAT = 5
+NOTICE_MESSAGES = {
+    'overloaded': 'AI 助手当前请求过多，本次仅显示检索结果，请稍后再试。',
+    'queue_timeout': 'AI 助手排队超时，本次仅显示检索结果，请稍后再试。',
+    'deadline': '（回答超时，已截断）',
+}
+
 class RAGService:
     def __init__(self):
         # 初始化 LLM，连接本地 Ollama
         # 确保本地已运行 `ollama run qwen2.5:7b`
         self.llm = OllamaLLM(model="qwen2.5:7b")
         
-        # 初始化搜索引擎
-        self.search_engine = USTCSearchEngine()
+        # 初始化搜索引擎 (HBase 地址与连接池大小可用环境变量覆盖)
+        self.search_engine = USTCSearchEngine(
+            host=os.environ.get('HBASE_HOST', '127.0.0.1'),
+            port=int(os.environ.get('HBASE_PORT', '9090')),
+            pool_size=int(os.environ.get('HBASE_POOL_SIZE', '8')),
+            vector_index_path=os.environ.get(
+                'RAG_VECTOR_INDEX', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vector_index')),
+            dense_weight=float(os.environ.get('RAG_DENSE_WEIGHT', '10')),
+            filter_index_path=os.environ.get(
+                'RAG_FILTER_INDEX', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'filter_index.json')),
+        )
         
+        # 送给大模型的参考资料 token 预算 (段落按相关度装填)
+        self.context_tokens = int(os.environ.get('RAG_CONTEXT_TOKENS', '1500'))
+
+        # 回答缓存：相同问题 + 相同参考资料 (及版本) 直接回放之前的回答
+        self.answer_cache = AnswerCache(
+            max_bytes=int(os.environ.get('RAG_ANSWER_CACHE_MB', '64')) * 1024 * 1024,
+            ttl=int(os.environ.get('RAG_ANSWER_CACHE_TTL', '3600')),
+        )
+
+        # LLM 调度：限制同时生成的请求数，其余排队 (队列满、排队超时时只返回检索结果)
+        self.llm_scheduler = LLMScheduler(
+            max_concurrent=int(os.environ.get('RAG_LLM_CONCURRENCY', '1')),
+            max_waiting=int(os.environ.get('RAG_LLM_MAX_QUEUE', '8')),
+            queue_timeout=float(os.environ.get('RAG_LLM_QUEUE_TIMEOUT', '30')),
+            deadline=float(os.environ.get('RAG_LLM_DEADLINE', '120')),
+        )
+
         # 定义 Prompt 模板
         # 要求模型作为“中科大文件搜索助手”，仅根据参考资料回答
         self.prompt_template = ChatPromptTemplate.from_template("""
@@ -35,47 +87,215 @@ class RAGService:
         # 构建 Chain
         self.chain = self.prompt_template | self.llm | StrOutputParser()
 
-    def get_answer_stream(self, query):
+    def rank(self, query, timings=None, filters=None, facets=None):
+        """检索并排序全部候选 (供前端分页)，不读取正文；排序完成即可先把结果列表发给前端。"""
+        logging.info(f"Searching for: {query}{f' {filters.to_dict()}' if filters else ''}")
+        return self.search_engine.rank(query, timings=timings, filters=filters, facets=facets)
+
+    def stream_answer(self, query, search_results):
         """
-        获取 RAG 回答（流式）
-        :param query: 用户问题
-        :return: (generator, search_results)
+        分阶段输出 (rank 之后调用)，逐个产出 (事件, 数据)：
+        - ('snippets', {doc_id: 摘要})：先补全第一页的摘要，其余结果按批补全
+        - ('queue', {'position': n})：等待 LLM 名额时的排队位置
+        - ('token', 文本)：AI 回答的流式 token
+        - ('notice', {'reason', 'message'})：过载、排队超时或回答超时，不再 (继续) 生成回答
+        - ('error', 信息)：生成出错
+
+        构建 Context (段落检索) 与 LLM 生成在后台线程中进行，与摘要读取重叠，
+        token 经队列转发；LLM 开始输出前的等待时间用来读取剩余摘要。
+        调用方关闭生成器 (客户端断开) 时通知后台线程停止生成。
+        回答时限 (RAG_LLM_DEADLINE) 在转发端按 ticket 剩余时间等待队列：LLM 迟迟不输出下一个 token 时
+        也能按时截断并空出名额，不依赖后台线程收到 token 后才检查。
         """
-        # 1. 检索相关文档
-        logging.info(f"Searching for: {query}")
-        # 拉取全部候选供前端分页，LLM 只取前 10 条作为上下文
-        search_results = self.search_engine.search(query, top_k=None)
-        context_results = search_results[:10]
-        
-        # 2. 构建 Context
-        if not context_results:
-            context = "没有找到相关参考资料。"
+        # LLM 只取前 CONTEXT_DOCS 条作为上下文
+        context_results = search_results[:CONTEXT_DOCS]
+        events = queue.Queue()
+        cancelled = threading.Event()
+        ticket = None
+
+        # 命中回答缓存时不再构建 Context、不调用 LLM
+        cache_key = self.answer_cache.make_key(query, [(r['doc_id'], r.get('version')) for r in context_results])
+        cached_chunks = self.answer_cache.get(cache_key)
+        if cached_chunks is not None:
+            logging.info("Answer cache hit. Replaying cached answer...")
+            LLM_OUTCOMES.inc(outcome='cached')
+            for chunk in cached_chunks:
+                events.put(('token', chunk))
+            events.put(None)
         else:
-            context_parts = []
-            for i, res in enumerate(context_results):
-                # 使用 snippet 作为上下文内容
-                content_snippet = res.get('snippet', '')
-                
-                # 构建来源信息
-                if res.get('type') == 'file':
-                    source_info = f"类型: 文档 | 来源页面: {res.get('parent_url', '未知')}"
-                else:
-                    files_count = len(res.get('file_paths', []))
-                    source_info = f"类型: 网页 (含 {files_count} 个附件) | URL: {res['url']}"
-                
-                context_parts.append(f"【资料 {i+1}】\n标题: {res['title']}\n{source_info}\n内容摘要: {content_snippet}")
-            context = "\n\n".join(context_parts)
-            
-        logging.info("Context constructed. Generating answer...")
-
-        # 3. 调用 LLM 生成回答 (流式)
-        # stream 方法返回一个生成器，逐步输出 token
-        stream_generator = self.chain.stream({
-            "context": context,
-            "question": query
-        })
-        
-        return stream_generator, search_results
+            ticket = self.llm_scheduler.enter()
+            if ticket is None:
+                logging.warning("LLM queue full, returning results without an answer")
+                LLM_OUTCOMES.inc(outcome='overloaded')
+                events.put(('notice', {'reason': 'overloaded', 'message': NOTICE_MESSAGES['overloaded']}))
+                events.put(None)
+            else:
+                threading.Thread(target=self._generate,
+                                 args=(query, context_results, cache_key, events, cancelled, ticket),
+                                 daemon=True).start()
+
+        try:
+            pending = search_results
+            batch_size = SNIPPET_FIRST_BATCH
+            finished = False
+            while pending:
+                batch, pending = pending[:batch_size], pending[batch_size:]
+                batch_size = SNIPPET_BATCH
+                yield 'snippets', self.search_engine.fill_snippets(batch)
+                # 已生成的 token 先转发，不等剩余摘要读完
+                while not finished:
+                    try:
+                        event = events.get_nowait()
+                    except queue.Empty:
+                        break
+                    if event is None:
+                        finished = True
+                    else:
+                        yield event
+            while not finished:
+                try:
+                    event = events.get(timeout=max(ticket.remaining(), 0) if ticket else None)
+                except queue.Empty:
+                    # 超过回答时限仍未结束：截断并立即空出名额，后台线程随后自行停止
+                    cancelled.set()
+                    if self.llm_scheduler.record_timeout(ticket):
+                        yield 'notice', {'reason': 'deadline', 'message': NOTICE_MESSAGES['deadline']}
+                    ticket.leave()
+                    break
+                if event is None:
+                    break
+                yield event
+        finally:
+            cancelled.set()
+
+    def _generate(self, query, context_results, cache_key, events, cancelled, ticket):
+        """
+        后台线程：经调度器排队后构建 Context 并调用 LLM，token 放入 events 队列，结束时放入 None。
+        排队超时或超过回答时限时放入 ('notice', ...)，前端只显示检索结果。
+        """
+        stream_generator = None
+        outcome = 'cancelled'
+        queued_at = time.perf_counter()
+        try:
+            # 2. 构建 Context (只访问 HBase，排队期间即可完成)：问题相关的段落，按 token 预算装填
+            with QueryTimings().stage('context'):
+                context = self.build_context(query, context_results)
+            logging.info("Context constructed. Waiting for an LLM slot...")
+
+            # 排队：位置变化时 (或每隔 QUEUE_HEARTBEAT 秒) 通知前端，同时借此发现客户端已断开
+            queue_deadline = time.monotonic() + min(self.llm_scheduler.queue_timeout, ticket.remaining())
+            reported, reported_at = None, 0.0
+            while not ticket.wait(timeout=0.5):
+                if cancelled.is_set():
+                    return
+                now = time.monotonic()
+                if now >= queue_deadline:
+                    outcome = 'queue_timeout'
+                    if self.llm_scheduler.record_timeout(ticket):
+                        events.put(('notice', {'reason': 'queue_timeout',
+                                               'message': NOTICE_MESSAGES['queue_timeout']}))
+                    return
+                position = ticket.position
+                if position and (position != reported or now - reported_at >= QUEUE_HEARTBEAT):
+                    events.put(('queue', {'position': position}))
+                    reported, reported_at = position, now
+            if cancelled.is_set():
+                return
+            started_at = time.perf_counter()
+            LLM_QUEUE_SECONDS.observe(started_at - queued_at)
+
+            # 3. 调用 LLM 生成回答 (流式)，完整生成后写入缓存
+            logging.info("Generating answer...")
+            stream_generator = self.answer_cache.record(cache_key, self.chain.stream({
+                "context": context,
+                "question": query
+            }))
+            first_token = True
+            for chunk in stream_generator:
+                if first_token:
+                    LLM_TTFT_SECONDS.observe(time.perf_counter() - started_at)
+                    first_token = False
+                if ticket.expired():
+                    outcome = 'deadline'
+                    if self.llm_scheduler.record_timeout(ticket):
+                        events.put(('notice', {'reason': 'deadline', 'message': NOTICE_MESSAGES['deadline']}))
+                    break
+                if cancelled.is_set():
+                    break
+                if chunk:
+                    events.put(('token', chunk))
+            else:
+                outcome = 'answered'
+                LLM_GENERATION_SECONDS.observe(time.perf_counter() - started_at)
+        except Exception as e:
+            outcome = 'error'
+            logging.error(f"Answer generation error: {e}")
+            events.put(('error', str(e)))
+        finally:
+            if outcome == 'cancelled' and ticket.timed_out:
+                # 转发端已按时限截断
+                outcome = 'deadline'
+            LLM_OUTCOMES.inc(outcome=outcome)
+            # 中途停止时关闭生成器 (同时断开与 Ollama 的连接，Ollama 随之停止生成)，不完整的回答不会写入缓存
+            if stream_generator is not None:
+                stream_generator.close()
+            ticket.leave()
+            events.put(None)
+
+    @staticmethod
+    def _source_info(res):
+        if res.get('type') == 'file':
+            return f"类型: 文档 | 来源页面: {res.get('parent_url', '未知')}"
+        files_count = len(res.get('file_paths', []))
+        return f"类型: 网页 (含 {files_count} 个附件) | URL: {res['url']}"
+
+    def build_context(self, query, context_results):
+        """
+        从排名靠前的文档中选出与问题最相关的段落 (etl/build_passage_index.py 建立的段落索引)，
+        按相关度依次装入 self.context_tokens 的预算，超出预算的段落跳过；
+        输出时按文档排名分组，同一文档的段落按原文顺序排列，并注明来源。
+        段落索引不可用时退回使用各文档的摘要 (同样受预算限制)。
+        """
+        if not context_results:
+            return "没有找到相关参考资料。"
+
+        passages = self.search_engine.search_passages(query, [r['doc_id'] for r in context_results])
+        if not passages:
+            # 摘要可能尚未由 stream_answer 读取
+            self.search_engine.fill_snippets([r for r in context_results if not r.get('snippet')])
+            passages = [{'passage_id': f"{r['doc_id']}#0000", 'doc_id': r['doc_id'], 'text': r.get('snippet', '')}
+                        for r in context_results if r.get('snippet')]
+
+        results_by_id = {r['doc_id']: r for r in context_results}
+        selected = {}  # doc_id -> [passage, ...]
+        used = 0
+        for passage in passages:
+            res = results_by_id.get(passage['doc_id'])
+            if res is None:
+                continue
+            cost = estimate_tokens(passage['text'])
+            if passage['doc_id'] not in selected:
+                cost += estimate_tokens(res['title']) + estimate_tokens(self._source_info(res)) + 10
+            if used + cost > self.context_tokens:
+                continue
+            used += cost
+            selected.setdefault(passage['doc_id'], []).append(passage)
+
+        if not selected:
+            return "没有找到相关参考资料。"
+
+        context_parts = []
+        for res in context_results:
+            doc_passages = selected.get(res['doc_id'])
+            if not doc_passages:
+                continue
+            doc_passages.sort(key=lambda p: p['passage_id'])
+            content = "\n……\n".join(p['text'] for p in doc_passages)
+            context_parts.append(
+                f"【资料 {len(context_parts) + 1}】\n标题: {res['title']}\n{self._source_info(res)}\n内容: {content}")
+        logging.info(f"Context: {len(context_parts)} sources, "
+                     f"{sum(len(v) for v in selected.values())} passages, ~{used} tokens")
+        return "\n\n".join(context_parts)
 
     def close(self):
         self.search_engine.close()
@@ -0,0 +1,44 @@
+# serve.py
+"""
+生产模式启动 Web 服务：多线程 WSGI 服务器 waitress 代替 Flask 开发服务器 (app.run)
+
+    python serve.py --host 0.0.0.0 --port 5000 --threads 32
+
+- 每个请求一个工作线程；检索阶段从 HBase 连接池 (HBASE_POOL_SIZE) 借用独立连接，
+  LLM 流式输出期间不占用 HBase 连接，其他请求照常检索、下载附件
+- 同时进行中的 /api/search 数量由 RAG_MAX_CONCURRENT_SEARCHES 限制 (见 app.py)，
+  线程数应大于该值，给附件下载与静态文件留出线程
+"""
+import argparse
+import logging
+
+from waitress import serve
+
+from app import app, MAX_CONCURRENT_SEARCHES
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the search app with a multi-threaded WSGI server')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=MAX_CONCURRENT_SEARCHES + 8,
+                        help='worker threads (default: RAG_MAX_CONCURRENT_SEARCHES + 8)')
+    parser.add_argument('--connection-limit', type=int, default=200)
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    logging.info(f"Serving on http://{args.host}:{args.port} with {args.threads} threads")
+    serve(
+        app,
+        host=args.host,
+        port=args.port,
+        threads=args.threads,
+        connection_limit=args.connection_limit,
+        channel_timeout=300,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,8 @@
     let filteredResults = [];
     let currentPage = 1;
     let currentEventSource = null;
+    // 服务端过滤条件 (随 /api/search 请求发送，候选在服务端按位图过滤)
+    let activeFilters = { project: [], type: null, year: null };
 
     const previewModal = document.getElementById('previewModal');
     const previewFrame = document.getElementById('previewFrame');
@@ -95,19 +97,20 @@
     }
 
     function buildPreviewLink(doc) {
-        const origin = window.location.origin;
         const url = doc.fileUrl || doc.url || '';
         const ext = (url.split('.').pop() || '').toLowerCase();
         const isPage = doc.type === 'web' || ['html', 'htm'].includes(ext);
         if (isPage) return doc.url || url;
         if (!url) return '';
-        const base = url.startsWith('http') ? url : `${origin}/file/${url}`;
-        
+        // 本地附件走 /preview：优先返回预计算的轻量预览 (首页文本 + 缩略图)，
+        // 没有预览时由服务端回退到原文件或 Office Online Viewer
+        if (!url.startsWith('http')) return `/preview?path=${encodeURIComponent(url)}`;
+
         // 使用微软 Office Online Viewer (需要公网访问)
         if (['doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx'].includes(ext)) {
-            return `https://view.officeapps.live.com/op/embed.aspx?src=${encodeURIComponent(base)}`;
+            return `https://view.officeapps.live.com/op/embed.aspx?src=${encodeURIComponent(url)}`;
         }
-        return base;
+        return url;
     }
 
     function buildDownloadLink(doc) {
@@ -208,11 +211,12 @@
 
             const card = document.createElement('div');
             card.className = 'doc-card';
+            card.dataset.docId = doc.doc_id || '';
             card.innerHTML = `
                 <div class="detail-panel">
                     <div class="detail-content">
                         <h4>📄 内容摘要</h4>
-                        <p>${escapeHTML(doc.snippet || '暂无摘要内容...')}</p>
+                        <p class="detail-snippet">${escapeHTML(doc.snippet || '暂无摘要内容...')}</p>
                         <br>
                         <h4>🔗 原始链接</h4>
                         <p class="detail-link">${escapeHTML(doc.url || '')}</p>
@@ -285,9 +289,66 @@
         applyFilters();
     }
 
-    function search() {
+    function buildSearchUrl(query) {
+        const params = new URLSearchParams({ q: query });
+        activeFilters.project.forEach(p => params.append('project', p));
+        if (activeFilters.type) params.set('type', activeFilters.type);
+        if (activeFilters.year) { params.set('from', activeFilters.year); params.set('to', activeFilters.year); }
+        return `/api/search?${params.toString()}`;
+    }
+
+    const FACET_GROUPS = [
+        { key: 'project', label: '来源', icon: 'fa-building-columns' },
+        { key: 'type', label: '类型', icon: 'fa-layer-group', names: { web: '网页', file: '附件' } },
+        { key: 'year', label: '年份', icon: 'fa-calendar' },
+    ];
+
+    function isFacetActive(key, value) {
+        return key === 'project' ? activeFilters.project.includes(value) : activeFilters[key] === value;
+    }
+
+    function toggleFacet(key, value) {
+        if (key === 'project') {
+            const i = activeFilters.project.indexOf(value);
+            if (i >= 0) activeFilters.project.splice(i, 1); else activeFilters.project.push(value);
+        } else {
+            activeFilters[key] = activeFilters[key] === value ? null : value;
+        }
+        search(true);
+    }
+
+    function renderFacets(facets) {
+        const container = document.getElementById('facetFilters');
+        container.innerHTML = '';
+        FACET_GROUPS.forEach(group => {
+            const values = facets[group.key] || [];
+            // 已选中但本次没有候选的值也要显示，方便取消
+            const shown = values.slice();
+            const selected = group.key === 'project' ? activeFilters.project : (activeFilters[group.key] ? [activeFilters[group.key]] : []);
+            selected.forEach(v => { if (!shown.some(([value]) => value === v)) shown.push([v, 0]); });
+            if (!shown.length) return;
+
+            const wrapper = document.createElement('div');
+            wrapper.className = 'filter-group';
+            wrapper.innerHTML = `<label><i class="fa ${group.icon}"></i> ${group.label}</label><div class="type-options"></div>`;
+            const options = wrapper.querySelector('.type-options');
+            shown.forEach(([value, count]) => {
+                const chip = document.createElement('span');
+                chip.className = 'type-chip facet-chip' + (isFacetActive(group.key, value) ? ' active' : '');
+                const name = (group.names && group.names[value]) || value;
+                chip.innerHTML = `${escapeHTML(String(name))} <span class="facet-count">${count}</span>`;
+                chip.addEventListener('click', () => toggleFacet(group.key, value));
+                options.appendChild(chip);
+            });
+            container.appendChild(wrapper);
+        });
+    }
+
+    function search(keepFilters) {
         const query = document.getElementById('query').value.trim();
         if (!query) return;
+        // 新的查询清空过滤条件；点击分面时保留
+        if (keepFilters !== true) activeFilters = { project: [], type: null, year: null };
         const resultSection = document.getElementById('resultSection');
         const docList = document.getElementById('docList');
         const loading = document.getElementById('loading');
@@ -300,7 +361,7 @@
 
         if (currentEventSource) currentEventSource.close();
 
-        const eventSource = new EventSource(`/api/search?q=${encodeURIComponent(query)}`);
+        const eventSource = new EventSource(buildSearchUrl(query));
         currentEventSource = eventSource;
 
         eventSource.addEventListener('results', function(e) {
@@ -346,12 +407,52 @@
             saveHistory(query);
         });
 
+        eventSource.addEventListener('facets', function(e) {
+            renderFacets(JSON.parse(e.data || '{}'));
+        });
+
+        // 摘要在结果列表之后分批到达：更新数据并直接替换当前页卡片中的文字，不重新渲染
+        eventSource.addEventListener('snippets', function(e) {
+            const snippets = JSON.parse(e.data || '{}');
+            allResults.forEach(doc => {
+                if (doc.doc_id && snippets[doc.doc_id] !== undefined) doc.snippet = snippets[doc.doc_id];
+            });
+            document.querySelectorAll('#docList .doc-card').forEach(card => {
+                const snippet = snippets[card.dataset.docId];
+                const p = card.querySelector('.detail-snippet');
+                if (snippet !== undefined && p) p.textContent = snippet || '暂无摘要内容...';
+            });
+        });
+
+        // AI 回答排队中：显示排队位置，收到第一个 token 时替换
+        let queueHint = false;
+        eventSource.addEventListener('queue', function(e) {
+            const info = JSON.parse(e.data || '{}');
+            if (aiContent.textContent && !queueHint) return;
+            aiContent.textContent = `⏳ AI 助手繁忙，正在排队（前面还有 ${Math.max(0, (info.position || 1) - 1)} 个请求）…`;
+            queueHint = true;
+            setAIOpen(true);
+        });
+
         eventSource.addEventListener('token', function(e) {
             const token = JSON.parse(e.data);
+            if (queueHint) {
+                aiContent.textContent = '';
+                queueHint = false;
+            }
             aiContent.textContent += token;
             setAIOpen(true);
         });
 
+        // 过载 / 超时：不生成 (或截断) 回答，检索结果照常显示
+        eventSource.addEventListener('notice', function(e) {
+            const info = JSON.parse(e.data || '{}');
+            if (queueHint || !aiContent.textContent) aiContent.textContent = info.message || '';
+            else aiContent.textContent += `\n${info.message || ''}`;
+            queueHint = false;
+            setAIOpen(true);
+        });
+
         eventSource.addEventListener('done', function() {
             eventSource.close();
             searchBtn.disabled = false;
@@ -372,6 +473,74 @@
 
     window.search = search;
 
+    // 自动补全：输入停顿 80ms 后请求 /api/suggest，上下键选择，回车搜索
+    const queryInput = document.getElementById('query');
+    const suggestList = document.getElementById('suggestList');
+    let suggestTimer = null;
+    let suggestSeq = 0;
+    let activeIndex = -1;
+
+    function hideSuggestions() {
+        suggestList.classList.remove('show');
+        suggestList.innerHTML = '';
+        activeIndex = -1;
+    }
+
+    function renderSuggestions(items) {
+        suggestList.innerHTML = '';
+        activeIndex = -1;
+        items.forEach(term => {
+            const li = document.createElement('li');
+            li.textContent = term;
+            li.addEventListener('mousedown', e => {
+                e.preventDefault();
+                queryInput.value = term;
+                hideSuggestions();
+                search();
+            });
+            suggestList.appendChild(li);
+        });
+        suggestList.classList.toggle('show', items.length > 0);
+    }
+
+    function fetchSuggestions() {
+        const prefix = queryInput.value.trim();
+        if (!prefix) { hideSuggestions(); return; }
+        const seq = ++suggestSeq;
+        fetch(`/api/suggest?q=${encodeURIComponent(prefix)}`)
+            .then(r => r.ok ? r.json() : { suggestions: [] })
+            .then(data => {
+                // 只显示最新一次输入的结果
+                if (seq !== suggestSeq || queryInput.value.trim() !== prefix) return;
+                renderSuggestions((data.suggestions || []).filter(t => t !== prefix));
+            })
+            .catch(() => hideSuggestions());
+    }
+
+    queryInput.addEventListener('input', () => {
+        clearTimeout(suggestTimer);
+        suggestTimer = setTimeout(fetchSuggestions, 80);
+    });
+
+    queryInput.addEventListener('keydown', e => {
+        const items = suggestList.querySelectorAll('li');
+        if ((e.key === 'ArrowDown' || e.key === 'ArrowUp') && items.length) {
+            e.preventDefault();
+            activeIndex = (activeIndex + (e.key === 'ArrowDown' ? 1 : -1) + items.length + 1) % (items.length + 1) - 1;
+            items.forEach((li, i) => li.classList.toggle('active', i === activeIndex));
+            if (activeIndex >= 0) queryInput.value = items[activeIndex].textContent;
+        } else if (e.key === 'Enter') {
+            clearTimeout(suggestTimer);
+            suggestSeq++;
+            hideSuggestions();
+            search();
+        } else if (e.key === 'Escape') {
+            hideSuggestions();
+        }
+    });
+
+    queryInput.addEventListener('blur', () => setTimeout(hideSuggestions, 100));
+
     document.querySelectorAll('#typeOptions input').forEach(cb => cb.addEventListener('change', handleTypeChange));
     renderHistory();
 })();
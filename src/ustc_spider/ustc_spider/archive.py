@@ -0,0 +1,201 @@
+# archive.py
+"""
+原始网页归档 (类 WARC 的追加写分段文件 + 偏移索引)
+
+HBase 中不保存原始 HTML (html_content 为空)，以前每次改进正文抽取或关键词提取都要全站重爬。
+现在下载到的 HTML 响应原样压缩归档，之后可用 `scrapy reprocess universal_spider` 从本地回放，
+重新走一遍解析与管道，速度只受磁盘限制。
+
+目录结构 (ARCHIVE_DIR):
+    segment-00001.warcz ...   追加写的分段文件，超过 segment_size 后滚动到下一个
+    index.sqlite3             row_key (URL 的 MD5，与 HBase RowKey 相同) -> 段号、偏移、长度
+
+每条记录独立压缩，可按偏移随机读取：
+    'UAR1' | 压缩方式 1 字节 (z=zlib, s=zstd) | 压缩后长度 uint32 | 压缩数据
+压缩数据解压后为: JSON 元信息 (url, status, headers, fetched_at) + '\n' + 响应体
+
+zstd 需要安装 zstandard 包 (可选)，默认使用标准库 zlib。不依赖 Scrapy。
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖
+    zstandard = None
+
+_MAGIC = b'UAR1'
+_RECORD_HEADER = struct.Struct('<4scI')
+INDEX_FILENAME = 'index.sqlite3'
+SEGMENT_PATTERN = 'segment-{:05d}.warcz'
+
+
+def row_key_for(url):
+    """与 HBasePipeline 一致的 RowKey：URL 的 MD5。"""
+    return hashlib.md5(url.encode('utf-8')).hexdigest()
+
+
+class ResponseArchive:
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS records (
+        row_key    TEXT PRIMARY KEY,
+        url        TEXT NOT NULL,
+        segment    INTEGER NOT NULL,
+        offset     INTEGER NOT NULL,
+        length     INTEGER NOT NULL,
+        status     INTEGER,
+        fetched_at REAL
+    );
+    CREATE INDEX IF NOT EXISTS records_position ON records (segment, offset);
+    """
+
+    def __init__(self, directory, segment_size=256 * 1024 * 1024, compression='zlib', level=6, readonly=False):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.readonly = readonly
+        if compression == 'zstd' and zstandard is None:
+            logging.warning("[Archive] zstandard is not installed, falling back to zlib")
+            compression = 'zlib'
+        self.compression = compression
+        self.level = level
+        self._compressor = zstandard.ZstdCompressor(level=level) if compression == 'zstd' else None
+
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(directory, INDEX_FILENAME), check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(self.SCHEMA)
+        self.db.commit()
+        self._lock = threading.Lock()
+        self._readers = {}
+        self._dirty = 0
+
+        self._segment = None
+        self._file = None
+        if not readonly:
+            existing = self._segments()
+            self._open_segment(existing[-1] if existing else 1)
+
+    # ---------- 段文件 ----------
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, SEGMENT_PATTERN.format(segment))
+
+    def _segments(self):
+        numbers = []
+        for name in os.listdir(self.directory):
+            if name.startswith('segment-') and name.endswith('.warcz'):
+                numbers.append(int(name[len('segment-'):-len('.warcz')]))
+        return sorted(numbers)
+
+    def _open_segment(self, segment):
+        if self._file:
+            self._file.close()
+        self._segment = segment
+        self._file = open(self._segment_path(segment), 'ab')
+
+    # ---------- 写入 ----------
+    def _compress(self, data):
+        if self._compressor:
+            return b's', self._compressor.compress(data)
+        return b'z', zlib.compress(data, self.level)
+
+    def append(self, url, status, headers, body, row_key=None):
+        """
+        追加一条响应记录。headers 为 {name: [value, ...]} (str)。
+        同一 row_key 再次归档时索引指向最新的记录，旧记录留在段文件中。
+        """
+        row_key = row_key or row_key_for(url)
+        meta = json.dumps({'url': url, 'status': status, 'headers': headers, 'fetched_at': time.time()},
+                          ensure_ascii=False).encode('utf-8')
+        codec, payload = self._compress(meta + b'\n' + body)
+        record = _RECORD_HEADER.pack(_MAGIC, codec, len(payload)) + payload
+
+        with self._lock:
+            if self._file.tell() and self._file.tell() + len(record) > self.segment_size:
+                self._open_segment(self._segment + 1)
+            offset = self._file.tell()
+            self._file.write(record)
+            self.db.execute(
+                'INSERT OR REPLACE INTO records (row_key, url, segment, offset, length, status, fetched_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (row_key, url, self._segment, offset, len(record), status, time.time()))
+            self._dirty += 1
+            if self._dirty >= 200:
+                self._flush_locked()
+        return self._segment, offset
+
+    def _flush_locked(self):
+        # 先落盘数据再提交索引，索引中的偏移总是指向完整的记录
+        self._file.flush()
+        self.db.commit()
+        self._dirty = 0
+
+    # ---------- 读取 ----------
+    def _read_at(self, segment, offset, length):
+        f = self._readers.get(segment)
+        if f is None:
+            f = self._readers[segment] = open(self._segment_path(segment), 'rb')
+        f.seek(offset)
+        data = f.read(length)
+        magic, codec, size = _RECORD_HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError(f"Corrupt archive record at segment {segment} offset {offset}")
+        payload = data[_RECORD_HEADER.size:_RECORD_HEADER.size + size]
+        if codec == b's':
+            if zstandard is None:
+                raise RuntimeError("Record is zstd-compressed but zstandard is not installed")
+            raw = zstandard.ZstdDecompressor().decompress(payload)
+        else:
+            raw = zlib.decompress(payload)
+        meta, _, body = raw.partition(b'\n')
+        record = json.loads(meta)
+        record['body'] = body
+        return record
+
+    def get(self, row_key):
+        """返回 dict(url, status, headers, fetched_at, body)，不存在返回 None。"""
+        with self._lock:
+            row = self.db.execute('SELECT segment, offset, length FROM records WHERE row_key = ?',
+                                  (row_key,)).fetchone()
+            if not row:
+                return None
+            if not self.readonly and row[0] == self._segment:
+                self._file.flush()
+            return self._read_at(*row)
+
+    def keys(self, since=None, limit=None):
+        """按段号、偏移顺序返回 [(row_key, url)]，回放时基本是顺序读盘。"""
+        sql = 'SELECT row_key, url FROM records'
+        params = []
+        if since is not None:
+            sql += ' WHERE fetched_at >= ?'
+            params.append(since)
+        sql += ' ORDER BY segment, offset'
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        with self._lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def __len__(self):
+        with self._lock:
+            return self.db.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._flush_locked()
+                self._file.close()
+                self._file = None
+            for f in self._readers.values():
+                f.close()
+            self._readers.clear()
+            self.db.commit()
+            self.db.close()
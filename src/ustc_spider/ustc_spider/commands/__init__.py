@@ -0,0 +1 @@
+# 自定义 scrapy 命令 (settings.py 中 COMMANDS_MODULE = 'ustc_spider.commands')
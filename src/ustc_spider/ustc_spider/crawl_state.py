@@ -0,0 +1,190 @@
+# crawl_state.py
+"""
+跨爬取轮次的页面状态库 (SQLite)
+
+按 URL 记录：
+- etag / last_modified: 服务器返回的缓存校验字段，用于下次发送条件请求
+- fingerprint:          规范化正文的指纹，用于判断页面内容是否真的变化
+- fetched_at / changed_at / fetch_count / change_count: 抓取与变化统计
+- simhash:              正文 SimHash，供近似重复检测跨轮次复用 (表 simhashes)
+- indexed_words:        流式索引为每个文档写过 posting 的关键词，页面更新时据此删除旧 posting
+
+中间件与各个管道通过 CrawlStateStore.from_settings() 共享同一个实例。
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def content_fingerprint(title, text, file_urls=()):
+    """规范化 (去除所有空白) 后的 标题 + 正文 + 附件链接 的 SHA1。"""
+    h = hashlib.sha1()
+    h.update(_WHITESPACE_RE.sub('', title or '').encode('utf-8'))
+    h.update(b'\x00')
+    h.update(_WHITESPACE_RE.sub('', text or '').encode('utf-8'))
+    for url in sorted(file_urls or ()):
+        h.update(b'\x00')
+        h.update(url.encode('utf-8'))
+    return h.hexdigest()
+
+
+class CrawlStateStore:
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS pages (
+        url           TEXT PRIMARY KEY,
+        etag          TEXT,
+        last_modified TEXT,
+        fingerprint   TEXT,
+        fetched_at    REAL,
+        changed_at    REAL,
+        fetch_count   INTEGER DEFAULT 0,
+        change_count  INTEGER DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS simhashes (
+        url  TEXT PRIMARY KEY,
+        hash INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS indexed_words (
+        doc_id TEXT PRIMARY KEY,
+        words  TEXT NOT NULL
+    );
+    """
+
+    def __init__(self, path, commit_every=200):
+        self.path = path
+        self.commit_every = commit_every
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(self.SCHEMA)
+        self.db.commit()
+        self._lock = threading.Lock()
+        self._dirty = 0
+        self._refs = 0
+
+    @classmethod
+    def from_settings(cls, settings):
+        """同一路径只打开一次；调用方用完后需调用 release()。"""
+        path = settings.get('CRAWL_STATE_PATH')
+        with _stores_lock:
+            store = _stores.get(path)
+            if store is None:
+                store = _stores[path] = cls(path)
+                logging.info(f"[CrawlState] Opened {path}")
+            store._refs += 1
+            return store
+
+    def get(self, url):
+        """返回 dict (不存在时为 None)。"""
+        with self._lock:
+            cur = self.db.execute(
+                'SELECT etag, last_modified, fingerprint, fetched_at, changed_at, fetch_count, change_count '
+                'FROM pages WHERE url = ?', (url,))
+            row = cur.fetchone()
+        if not row:
+            return None
+        keys = ('etag', 'last_modified', 'fingerprint', 'fetched_at', 'changed_at', 'fetch_count', 'change_count')
+        return dict(zip(keys, row))
+
+    def get_change_stats(self, urls):
+        """批量查询，返回 {url: (fetch_count, change_count)}，未抓取过的 URL 不在结果中。"""
+        urls = list(urls)
+        result = {}
+        with self._lock:
+            # SQLite 默认最多 999 个绑定参数
+            for start in range(0, len(urls), 500):
+                chunk = urls[start:start + 500]
+                cur = self.db.execute(
+                    f'SELECT url, fetch_count, change_count FROM pages WHERE url IN ({",".join("?" * len(chunk))})',
+                    chunk)
+                for url, fetch_count, change_count in cur:
+                    result[url] = (fetch_count or 0, change_count or 0)
+        return result
+
+    def get_fetch_times(self, urls):
+        """批量查询，返回 {url: fetched_at}，未抓取过的 URL 不在结果中 (站点地图发现时与 lastmod 比较)。"""
+        urls = list(urls)
+        result = {}
+        with self._lock:
+            for start in range(0, len(urls), 500):
+                chunk = urls[start:start + 500]
+                cur = self.db.execute(
+                    f'SELECT url, fetched_at FROM pages WHERE url IN ({",".join("?" * len(chunk))})', chunk)
+                for url, fetched_at in cur:
+                    if fetched_at:
+                        result[url] = fetched_at
+        return result
+
+    def record_not_modified(self, url):
+        """服务器返回 304。"""
+        self._execute('UPDATE pages SET fetched_at = ?, fetch_count = fetch_count + 1 WHERE url = ?',
+                      (time.time(), url))
+
+    def record_unchanged(self, url, etag, last_modified):
+        """200 但指纹未变：只刷新校验字段。"""
+        self._execute(
+            'UPDATE pages SET etag = ?, last_modified = ?, fetched_at = ?, fetch_count = fetch_count + 1 '
+            'WHERE url = ?', (etag, last_modified, time.time(), url))
+
+    def record_changed(self, url, etag, last_modified, fingerprint):
+        """新页面或内容已变化，且该行已提交到 HBase (只进入写缓冲时不能调用)。"""
+        now = time.time()
+        self._execute(
+            'INSERT INTO pages (url, etag, last_modified, fingerprint, fetched_at, changed_at, fetch_count, change_count) '
+            'VALUES (?, ?, ?, ?, ?, ?, 1, 1) '
+            'ON CONFLICT(url) DO UPDATE SET etag = excluded.etag, last_modified = excluded.last_modified, '
+            'fingerprint = excluded.fingerprint, fetched_at = excluded.fetched_at, '
+            'changed_at = excluded.changed_at, fetch_count = fetch_count + 1, change_count = change_count + 1',
+            (url, etag, last_modified, fingerprint, now, now))
+
+    def load_simhashes(self):
+        """返回 [(url, simhash)]，simhash 为无符号 64 位整数。"""
+        with self._lock:
+            rows = self.db.execute('SELECT url, hash FROM simhashes').fetchall()
+        return [(url, h & 0xFFFFFFFFFFFFFFFF) for url, h in rows]
+
+    def record_simhash(self, url, h):
+        # SQLite INTEGER 为有符号 64 位
+        signed = h - (1 << 64) if h >= (1 << 63) else h
+        self._execute('INSERT OR REPLACE INTO simhashes (url, hash) VALUES (?, ?)', (url, signed))
+
+    def get_indexed_words(self, doc_id):
+        """返回上次为该文档写入 posting 的关键词列表；从未流式索引过返回 None。"""
+        with self._lock:
+            row = self.db.execute('SELECT words FROM indexed_words WHERE doc_id = ?', (doc_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def record_indexed_words(self, doc_id, words):
+        self._execute('INSERT OR REPLACE INTO indexed_words (doc_id, words) VALUES (?, ?)',
+                      (doc_id, json.dumps(list(words), ensure_ascii=False)))
+
+    def _execute(self, sql, params):
+        with self._lock:
+            self.db.execute(sql, params)
+            self._dirty += 1
+            if self._dirty >= self.commit_every:
+                self.db.commit()
+                self._dirty = 0
+
+    def release(self):
+        """引用计数归零时提交并关闭。"""
+        with _stores_lock:
+            self._refs -= 1
+            if self._refs > 0:
+                return
+            _stores.pop(self.path, None)
+        with self._lock:
+            self.db.commit()
+            self.db.close()
+        logging.info(f"[CrawlState] Closed {self.path}")
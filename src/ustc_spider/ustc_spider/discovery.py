@@ -0,0 +1,135 @@
+# discovery.py
+"""
+站点地图 / 订阅源发现 (DISCOVERY_ENABLED)
+
+只靠从首页逐层跟进链接 (DEPTH_LIMIT = 2) 会漏掉深层的通知页面，又把大量请求花在导航页上。
+很多学院站点 (博达、WordPress 等 CMS) 提供 sitemap.xml、robots.txt 中的 Sitemap: 条目或 RSS / Atom 订阅源，
+直接列出了全部文章页及其最后修改时间 (lastmod / pubDate / updated)。
+
+这里只负责解析，统一产出 (url, lastmod) 条目，lastmod 为 Unix 时间戳 (缺失时为 None)：
+- sitemaps_from_robots(text):   robots.txt 中的 Sitemap: 地址
+- parse_document(body):         自动识别 <urlset> / <sitemapindex> / RSS / Atom，返回 (kind, entries)
+- feed_links(root):             HTML 页面 <link rel="alternate"> 声明的订阅源
+
+不依赖 Scrapy。
+"""
+import gzip
+import io
+import re
+import time
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+from lxml import etree
+
+# 文档类型
+URLSET = 'urlset'
+SITEMAP_INDEX = 'sitemapindex'
+FEED = 'feed'
+
+# gzip 压缩的站点地图解压后的大小上限 (sitemaps.org 规定单个文件不超过 50 MB)
+MAX_DOCUMENT_BYTES = 50 * 1024 * 1024
+FEED_TYPES = ('application/rss+xml', 'application/atom+xml', 'application/rdf+xml')
+
+_SITEMAP_LINE_RE = re.compile(r'^\s*sitemap\s*:\s*(\S+)', re.IGNORECASE | re.MULTILINE)
+_XML_PARSER = etree.XMLParser(recover=True, resolve_entities=False, no_network=True, huge_tree=False)
+
+
+def parse_lastmod(value):
+    """
+    W3C Datetime (2025-03-01, 2025-03-01T08:00:00+08:00, ...Z) 或 RFC 822 (RSS pubDate) -> 时间戳。
+    无时区时按本地时间处理；无法解析返回 None。
+    """
+    value = (value or '').strip()
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        try:
+            dt = parsedate_to_datetime(value)
+        except (TypeError, ValueError, IndexError):
+            return None
+    if dt.tzinfo is None:
+        return time.mktime(dt.timetuple())
+    return dt.timestamp()
+
+
+def sitemaps_from_robots(text):
+    return _SITEMAP_LINE_RE.findall(text or '')
+
+
+def _local(tag):
+    # 忽略命名空间：{http://www.sitemaps.org/schemas/sitemap/0.9}loc -> loc
+    return tag.rsplit('}', 1)[-1].lower() if isinstance(tag, str) else ''
+
+
+def _child_text(element, *names):
+    for child in element:
+        if _local(child.tag) in names and child.text:
+            return child.text.strip()
+    return ''
+
+
+def _decompress(body):
+    if body[:2] != b'\x1f\x8b':
+        return body
+    with gzip.GzipFile(fileobj=io.BytesIO(body)) as f:
+        data = f.read(MAX_DOCUMENT_BYTES + 1)
+    if len(data) > MAX_DOCUMENT_BYTES:
+        raise ValueError('Decompressed sitemap exceeds MAX_DOCUMENT_BYTES')
+    return data
+
+
+def parse_document(body):
+    """
+    返回 (kind, [(url, lastmod), ...])，kind 为 URLSET / SITEMAP_INDEX / FEED；
+    不是可识别的站点地图或订阅源时返回 (None, [])。
+    """
+    body = _decompress(body)
+    root = etree.fromstring(body, parser=_XML_PARSER) if body.strip() else None
+    if root is None:
+        return None, []
+    kind = _local(root.tag)
+
+    if kind in (URLSET, SITEMAP_INDEX):
+        entries = []
+        for element in root:
+            if _local(element.tag) not in ('url', 'sitemap'):
+                continue
+            loc = _child_text(element, 'loc')
+            if loc:
+                entries.append((loc, parse_lastmod(_child_text(element, 'lastmod'))))
+        return kind, entries
+
+    if kind in ('rss', 'rdf'):
+        entries = []
+        for item in root.iter('{*}item'):
+            link = _child_text(item, 'link') or _child_text(item, 'guid')
+            if link:
+                entries.append((link, parse_lastmod(_child_text(item, 'pubdate', 'date', 'lastbuilddate'))))
+        return FEED, entries
+
+    if kind == 'feed':
+        entries = []
+        for entry in root.iter('{*}entry'):
+            link = ''
+            for child in entry:
+                if _local(child.tag) == 'link' and child.get('rel', 'alternate') == 'alternate' and child.get('href'):
+                    link = child.get('href')
+                    break
+            if link:
+                entries.append((link, parse_lastmod(_child_text(entry, 'updated', 'published'))))
+        return FEED, entries
+
+    return None, []
+
+
+def feed_links(root):
+    """HTML 页面中 <link rel="alternate" type="application/rss+xml" href="..."> 声明的订阅源 (相对地址)。"""
+    hrefs = []
+    for link in root.iter('link'):
+        rel = (link.get('rel') or '').lower().split()
+        if 'alternate' in rel and (link.get('type') or '').lower() in FEED_TYPES and link.get('href'):
+            hrefs.append(link.get('href').strip())
+    return hrefs
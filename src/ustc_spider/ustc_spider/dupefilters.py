@@ -0,0 +1,183 @@
+# dupefilters.py
+"""
+固定内存的持久化请求去重 (Bloom filter)
+
+RFPDupeFilter 把每个请求指纹放进 Python set，内存随爬取规模无限增长，
+且不开 JOBDIR 时进程退出即丢失。BloomDupeFilter 改用定长位数组：
+
+- 位数组大小由 DUPEFILTER_BLOOM_MEMORY_MB 决定，运行期间不再增长
+- 哈希函数个数由 DUPEFILTER_BLOOM_ERROR_RATE 决定 (k = log2(1/p))，
+  该预算下可容纳的指纹数 n = m * ln2^2 / ln(1/p)，超过后误判率逐渐升高 (会打印警告)
+- 位数组放在 mmap 文件中，由操作系统按页换入换出；
+  设置 JOBDIR 时文件为 JOBDIR/requests.bloom，随 Scrapy 的断点续爬一起恢复
+- 也可用 DUPEFILTER_BLOOM_PATH 显式指定文件；两者都没有时使用匿名 mmap (不持久化)
+
+注意：Bloom filter 只会误判"已见过" (极少数新 URL 被跳过)，不会漏判重复。
+"""
+import logging
+import math
+import mmap
+import os
+import struct
+
+from scrapy.dupefilters import BaseDupeFilter
+from scrapy.utils.job import job_dir
+from scrapy.utils.request import referer_str
+
+logger = logging.getLogger(__name__)
+
+# 文件头: magic, 位数组字节数, 哈希个数, 已插入数量, 设计误判率
+_MAGIC = b'USTCBLM1'
+_HEADER = struct.Struct('<8sQIQd')
+_HEADER_SIZE = 64
+
+
+class BloomFilter:
+    """mmap 上的定长 Bloom filter，键为请求指纹 (bytes，至少 16 字节)。"""
+
+    def __init__(self, path=None, memory_bytes=64 * 1024 * 1024, error_rate=1e-4):
+        self.path = path
+        self._file = None
+
+        size = max(1, int(memory_bytes))
+        hashes = max(1, int(round(-math.log2(error_rate))))
+        count = 0
+
+        if path and os.path.exists(path) and os.path.getsize(path) > _HEADER_SIZE:
+            with open(path, 'rb') as f:
+                magic, old_size, old_hashes, old_count, old_rate = _HEADER.unpack(f.read(_HEADER.size))
+            if magic == _MAGIC and os.path.getsize(path) == _HEADER_SIZE + old_size:
+                # 沿用已有文件的参数：改变大小或 k 会让已记录的指纹全部失效
+                if (old_size, old_hashes) != (size, hashes):
+                    logger.warning(f"[Bloom] {path} was created with {old_size / 2 ** 20:.1f} MB / k={old_hashes}, "
+                                   f"keeping those parameters (settings ask for {size / 2 ** 20:.1f} MB / k={hashes})")
+                size, hashes, count, error_rate = old_size, old_hashes, old_count, old_rate
+            else:
+                logger.warning(f"[Bloom] {path} is not a valid bloom file, recreating it")
+                os.remove(path)
+
+        self.size = size
+        self.bits = size * 8
+        self.hashes = hashes
+        self.count = count
+        self.error_rate = error_rate
+        # 在设计误判率下的容量
+        self.capacity = int(self.bits * math.log(2) ** 2 / -math.log(error_rate))
+
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            new = not os.path.exists(path)
+            self._file = open(path, 'w+b' if new else 'r+b')
+            if new:
+                # 稀疏文件：未写入的页不占磁盘
+                self._file.truncate(_HEADER_SIZE + size)
+            self._mm = mmap.mmap(self._file.fileno(), _HEADER_SIZE + size)
+        else:
+            self._mm = mmap.mmap(-1, _HEADER_SIZE + size)
+        self._write_header()
+
+    def _write_header(self):
+        _HEADER.pack_into(self._mm, 0, _MAGIC, self.size, self.hashes, self.count, self.error_rate)
+
+    def _positions(self, key):
+        # 双重哈希 (Kirsch-Mitzenmacher)：指纹本身已是均匀分布的摘要，直接切出两个 64 位整数
+        h1 = int.from_bytes(key[:8], 'little')
+        h2 = int.from_bytes(key[8:16], 'little') | 1
+        bits = self.bits
+        return [(h1 + i * h2) % bits for i in range(self.hashes)]
+
+    def __contains__(self, key):
+        mm = self._mm
+        for pos in self._positions(key):
+            if not mm[_HEADER_SIZE + (pos >> 3)] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def add(self, key):
+        """插入 key，返回插入前是否 (可能) 已存在。"""
+        mm = self._mm
+        present = True
+        for pos in self._positions(key):
+            offset = _HEADER_SIZE + (pos >> 3)
+            mask = 1 << (pos & 7)
+            byte = mm[offset]
+            if not byte & mask:
+                mm[offset] = byte | mask
+                present = False
+        if not present:
+            self.count += 1
+            self._write_header()
+        return present
+
+    def current_error_rate(self):
+        """按已插入数量估算的当前误判率。"""
+        return (1 - math.exp(-self.hashes * self.count / self.bits)) ** self.hashes
+
+    def close(self):
+        if self._mm.closed:
+            return
+        self._write_header()
+        if self._file:
+            self._mm.flush()
+        self._mm.close()
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+class BloomDupeFilter(BaseDupeFilter):
+    """DUPEFILTER_CLASS = 'ustc_spider.dupefilters.BloomDupeFilter'"""
+
+    def __init__(self, path=None, memory_bytes=64 * 1024 * 1024, error_rate=1e-4, debug=False,
+                 fingerprinter=None, stats=None):
+        self.bloom = BloomFilter(path, memory_bytes, error_rate)
+        self.fingerprinter = fingerprinter
+        self.stats = stats
+        self.debug = debug
+        self.logdupes = True
+        self._saturation_warned = False
+        logger.info(f"[Bloom] {path or '(in-memory)'}: {self.bloom.size / 2 ** 20:.1f} MB, k={self.bloom.hashes}, "
+                    f"capacity={self.bloom.capacity} @ p={self.bloom.error_rate:g}, loaded={self.bloom.count}")
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        path = settings.get('DUPEFILTER_BLOOM_PATH')
+        jobdir = job_dir(settings)
+        if jobdir:
+            path = os.path.join(jobdir, 'requests.bloom')
+        return cls(
+            path=path,
+            memory_bytes=int(settings.getfloat('DUPEFILTER_BLOOM_MEMORY_MB', 64) * 1024 * 1024),
+            error_rate=settings.getfloat('DUPEFILTER_BLOOM_ERROR_RATE', 1e-4),
+            debug=settings.getbool('DUPEFILTER_DEBUG'),
+            fingerprinter=crawler.request_fingerprinter,
+            stats=crawler.stats,
+        )
+
+    def request_seen(self, request):
+        seen = self.bloom.add(self.fingerprinter.fingerprint(request))
+        if not seen and not self._saturation_warned and self.bloom.count > self.bloom.capacity:
+            self._saturation_warned = True
+            logger.warning(f"[Bloom] Filter is over capacity ({self.bloom.count} > {self.bloom.capacity}), "
+                           f"false-positive rate is now ~{self.bloom.current_error_rate():.2e}; "
+                           f"increase DUPEFILTER_BLOOM_MEMORY_MB for crawls this large")
+        return seen
+
+    def close(self, reason):
+        if self.stats:
+            self.stats.set_value('dupefilter/bloom_count', self.bloom.count)
+        logger.info(f"[Bloom] Closed: {self.bloom.count} fingerprints, "
+                    f"estimated false-positive rate {self.bloom.current_error_rate():.2e}")
+        self.bloom.close()
+
+    def log(self, request, spider):
+        if self.debug:
+            logger.debug("Filtered duplicate request: %(request)s (referer: %(referer)s)",
+                         {'request': request, 'referer': referer_str(request)}, extra={'spider': spider})
+        elif self.logdupes:
+            logger.debug("Filtered duplicate request: %(request)s - no more duplicates will be shown "
+                         "(see DUPEFILTER_DEBUG to show all duplicates)",
+                         {'request': request}, extra={'spider': spider})
+            self.logdupes = False
+        spider.crawler.stats.inc_value('dupefilter/filtered')
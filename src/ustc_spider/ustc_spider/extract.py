@@ -0,0 +1,200 @@
+# extract.py
+"""
+页面正文抽取 (单次遍历 lxml 树)
+
+原先 parse_item 用 //body//text() 取出全部文本节点 (每个节点包装成一个 Selector)，
+连同 script / style / 导航 / 页脚一起拼接，再截断到 50000 字。这里改为一次 iterwalk：
+
+- 跳过 script、style 等非内容元素的整棵子树
+- nav / footer / aside 以及 class、id 形如 nav、menu、footer、breadcrumb 的区块不计入正文，
+  但其中的附件链接照常收集 (很多学院把"下载中心"放在侧栏)
+- 同一次遍历中取出 标题、正文、发布日期 (meta 优先，其次正文中的"发布时间"等)、附件链接
+- 正文达到 max_chars 后不再累加文本，只继续收集链接与日期
+
+不依赖 Scrapy，只需要 lxml 根节点 (response.selector.root)。
+"""
+import re
+from urllib.parse import urlparse
+
+from lxml import etree
+
+ATTACHMENT_EXTENSIONS = ('.pdf', '.doc', '.docx', '.xls', '.xlsx', '.zip')
+MAX_TEXT_CHARS = 50000
+
+# 整棵子树跳过 (不含正文也不含附件链接)
+SKIP_TAGS = frozenset(['script', 'style', 'noscript', 'template', 'iframe', 'svg', 'select', 'button', 'object'])
+# 不计入正文的样板区块
+BOILERPLATE_TAGS = frozenset(['nav', 'footer', 'aside', 'form'])
+BOILERPLATE_TOKENS = frozenset(['nav', 'navbar', 'navigation', 'menu', 'submenu', 'footer', 'foot',
+                                'breadcrumb', 'breadcrumbs', 'crumb', 'crumbs', 'sidebar', 'copyright', 'topbar'])
+# 块级元素：前后插入换行，避免相邻段落的英文单词粘连
+BLOCK_TAGS = frozenset(['p', 'div', 'br', 'li', 'tr', 'td', 'th', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+                        'table', 'ul', 'ol', 'section', 'article', 'dd', 'dt', 'pre', 'blockquote'])
+# 发布日期的 meta 字段 (博达等 CMS 用 PubDate，新闻类页面用 article:published_time)
+DATE_META_NAMES = frozenset(['pubdate', 'publishdate', 'publish_date', 'article:published_time', 'date', 'dc.date'])
+
+_TOKEN_SPLIT_RE = re.compile(r'[\s_\-]+')
+_DATE_RE = re.compile(r'((?:19|20)\d{2})\s*[-/.年]\s*(\d{1,2})\s*[-/.月]\s*(\d{1,2})')
+_LABELED_DATE_RE = re.compile(r'(?:发布|发表|更新)?(?:时间|日期)\s*[:：]?\s*' + _DATE_RE.pattern)
+_NEWLINES_RE = re.compile(r'\n{2,}')
+# 正文中没有"发布时间"字样时，只在开头这么多字内找日期 (更靠后的多半是正文提到的日期)
+DATE_SEARCH_CHARS = 3000
+
+
+def _normalize_date(year, month, day):
+    month, day = int(month), int(day)
+    if 1 <= month <= 12 and 1 <= day <= 31:
+        return f"{year}-{month:02d}-{day:02d}"
+    return ''
+
+
+def find_date(text, limit=DATE_SEARCH_CHARS):
+    """从文本中提取发布日期，返回 'YYYY-MM-DD'，找不到返回空字符串。"""
+    if not text:
+        return ''
+    for regex, haystack in ((_LABELED_DATE_RE, text), (_DATE_RE, text[:limit])):
+        for m in regex.finditer(haystack):
+            date = _normalize_date(*m.groups())
+            if date:
+                return date
+    return ''
+
+
+def _is_boilerplate(el):
+    if el.tag in BOILERPLATE_TAGS:
+        return True
+    for attr in ('class', 'id'):
+        value = el.get(attr)
+        if value and not BOILERPLATE_TOKENS.isdisjoint(_TOKEN_SPLIT_RE.split(value.lower())):
+            return True
+    return False
+
+
+def _ascii_word_char(ch):
+    return ch.isascii() and ch.isalnum()
+
+
+def _is_attachment(href):
+    path = href.split('#', 1)[0].split('?', 1)[0].lower()
+    return path.endswith(ATTACHMENT_EXTENSIONS)
+
+
+def extract_page(root, urljoin, max_chars=MAX_TEXT_CHARS):
+    """
+    单次遍历抽取页面内容。
+
+    root:    lxml 根元素 (response.selector.root)
+    urljoin: 把相对链接转为绝对链接的函数 (response.urljoin，会处理 <base>)
+    返回 dict: title, text, date, file_urls
+    """
+    title = ''
+    meta_date = ''
+    pieces = []
+    length = 0
+    file_urls = []
+    seen_urls = set()
+
+    in_body = False
+    quiet = []  # 当前所在的样板区块 (栈)
+
+    def add_text(value):
+        nonlocal length
+        if value and in_body and not quiet and length < max_chars:
+            value = value.strip()
+            if value:
+                # 相邻文本节点直接拼接 (中文不需要空格)，两侧都是英文字母/数字时补一个空格
+                if pieces and _ascii_word_char(pieces[-1][-1]) and _ascii_word_char(value[0]):
+                    pieces.append(' ')
+                pieces.append(value)
+                length += len(value)
+
+    def add_break():
+        if pieces and pieces[-1] != '\n':
+            pieces.append('\n')
+
+    walker = etree.iterwalk(root, events=('start', 'end', 'comment', 'pi'))
+    for event, el in walker:
+        if event == 'comment' or event == 'pi':
+            # 注释 / 处理指令：内容丢弃，尾随文本照常保留
+            add_text(el.tail)
+            continue
+
+        tag = el.tag
+        if event == 'start':
+            if tag in SKIP_TAGS:
+                # 子树不再遍历，但仍会收到该元素的 end 事件 (尾随文本在那里处理)
+                walker.skip_subtree()
+                continue
+            if tag == 'body':
+                in_body = True
+            elif tag == 'title':
+                if not title:
+                    title = (el.text or '').strip()
+                continue
+            elif tag == 'meta':
+                if not meta_date:
+                    name = (el.get('name') or el.get('property') or '').lower()
+                    if name in DATE_META_NAMES:
+                        meta_date = find_date(el.get('content') or '')
+                continue
+            elif tag == 'a':
+                href = el.get('href')
+                if href and _is_attachment(href):
+                    url = urljoin(href.strip())
+                    if url not in seen_urls:
+                        seen_urls.add(url)
+                        file_urls.append(url)
+
+            if in_body and _is_boilerplate(el):
+                quiet.append(el)
+            if tag in BLOCK_TAGS:
+                add_break()
+            add_text(el.text)
+        else:
+            if quiet and quiet[-1] is el:
+                quiet.pop()
+            if tag in BLOCK_TAGS:
+                add_break()
+            if tag == 'body':
+                in_body = False
+            else:
+                add_text(el.tail)
+
+    text = _NEWLINES_RE.sub('\n', ''.join(pieces)).strip()[:max_chars]
+    return {
+        'title': title,
+        'text': text,
+        'date': meta_date or find_date(text),
+        'file_urls': file_urls,
+    }
+
+
+class DomainProjectMap:
+    """
+    域名 -> 项目 (学院) 名 的后缀查找表。
+
+    由 sites.yaml 预先构建；查询时从完整主机名开始逐级去掉最左侧的标签，
+    例如 www.cs.ustc.edu.cn -> cs.ustc.edu.cn -> ustc.edu.cn，命中即返回。
+    """
+
+    def __init__(self, project_configs=()):
+        self._domains = {}
+        for config in project_configs or ():
+            domain = urlparse(config['url']).netloc.lower()
+            # 与原先按配置顺序匹配一致：同一域名以第一次出现的为准
+            self._domains.setdefault(domain, config['name'])
+        self._cache = {}
+
+    def lookup(self, url, default='unknown'):
+        netloc = urlparse(url).netloc.lower()
+        project = self._cache.get(netloc)
+        if project is None:
+            project = default
+            candidate = netloc
+            while candidate:
+                if candidate in self._domains:
+                    project = self._domains[candidate]
+                    break
+                _, _, candidate = candidate.partition('.')
+            self._cache[netloc] = project
+        return project
@@ -0,0 +1,180 @@
+# filestore.py
+"""
+内容寻址的附件存储 (content-addressed store)
+
+目录结构 (均位于 FILES_STORE 下):
+    objects/ab/cd/abcd...<sha256>.pdf   实际文件，按 SHA-256 分两级目录
+    previews/ab/cd/abcd...<sha256>.txt  预览 (首页文本)，.png 为首页缩略图 (etl/build_previews.py 生成)
+    <project>/<文件名>                   友好路径，硬链接到 objects 中的对象 (HBase files:path 中存的就是它)
+    index.sqlite3                       索引
+
+索引记录三张表：
+- objects: sha256 -> 扩展名、大小
+- urls:    附件 URL -> sha256、最近下载时间 (已知 URL 不再重复下载)
+- paths:   友好路径 -> sha256 (Web 端 /file、/download 通过它定位对象)
+
+同一文件被多个学院链接时只下载、只存储一次，各学院目录下只是多一个链接；
+不同内容但同名的文件 (附件1.pdf、download.pdf) 使用 "文件名_哈希前8位" 的友好路径，互不覆盖。
+
+不依赖 Scrapy，Web 服务 (rag/app.py) 直接复用。
+"""
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+OBJECTS_DIR = 'objects'
+PREVIEWS_DIR = 'previews'
+INDEX_FILENAME = 'index.sqlite3'
+
+
+def object_relpath(sha256, ext=''):
+    """对象相对 FILES_STORE 的路径 (使用 '/' 分隔，与 FilesPipeline 的路径约定一致)。"""
+    return f'{OBJECTS_DIR}/{sha256[:2]}/{sha256[2:4]}/{sha256}{ext}'
+
+
+def preview_relpath(sha256, suffix):
+    """对象预览文件的相对路径，suffix 为 '.txt' (首页文本) 或 '.png' (缩略图)。"""
+    return f'{PREVIEWS_DIR}/{sha256[:2]}/{sha256[2:4]}/{sha256}{suffix}'
+
+
+def file_ext(filename):
+    """取小写扩展名；过长的 "扩展名" (如 URL 参数残留) 视为没有扩展名。"""
+    ext = os.path.splitext(filename)[1].lower()
+    return ext if 1 < len(ext) <= 10 else ''
+
+
+def link_or_copy(src, dst):
+    """优先硬链接，其次符号链接，都不支持时复制。"""
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    for make_link in (os.link, os.symlink):
+        try:
+            make_link(src, dst)
+            return
+        except FileExistsError:
+            raise
+        except (OSError, NotImplementedError, AttributeError):
+            continue
+    shutil.copyfile(src, dst)
+
+
+class AttachmentIndex:
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS objects (
+        sha256     TEXT PRIMARY KEY,
+        ext        TEXT NOT NULL DEFAULT '',
+        size       INTEGER,
+        created_at REAL
+    );
+    CREATE TABLE IF NOT EXISTS urls (
+        url        TEXT PRIMARY KEY,
+        sha256     TEXT NOT NULL,
+        fetched_at REAL
+    );
+    CREATE TABLE IF NOT EXISTS paths (
+        path   TEXT PRIMARY KEY,
+        sha256 TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS paths_sha256 ON paths (sha256);
+    """
+
+    def __init__(self, basedir, path=None):
+        self.basedir = basedir
+        self.path = path or os.path.join(basedir, INDEX_FILENAME)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(self.SCHEMA)
+        self.db.commit()
+        self._lock = threading.Lock()
+
+    # ---------- 查询 ----------
+    def lookup_url(self, url):
+        """返回 (sha256, ext, fetched_at)，未知 URL 返回 None。"""
+        with self._lock:
+            return self.db.execute(
+                'SELECT u.sha256, o.ext, u.fetched_at FROM urls u JOIN objects o ON o.sha256 = u.sha256 '
+                'WHERE u.url = ?', (url,)).fetchone()
+
+    def lookup_object(self, sha256):
+        """返回 (ext, size)，未知对象返回 None。"""
+        with self._lock:
+            return self.db.execute('SELECT ext, size FROM objects WHERE sha256 = ?', (sha256,)).fetchone()
+
+    def lookup_path(self, path):
+        """友好路径 -> (sha256, ext)，未登记返回 None。"""
+        with self._lock:
+            return self.db.execute(
+                'SELECT p.sha256, o.ext FROM paths p JOIN objects o ON o.sha256 = p.sha256 '
+                'WHERE p.path = ?', (path,)).fetchone()
+
+    def object_abspath(self, sha256, ext=''):
+        return os.path.join(self.basedir, *object_relpath(sha256, ext).split('/'))
+
+    def preview_abspath(self, sha256, suffix):
+        return os.path.join(self.basedir, *preview_relpath(sha256, suffix).split('/'))
+
+    def iter_objects(self):
+        """[(sha256, ext, size), ...]，按 sha256 排序。"""
+        with self._lock:
+            return self.db.execute('SELECT sha256, ext, size FROM objects ORDER BY sha256').fetchall()
+
+    def resolve(self, path):
+        """把友好路径解析为对象的绝对路径；未登记或对象文件缺失时返回 None。"""
+        row = self.lookup_path(path)
+        if not row:
+            return None
+        abspath = self.object_abspath(*row)
+        return abspath if os.path.exists(abspath) else None
+
+    def friendly_path(self, project, filename, sha256):
+        """
+        为 (学院, 文件名, 内容) 选择友好路径：
+        文件名未被占用或已指向同一内容时用 project/filename，否则用 project/stem_哈希前8位.ext。
+        """
+        candidate = f'{project}/{filename}'
+        if self._path_free(candidate, sha256):
+            return candidate
+        stem, ext = os.path.splitext(filename)
+        return f'{project}/{stem}_{sha256[:8]}{ext}'
+
+    def _path_free(self, path, sha256):
+        row = self.lookup_path(path)
+        if row:
+            return row[0] == sha256
+        # 旧版布局 (project/basename 直接存文件) 留下的同名文件，不能覆盖
+        return not os.path.lexists(os.path.join(self.basedir, *path.split('/')))
+
+    # ---------- 写入 ----------
+    def add_object(self, sha256, ext, size):
+        with self._lock:
+            self.db.execute('INSERT OR IGNORE INTO objects (sha256, ext, size, created_at) VALUES (?, ?, ?, ?)',
+                            (sha256, ext, size, time.time()))
+            self.db.commit()
+
+    def add_url(self, url, sha256):
+        with self._lock:
+            self.db.execute('INSERT OR REPLACE INTO urls (url, sha256, fetched_at) VALUES (?, ?, ?)',
+                            (url, sha256, time.time()))
+            self.db.commit()
+
+    def ensure_link(self, path, sha256, ext):
+        """登记友好路径并在磁盘上建立指向对象的链接 (已存在则不动)。"""
+        dst = os.path.join(self.basedir, *path.split('/'))
+        if not os.path.lexists(dst):
+            try:
+                link_or_copy(self.object_abspath(sha256, ext), dst)
+            except FileExistsError:
+                pass
+        with self._lock:
+            self.db.execute('INSERT OR IGNORE INTO paths (path, sha256) VALUES (?, ?)', (path, sha256))
+            self.db.commit()
+
+    def close(self):
+        with self._lock:
+            self.db.commit()
+            self.db.close()
+        logging.info(f"[FileStore] Closed {self.path}")
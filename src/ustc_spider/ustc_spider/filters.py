@@ -0,0 +1,308 @@
+# filters.py
+"""
+检索过滤 (来源项目 / 网页或附件 / 日期范围) 与分面统计
+
+只在批量读取元数据之后再过滤，大部分读取都浪费在会被丢掉的文档上。这里为每个属性值维护一个位图
+(第 i 位 = 第 i 篇文档是否具有该值)，检索时在读取任何行之前就排除不符合条件的候选：
+- 倒排索引路径：先按位图判断，不符合的 posting 连 JSON 都不解析；类型直接取 posting 自带的 t
+- 标题扫描 / 向量路径：召回后按位图过滤，只有通过的文档才进入批量读取
+- 位图构建之后新入库的文档 (流式索引) 不在位图中，读取行之后再按 info:* 列核对
+分面统计用同一批位图：候选集合的位图与各取值位图按位与后计数 (统计某一属性时不应用该属性自身的条件，
+选中一个项目后仍能看到其它项目各有多少结果)。
+
+日期按月存储位图 (info:date 规范化为 YYYY-MM)，日期范围按月粒度过滤，年份分面由各月位图合并得到。
+附件行没有 info:project / info:date，继承所在网页 (info:parent_url 对应的行) 的值：构建位图与
+按行核对都经过 row_attributes() + inherit_attributes()，两条路径对附件的判断一致。
+
+文件 (etl/build_filter_index.py 生成，写临时文件后 os.replace 原子替换):
+    {"version": 1, "built_at": ..., "doc_ids": [...],
+     "bitmaps": {"project": {值: base64}, "type": {...}, "month": {...}}}
+位图为小端字节序的整数 (Python int 做按位运算与计数)。
+
+不依赖 Scrapy。
+"""
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+FILTER_ATTRIBUTES = ('project', 'type', 'month')
+DOC_TYPES = ('web', 'file')
+MAX_FACET_VALUES = 20
+
+_MONTH_RE = re.compile(r'(\d{4})\s*[-/.年]\s*(\d{1,2})')
+_YEAR_RE = re.compile(r'^\s*(\d{4})\s*$')
+
+
+def date_month(text):
+    """info:date ('2024-12-23'、'2024/3/5'、'2024年3月') -> '2024-03'；无法识别返回 ''。"""
+    if isinstance(text, bytes):
+        text = text.decode('utf-8', 'ignore')
+    match = _MONTH_RE.search(text or '')
+    if not match or not 1 <= int(match.group(2)) <= 12:
+        return ''
+    return f'{match.group(1)}-{int(match.group(2)):02d}'
+
+
+def _range_bound(text, upper):
+    """'2024' / '2024-03' / '2024-03-15' -> 'YYYY-MM' (只有年份时取该年第一个或最后一个月)。"""
+    if not text:
+        return None
+    year = _YEAR_RE.match(text)
+    if year:
+        return f'{year.group(1)}-{12 if upper else 1:02d}'
+    return date_month(text) or None
+
+
+def row_attributes(row):
+    """读取到的行 (info:* 列) -> {'project', 'type', 'month'}。"""
+    return {
+        'project': row.get(b'info:project', b'').decode('utf-8', 'ignore'),
+        'type': 'file' if row.get(b'info:type') == b'file' else 'web',
+        'month': date_month(row.get(b'info:date', b'')),
+    }
+
+
+def parent_row_key(row):
+    """附件行所在网页的 RowKey (md5(info:parent_url))；不是附件或项目、日期都不缺时返回 None。"""
+    parent_url = row.get(b'info:parent_url')
+    if not parent_url or (row.get(b'info:project') and date_month(row.get(b'info:date', b''))):
+        return None
+    return hashlib.md5(parent_url).hexdigest()
+
+
+def inherit_attributes(attrs, parent):
+    """附件缺少的 project / month 取所在网页的值 (就地修改 attrs)；返回是否继承了项目。"""
+    inherited = False
+    if not attrs['project'] and parent['project']:
+        attrs['project'] = parent['project']
+        inherited = True
+    if not attrs['month']:
+        attrs['month'] = parent['month']
+    return inherited
+
+
+class SearchFilters:
+    """一次检索的过滤条件；projects 为空表示不限项目 (多个项目之间为“或”)。"""
+
+    __slots__ = ('projects', 'doc_type', 'date_from', 'date_to')
+
+    def __init__(self, projects=(), doc_type=None, date_from=None, date_to=None):
+        self.projects = tuple(sorted({p.strip() for p in projects if p and p.strip()}))
+        self.doc_type = doc_type if doc_type in DOC_TYPES else None
+        self.date_from = _range_bound(date_from, upper=False)
+        self.date_to = _range_bound(date_to, upper=True)
+
+    def __bool__(self):
+        return bool(self.projects or self.doc_type or self.date_from or self.date_to)
+
+    def key(self):
+        return self.projects, self.doc_type, self.date_from, self.date_to
+
+    def to_dict(self):
+        return {'project': list(self.projects), 'type': self.doc_type, 'from': self.date_from, 'to': self.date_to}
+
+    def month_matches(self, month):
+        if not (self.date_from or self.date_to):
+            return True
+        if not month:
+            return False
+        return (not self.date_from or month >= self.date_from) and (not self.date_to or month <= self.date_to)
+
+    def matches(self, attrs):
+        """attrs: {'project', 'type', 'month'}。"""
+        if self.doc_type and attrs['type'] != self.doc_type:
+            return False
+        if self.projects and attrs['project'] not in self.projects:
+            return False
+        return self.month_matches(attrs['month'])
+
+    def matches_row(self, row, parent_row=None):
+        """
+        按读取到的 info:* 列核对 (不在位图中的新文档)。
+        附件行传入所在网页的行 (parent_row_key())，与构建位图时一样继承其项目与日期。
+        """
+        attrs = row_attributes(row)
+        if parent_row:
+            inherit_attributes(attrs, row_attributes(parent_row))
+        return self.matches(attrs)
+
+
+# ---------- 位图 ----------
+def bitmap_from_ordinals(ordinals, size):
+    bits = bytearray((size + 7) // 8)
+    for i in ordinals:
+        bits[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def _encode_bitmap(bitmap, size):
+    return base64.b64encode(bitmap.to_bytes((size + 7) // 8, 'little')).decode('ascii')
+
+
+def _decode_bitmap(text):
+    return int.from_bytes(base64.b64decode(text), 'little')
+
+
+def build_filter_data(documents):
+    """
+    documents: 可迭代的 (doc_id, {'project', 'type', 'month'})。
+    返回可写入文件的 dict：按 doc_id 排序的文档列表与各属性取值的位图。
+    """
+    documents = sorted(documents)
+    doc_ids = [doc_id for doc_id, _ in documents]
+    ordinals = {attr: {} for attr in FILTER_ATTRIBUTES}
+    for i, (_, attrs) in enumerate(documents):
+        for attr in FILTER_ATTRIBUTES:
+            ordinals[attr].setdefault(attrs.get(attr) or '', []).append(i)
+    size = len(doc_ids)
+    bitmaps = {attr: {value: _encode_bitmap(bitmap_from_ordinals(members, size), size)
+                      for value, members in values.items()}
+               for attr, values in ordinals.items()}
+    return {'version': 1, 'built_at': time.strftime('%Y-%m-%d %H:%M:%S'), 'doc_ids': doc_ids, 'bitmaps': bitmaps}
+
+
+def write_filter_index(path, data):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+# ---------- 查询 ----------
+class _FilterData:
+    __slots__ = ('doc_ids', 'ordinal', 'bitmaps', 'years', 'mtime', 'masks')
+
+    def __init__(self, raw, mtime):
+        self.doc_ids = raw['doc_ids']
+        self.ordinal = {doc_id: i for i, doc_id in enumerate(self.doc_ids)}
+        self.bitmaps = {attr: {value: _decode_bitmap(encoded) for value, encoded in values.items()}
+                        for attr, values in raw['bitmaps'].items()}
+        self.years = {}
+        for month, bitmap in self.bitmaps.get('month', {}).items():
+            if month:
+                self.years[month[:4]] = self.years.get(month[:4], 0) | bitmap
+        self.mtime = mtime
+        # 过滤条件 -> 允许的文档位图 (字节形式，按下标 O(1) 判断)；热门条件反复出现
+        self.masks = {}
+
+
+class FilterIndex:
+    def __init__(self, path, check_interval=30):
+        self.path = path
+        self.check_interval = check_interval
+        self._data = self._read()
+        self._checked_at = time.monotonic()
+        self._reloading = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path, **kwargs):
+        """文件不存在 (尚未构建) 时返回 None。"""
+        if not path or not os.path.exists(path):
+            return None
+        return cls(path, **kwargs)
+
+    def __len__(self):
+        return len(self._data.doc_ids)
+
+    def _read(self):
+        mtime = os.stat(self.path).st_mtime
+        with open(self.path, encoding='utf-8') as f:
+            data = _FilterData(json.load(f), mtime)
+        logging.info(f"[FilterIndex] Loaded {len(data.doc_ids)} documents "
+                     f"({', '.join(f'{len(v)} {a}' for a, v in data.bitmaps.items())}) from {self.path}")
+        return data
+
+    def reload_if_changed(self):
+        """每 check_interval 秒检查一次文件是否被替换；有变化时在后台线程加载，完成后替换引用。"""
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if self._reloading or now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+            try:
+                changed = os.stat(self.path).st_mtime != self._data.mtime
+            except OSError:
+                return
+            if not changed:
+                return
+            self._reloading = True
+        threading.Thread(target=self._reload, name='filter-reload', daemon=True).start()
+
+    def _reload(self):
+        try:
+            self._data = self._read()
+        except Exception as e:
+            logging.warning(f"[FilterIndex] Reload failed, keeping the previous index: {e}")
+        finally:
+            self._reloading = False
+
+    @staticmethod
+    def _mask(data, filters, skip=None):
+        """符合条件 (跳过 skip 属性) 的文档位图；没有任何条件时返回 None。"""
+        mask = None
+        if filters.projects and skip != 'project':
+            project = data.bitmaps.get('project', {})
+            mask = 0
+            for value in filters.projects:
+                mask |= project.get(value, 0)
+        if filters.doc_type and skip != 'type':
+            bitmap = data.bitmaps.get('type', {}).get(filters.doc_type, 0)
+            mask = bitmap if mask is None else mask & bitmap
+        if (filters.date_from or filters.date_to) and skip != 'month':
+            months = 0
+            for month, bitmap in data.bitmaps.get('month', {}).items():
+                if filters.month_matches(month):
+                    months |= bitmap
+            mask = months if mask is None else mask & months
+        return mask
+
+    def matcher(self, filters):
+        """
+        返回 match(doc_id)：True 符合、False 不符合、None 不在位图中 (需读取行后核对)。
+        """
+        data = self._data
+        key = filters.key()
+        mask_bytes = data.masks.get(key)
+        if mask_bytes is None:
+            mask = self._mask(data, filters)
+            mask_bytes = (mask or 0).to_bytes((len(data.doc_ids) + 7) // 8, 'little')
+            if len(data.masks) >= 256:
+                data.masks.clear()
+            data.masks[key] = mask_bytes
+        ordinal = data.ordinal
+
+        def match(doc_id):
+            i = ordinal.get(doc_id)
+            if i is None:
+                return None
+            return bool(mask_bytes[i >> 3] >> (i & 7) & 1)
+
+        return match
+
+    def facets(self, doc_ids, filters, limit=MAX_FACET_VALUES):
+        """
+        候选文档 (过滤前) 在各属性上的分布：{'project': [[值, 数量], ...], 'type': ..., 'year': ...}，数量降序。
+        统计某一属性时应用其它属性的条件、不应用它自身的条件。
+        """
+        data = self._data
+        candidates = bitmap_from_ordinals((data.ordinal[d] for d in doc_ids if d in data.ordinal), len(data.doc_ids))
+        facets = {}
+        for attr, name, values in (('project', 'project', data.bitmaps.get('project', {})),
+                                   ('type', 'type', data.bitmaps.get('type', {})),
+                                   ('month', 'year', data.years)):
+            mask = self._mask(data, filters, skip=attr)
+            base = candidates if mask is None else candidates & mask
+            counts = [[value, bin(base & bitmap).count('1')] for value, bitmap in values.items() if value]
+            counts = [c for c in counts if c[1]]
+            counts.sort(key=(lambda c: c[0]) if name == 'year' else (lambda c: -c[1]), reverse=name == 'year')
+            facets[name] = counts[:limit]
+        return facets
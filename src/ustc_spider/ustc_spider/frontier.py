@@ -0,0 +1,76 @@
+# frontier.py
+"""
+爬取前沿 (frontier) 链接打分
+
+原先所有链接优先级相同，LIFO 队列里日历、翻页、栏目导航与通知/下载页混在一起，
+含附件的页面往往排到爬取后期。这里给每个待爬链接计算一个整数分数，
+作为 Request.priority 交给 Scrapy 的优先级调度器 (数值越大越先下载)：
+
+- 链接所在页面含附件 (pdf/doc/xls/zip...):    每个附件 +ATTACHMENT_PER_FILE，最多 +ATTACHMENT
+  (附件链接本身被 LinkExtractor 的 deny_extensions 过滤、由 FilesPipeline 下载，不会成为待爬链接；
+  含附件的通知/下载列表页，其翻页与同栏目链接更可能通向其他附件)
+- URL 路径 / 锚文本命中 通知、公告、下载、文件 等: +NOTICE
+- 日历、按日期归档、翻页链接:                    +LOW_VALUE (负分，仍会被抓取，只是靠后)
+- 深度:                                      每深一层 +DEPTH (负分)
+- 历史变化率 (crawl_state 中再次抓取时内容变化的比例): 最多 +CHANGE_RATE；
+  从未抓取过的新链接按 +NEW_URL 计
+
+不依赖 Scrapy，FrontierMiddleware (middlewares.py) 负责把分数写入请求。
+"""
+import re
+from urllib.parse import urlparse
+
+# 学院网站常见的 通知 / 下载 栏目路径 (拼音缩写 + 英文)，按路径片段匹配
+NOTICE_PATH_RE = re.compile(
+    r'(?:^|[/_\-.])(tzgg|tz|gg|notice|notices|announce|news|xwdt|download|downloads|xzzq|wjxz|xz|files?|'
+    r'attach|zsxx|zhaosheng|policy|gzzd)(?:$|[/_\-.\d])')
+NOTICE_TEXT_RE = re.compile(r'(通知|公告|下载|文件|附件|办法|细则|规定|招生|申请表|公示)')
+LOW_VALUE_URL_RE = re.compile(
+    r'(calendar|rili|/\d{4}/\d{1,2}/?$|[?&](page|p|pageindex|start|date|month|year)=\d+|list\d+\.(s?html?|jsp|psp)$|index_\d+\.html?$)',
+    re.I)
+LOW_VALUE_TEXT_RE = re.compile(r'^(下一页|上一页|尾页|首页|末页|\d+|>+|<+|»|«|更多|more)$', re.I)
+
+
+class LinkScorer:
+    ATTACHMENT = 100
+    ATTACHMENT_PER_FILE = 20
+    NOTICE = 40
+    LOW_VALUE = -30
+    DEPTH = -10
+    CHANGE_RATE = 30
+    NEW_URL = 10
+
+    def __init__(self, **weights):
+        for name, value in weights.items():
+            setattr(self, name.upper(), int(value))
+
+    @classmethod
+    def from_settings(cls, settings):
+        """FRONTIER_WEIGHTS = {'attachment': 100, 'notice': 40, ...} 覆盖默认权重。"""
+        return cls(**(settings.getdict('FRONTIER_WEIGHTS') or {}))
+
+    def score(self, url, anchor_text='', depth=0, stats=None, page_attachments=0):
+        """
+        stats: crawl_state 中该 URL 的 (fetch_count, change_count)，未抓取过为 None。
+        page_attachments: 产出该链接的页面上的附件数。
+        返回整数分数。
+        """
+        path = urlparse(url).path.lower()
+        anchor_text = (anchor_text or '').strip()
+        score = depth * self.DEPTH
+
+        score += min(self.ATTACHMENT, page_attachments * self.ATTACHMENT_PER_FILE)
+        if NOTICE_PATH_RE.search(path) or NOTICE_TEXT_RE.search(anchor_text):
+            score += self.NOTICE
+
+        if LOW_VALUE_URL_RE.search(url) or LOW_VALUE_TEXT_RE.match(anchor_text):
+            score += self.LOW_VALUE
+
+        if stats is None:
+            score += self.NEW_URL
+        else:
+            # 第一次抓取必然计为一次"变化"，只统计之后的再抓取
+            fetch_count, change_count = stats
+            if fetch_count > 1:
+                score += int(self.CHANGE_RATE * min(1.0, (change_count - 1) / (fetch_count - 1)))
+        return score
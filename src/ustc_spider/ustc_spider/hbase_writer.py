@@ -0,0 +1,245 @@
+# hbase_writer.py
+"""
+带写缓冲的 HBase 写入器 (write-behind)
+
+- put/delete 只是追加到内存缓冲，攒够 batch_size 条或每隔 flush_interval 秒，
+  通过一次 mutateRows RPC (happybase Batch) 批量提交
+- 遇到传输层错误 (连接断开、超时等) 自动重连并按退避时间重试；
+  重试耗尽时变更留在缓冲区，下一次 flush 继续尝试，不会丢弃
+- 缓冲积压超过 max_pending 时 put() 会阻塞调用线程，直到写入恢复
+- close() 保证最后一次 flush
+- put/delete 可带 on_written 回调：只在该变更所在批次确认提交后 (在刷新线程中) 调用；
+  仍在缓冲区、重试中或被拒绝的变更不会触发，调用方据此记录"已落库"的状态
+
+happybase 连接非线程安全：所有 RPC 都在 _flush_lock 内执行。
+"""
+import logging
+import socket
+import threading
+import time
+
+import happybase
+from thriftpy2.transport import TTransportException
+
+from ustc_spider.telemetry import REGISTRY
+
+# 视为"可重连重试"的错误类型
+TRANSPORT_ERRORS = (TTransportException, socket.error, OSError, EOFError)
+
+FLUSH_SECONDS = REGISTRY.histogram('crawl_hbase_flush_seconds', '单个批次提交 (mutateRows) 的耗时，含重试', ['table'])
+MUTATIONS = REGISTRY.counter('crawl_hbase_mutations_total', '提交结果 (written / rejected / retry)', ['table', 'result'])
+
+
+class BufferedHBaseWriter:
+    def __init__(self, host, port, table_name, families=None, batch_size=100, flush_interval=2.0,
+                 max_retries=5, retry_backoff=1.0, max_pending=5000, timeout=20000):
+        self.host = host
+        self.port = port
+        self.table_name = table_name
+        # 表不存在时用于自动建表的列族定义
+        self.families = families
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_pending = max(self.batch_size, max_pending)
+        self.timeout = timeout
+
+        self.connection = None
+        self.table = None
+
+        self._pending = []                 # [(op, row_key, payload, on_written)]
+        self._lock = threading.Lock()      # 保护 _pending
+        self._flush_lock = threading.Lock()  # 保护连接与 RPC
+        self._stop = threading.Event()
+        self._flusher = None
+
+        # 统计
+        self.written = 0
+        self.failed = 0
+        self.retries = 0
+
+    @classmethod
+    def from_settings(cls, settings, table_name=None, families=None):
+        return cls(
+            host=settings.get('HBASE_HOST', '127.0.0.1'),
+            port=settings.getint('HBASE_PORT', 9090),
+            table_name=table_name or settings.get('HBASE_TABLE', 'ustc_web_data'),
+            families=families,
+            batch_size=settings.getint('HBASE_WRITE_BATCH_SIZE', 100),
+            flush_interval=settings.getfloat('HBASE_WRITE_FLUSH_INTERVAL', 2.0),
+            max_retries=settings.getint('HBASE_WRITE_MAX_RETRIES', 5),
+            retry_backoff=settings.getfloat('HBASE_WRITE_RETRY_BACKOFF', 1.0),
+            max_pending=settings.getint('HBASE_WRITE_MAX_PENDING', 5000),
+        )
+
+    # ---------- 连接管理 ----------
+    def _connect(self):
+        """建立连接 (必须匹配 hbase thrift start -f -c)，必要时自动建表。"""
+        self._disconnect()
+        connection = happybase.Connection(
+            self.host, port=self.port, timeout=self.timeout,
+            transport='framed', protocol='compact'
+        )
+        connection.open()
+        if self.families:
+            tables = [t.decode('utf-8') for t in connection.tables()]
+            if self.table_name not in tables:
+                connection.create_table(self.table_name, self.families)
+        self.connection = connection
+        self.table = connection.table(self.table_name)
+        logging.info(f"✅ [HBase] Writer connected: {self.table_name}")
+
+    def _disconnect(self):
+        if self.connection:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+        self.connection = None
+        self.table = None
+
+    def open(self):
+        """连接 HBase 并启动定时刷新线程。连接失败不抛异常，后续 flush 时会重连。"""
+        with self._flush_lock:
+            try:
+                self._connect()
+            except Exception as e:
+                logging.error(f"❌ [HBase] Writer connection failed (will retry on flush): {e}")
+        self._stop.clear()
+        self._flusher = threading.Thread(target=self._flush_loop, name=f'hbase-flush-{self.table_name}', daemon=True)
+        self._flusher.start()
+
+    # ---------- 写入接口 ----------
+    def put(self, row_key, data, on_written=None):
+        self._append(('put', row_key, data, on_written))
+
+    def delete(self, row_key, columns=None, on_written=None):
+        self._append(('delete', row_key, columns, on_written))
+
+    def _append(self, op):
+        with self._lock:
+            self._pending.append(op)
+            size = len(self._pending)
+        if size >= self.batch_size:
+            self.flush()
+        # 写入持续失败导致积压：阻塞调用方，形成反压而不是无限占用内存
+        while self.pending_count() >= self.max_pending and not self._stop.is_set():
+            time.sleep(self.retry_backoff)
+            self.flush()
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    # ---------- 刷新 ----------
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"❌ [HBase] Periodic flush failed: {e}")
+
+    def flush(self):
+        """提交当前缓冲区内的所有变更，返回成功写入的条数。"""
+        with self._flush_lock:
+            with self._lock:
+                ops, self._pending = self._pending, []
+            if not ops:
+                return 0
+
+            for start in range(0, len(ops), self.batch_size):
+                chunk = ops[start:start + self.batch_size]
+                try:
+                    self._send_with_retry(chunk)
+                    self._confirm(chunk)
+                except TRANSPORT_ERRORS as e:
+                    # 重试耗尽：未提交的变更放回缓冲区头部，等待下次 flush
+                    rest = ops[start:]
+                    with self._lock:
+                        self._pending = rest + self._pending
+                    logging.error(f"❌ [HBase] Flush failed after {self.max_retries} retries, "
+                                  f"{len(rest)} mutations kept for next attempt: {e}")
+                    return start
+                except Exception as e:
+                    # 非传输层错误 (如数据本身被拒绝)，重试无意义，记录行键后跳过
+                    self.failed += len(chunk)
+                    MUTATIONS.inc(len(chunk), table=self.table_name, result='rejected')
+                    keys = ', '.join(str(op[1]) for op in chunk[:5])
+                    logging.error(f"❌ [HBase] Batch rejected ({len(chunk)} mutations, e.g. {keys}): {e}")
+            return len(ops)
+
+    @staticmethod
+    def _confirm(ops):
+        """批次已提交：依次调用各变更的 on_written。回调出错只记录日志，不影响写入。"""
+        for op in ops:
+            callback = op[3]
+            if callback is None:
+                continue
+            try:
+                callback()
+            except Exception as e:
+                logging.error(f"❌ [HBase] on_written callback failed for {op[1]!r}: {e}")
+
+    def _send_with_retry(self, ops):
+        with FLUSH_SECONDS.time(table=self.table_name):
+            self._send_batch(ops)
+
+    def _send_batch(self, ops):
+        attempt = 0
+        while True:
+            try:
+                if self.table is None:
+                    self._connect()
+                with self.table.batch() as batch:
+                    for op, row_key, payload, _ in ops:
+                        if op == 'put':
+                            batch.put(row_key, payload)
+                        else:
+                            batch.delete(row_key, columns=payload)
+                self.written += len(ops)
+                MUTATIONS.inc(len(ops), table=self.table_name, result='written')
+                return
+            except TRANSPORT_ERRORS as e:
+                attempt += 1
+                self.retries += 1
+                MUTATIONS.inc(len(ops), table=self.table_name, result='retry')
+                self._disconnect()
+                if attempt > self.max_retries:
+                    raise
+                wait = self.retry_backoff * (2 ** (attempt - 1))
+                logging.warning(f"⚠️ [HBase] Transport error ({e}), reconnecting in {wait:.1f}s "
+                                f"(attempt {attempt}/{self.max_retries})")
+                time.sleep(wait)
+
+    # ---------- 读取 ----------
+    def row(self, row_key, columns=None):
+        """
+        在写入器自己的连接上读取一行 (不经过缓冲区，只能读到已提交的数据)。
+        同样在 _flush_lock 内执行；传输错误时重连重试一次。
+        """
+        with self._flush_lock:
+            for attempt in range(2):
+                try:
+                    if self.table is None:
+                        self._connect()
+                    return self.table.row(row_key, columns=columns)
+                except TRANSPORT_ERRORS:
+                    self._disconnect()
+                    if attempt:
+                        raise
+
+    def close(self):
+        """停止定时线程，做最后一次 flush 并关闭连接。"""
+        self._stop.set()
+        if self._flusher:
+            self._flusher.join()
+            self._flusher = None
+        self.flush()
+        remaining = self.pending_count()
+        if remaining:
+            logging.error(f"❌ [HBase] {remaining} mutations could not be written to {self.table_name}")
+        with self._flush_lock:
+            self._disconnect()
+        logging.info(f"[HBase] Writer closed: {self.table_name} written={self.written} "
+                     f"failed={self.failed} retries={self.retries}")
@@ -0,0 +1,104 @@
+# indexing.py
+"""
+倒排索引 (ustc_keyword_index) 的 posting 编码
+
+批量构建 (etl/build_inverted_index.py) 与爬虫中的流式索引 (pipelines.StreamingIndexer) 共用，
+保证两条路径写出的 posting 完全一致：
+    RowKey = 关键词 (UTF-8)
+    列     = p:{DocID}
+    值     = JSON {"w": 权重 (保留 4 位小数), "t": 文档类型 web/file}
+
+增量构建 (--since) 按爬虫写入的 info:changed_at 在服务端过滤，时间格式与过滤串也在这里统一生成。
+
+不依赖 Scrapy。
+"""
+import json
+from datetime import datetime
+
+INDEX_TABLE = 'ustc_keyword_index'
+INDEX_FAMILIES = {'p': dict()}
+MIN_WORD_LENGTH = 2
+
+# info:changed_at 的格式 (字符串比较即时间先后)
+CHANGED_AT_FORMAT = '%Y-%m-%d %H:%M:%S'
+_SINCE_FORMATS = (CHANGED_AT_FORMAT, '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d')
+
+# 基础中文停用词
+STOP_WORDS = {
+    "的", "了", "和", "是", "就", "都", "而", "及", "与", "着",
+    "或", "一个", "没有", "我们", "你们", "他们", "它", "在", "有",
+    "个", "这", "那", "为", "之", "大", "来", "以", "中", "上", "下",
+    "到", "说", "要", "去", "能", "会", "可", "也", "很", "真", "让",
+    "自己", "什么", "怎么", "哪里", "这里", "那里", "但是", "因为", "所以",
+    "如果", "虽然", "不仅", "而且", "或者", "还是", "以及", "关于", "对于",
+    "根据", "按照", "通过", "由于", "为了", "除了", "包含", "包括", "其中",
+    "例如", "比如", "等等", "以及", "并且", "或者", "或是", "要么", "既",
+    "非", "即", "将", "对", "由", "向", "被", "给", "把", "次", "从",
+    "自", "当", "并", "但", "而", "所", "诚", "之", "其", "或", "亦",
+    "方", "即", "若", "则", "虽", "已", "故", "至", "及", "与", "且",
+    "等", "应", "该", "此", "这些", "那些", "一些", "一点", "一切", "任何",
+    "所有", "凡是", "各个", "各位", "各种", "各自", "某", "某某", "某些",
+    "某个", "其它", "其他", "其余", "另外", "另", "别", "别的", "别人",
+    "别处", "唯", "唯有", "只是", "不过", "只要", "只有", "除非", "尽管",
+    "不管", "无论", "不论", "任", "任凭", "即使", "即便", "哪怕", "倘若",
+    "假若", "假如", "要是", "如", "如果", "如若", "若", "若是", "果真",
+    "果", "一", "二", "三", "四", "五", "六", "七", "八", "九", "十"
+}
+
+
+def iter_keywords(keywords_list):
+    """
+    规范化 info:keywords 中的关键词，产出 (word, weight)。
+    兼容 [{"word", "weight"}] (jieba 带权重) 与 ["词", ...] 两种格式；过滤单字与停用词。
+    """
+    for kw_item in keywords_list or ():
+        if isinstance(kw_item, dict):
+            word = kw_item.get('word', '')
+            weight = kw_item.get('weight', 1.0)
+        elif isinstance(kw_item, str):
+            word = kw_item
+            weight = 1.0
+        else:
+            continue
+        if not word or len(word) < MIN_WORD_LENGTH or word in STOP_WORDS:
+            continue
+        yield word, weight
+
+
+def posting_column(doc_id):
+    return f'p:{doc_id}'.encode('utf-8')
+
+
+def posting_value(weight, doc_type='web'):
+    return json.dumps({'w': round(weight, 4), 't': doc_type}).encode('utf-8')
+
+
+def build_postings(doc_id, keywords_list, doc_type='web'):
+    """返回 {word: (column, value)}，同一文档内重复的词以第一次出现的权重为准。"""
+    column = posting_column(doc_id)
+    postings = {}
+    for word, weight in iter_keywords(keywords_list):
+        if word not in postings:
+            postings[word] = (column, posting_value(weight, doc_type))
+    return postings
+
+
+def changed_at_timestamp(text):
+    """
+    把命令行传入的 --since 规范化为 info:changed_at 的格式：
+    'YYYY-MM-DD' / 'YYYY-MM-DD HH:MM' / 'YYYY-MM-DD HH:MM:SS' -> 'YYYY-MM-DD HH:MM:SS'；其它输入抛 ValueError。
+    """
+    text = (text or '').strip()
+    for fmt in _SINCE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime(CHANGED_AT_FORMAT)
+        except ValueError:
+            continue
+    raise ValueError(f"expected 'YYYY-MM-DD[ HH:MM[:SS]]', got {text!r}")
+
+
+def changed_since_filter(since):
+    """服务端过滤串：只返回 info:changed_at >= since 的行 (没有该列的行跳过)。"""
+    # 规范化后只含数字、'-'、':' 和空格；仍按过滤语言的规则转义单引号，避免拼接出别的过滤条件
+    value = changed_at_timestamp(since).replace("'", "''")
+    return f"SingleColumnValueFilter('info', 'changed_at', >=, 'binary:{value}', true, true)".encode('utf-8')
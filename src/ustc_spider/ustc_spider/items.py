@@ -10,6 +10,13 @@ class GeneralSpiderItem(scrapy.Item):  # <--- 名字必须是 GeneralSpiderItem
     html_content = scrapy.Field()
     parsed_text = scrapy.Field()
     date = scrapy.Field() # 可选，发布时间
+
+    # 增量爬取 (crawl_state.py)
+    etag = scrapy.Field()          # 响应头 ETag
+    last_modified = scrapy.Field() # 响应头 Last-Modified
+    fingerprint = scrapy.Field()   # 规范化正文指纹，由 ChangeDetectionPipeline 填充
+    canonical_url = scrapy.Field() # 近似重复页面指向的规范页面 URL (NEAR_DUP_ACTION = 'link' 时)
+    simhash = scrapy.Field()       # 正文 SimHash，由 NearDuplicatePipeline 填充，入库后登记到 crawl_state
     
     # 文件相关 (给 FilesPipeline 用的)
     file_urls = scrapy.Field() # 必须叫 file_urls
@@ -0,0 +1,180 @@
+# keywords.py
+"""
+共享关键词提取服务 (爬虫 HBasePipeline 与 ETL process_files_content 共用)
+
+- 基于 jieba TF-IDF + 词性过滤，输出格式固定为 [{"word": ..., "weight": ...}, ...]
+- 通过进程池并行处理多篇文档，每个工作进程只加载一次词典与 IDF 模型
+- workers=0 时在当前进程内同步执行 (便于调试)
+- 不依赖 Scrapy，可单独运行做吞吐量测试:
+    python -m ustc_spider.keywords --workers 4 a.txt b.txt ...
+"""
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import jieba
+import jieba.analyse
+
+# 仅提取实词 (与原先 extract_tags 调用保持一致)
+ALLOW_POS = ('n', 'nz', 'v', 'vd', 'vn', 'l', 'a', 'd')
+DEFAULT_TOPK = 20
+
+# 每个工作进程内的 TF-IDF 实例 (进程启动时加载一次)
+_tfidf = None
+
+
+def _init_worker(idf_path=None, user_dict=None):
+    """工作进程初始化：加载分词词典与 IDF 模型，之后所有文档复用。"""
+    global _tfidf
+    jieba.setLogLevel(logging.WARNING)
+    if user_dict:
+        jieba.load_userdict(user_dict)
+    jieba.initialize()
+    _tfidf = jieba.analyse.TFIDF(idf_path) if idf_path else jieba.analyse.default_tfidf
+
+
+def _extract_one(text, topk):
+    if _tfidf is None:
+        _init_worker()
+    if not text:
+        return []
+    tags = _tfidf.extract_tags(text, topK=topk, withWeight=True, allowPOS=ALLOW_POS)
+    return [{'word': w, 'weight': float(wt)} for w, wt in tags]
+
+
+def _extract_chunk(texts, topk):
+    return [_extract_one(t, topk) for t in texts]
+
+
+class KeywordExtractor:
+    """
+    批量关键词提取器。
+
+    用法:
+        extractor = KeywordExtractor(workers=4)
+        extractor.extract(text)             # 单篇 (阻塞)
+        extractor.submit(text)              # 单篇 (返回 concurrent.futures.Future)
+        extractor.extract_batch([t1, t2])   # 多篇并行，结果顺序与输入一致
+        extractor.close()
+    """
+
+    def __init__(self, workers=0, topk=DEFAULT_TOPK, idf_path=None, user_dict=None, chunk_size=8):
+        self.workers = max(0, int(workers or 0))
+        self.topk = topk
+        self.idf_path = idf_path
+        self.user_dict = user_dict
+        self.chunk_size = max(1, int(chunk_size))
+        self.executor = None
+
+        # 统计信息 (用于吞吐量评估)
+        self.docs = 0
+        self.chars = 0
+
+        if self.workers:
+            # spawn: 在 Twisted 等多线程宿主进程中 fork 不安全，Windows 上也只能 spawn
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(idf_path, user_dict),
+            )
+        else:
+            _init_worker(idf_path, user_dict)
+
+    @classmethod
+    def from_settings(cls, settings):
+        """从 Scrapy settings 构建 (KEYWORDS_* 配置项)。"""
+        return cls(
+            workers=settings.getint('KEYWORDS_WORKERS', 0),
+            topk=settings.getint('KEYWORDS_TOPK', DEFAULT_TOPK),
+            idf_path=settings.get('KEYWORDS_IDF_PATH'),
+            user_dict=settings.get('KEYWORDS_USER_DICT'),
+            chunk_size=settings.getint('KEYWORDS_CHUNK_SIZE', 8),
+        )
+
+    def _count(self, texts):
+        self.docs += len(texts)
+        self.chars += sum(len(t) for t in texts if t)
+
+    def submit(self, text):
+        """提交单篇文档，返回 Future，结果为 [{"word", "weight"}]。"""
+        self._count([text])
+        if self.executor:
+            return self.executor.submit(_extract_one, text, self.topk)
+
+        future = Future()
+        try:
+            future.set_result(_extract_one(text, self.topk))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def extract(self, text):
+        return self.submit(text).result()
+
+    def extract_batch(self, texts):
+        """并行提取多篇文档的关键词，返回与 texts 等长的列表。"""
+        texts = list(texts)
+        self._count(texts)
+        if not self.executor:
+            return _extract_chunk(texts, self.topk)
+
+        chunks = [texts[i:i + self.chunk_size] for i in range(0, len(texts), self.chunk_size)]
+        futures = [self.executor.submit(_extract_chunk, chunk, self.topk) for chunk in chunks]
+        results = []
+        for f in futures:
+            results.extend(f.result())
+        return results
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _benchmark(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='关键词提取吞吐量测试')
+    parser.add_argument('files', nargs='*', help='UTF-8 文本文件，每个文件视为一篇文档 (缺省使用内置样例)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=200, help='样例文档重复次数')
+    args = parser.parse_args(argv)
+
+    if args.files:
+        texts = []
+        for path in args.files:
+            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                texts.append(f.read())
+    else:
+        sample = ('中国科学技术大学计算机科学与技术学院关于做好2025年研究生招生复试工作的通知，'
+                  '各系请按照学校统一部署，认真组织复试考核，确保公平公正。') * 20
+        texts = [sample] * args.repeat
+
+    with KeywordExtractor(workers=args.workers, chunk_size=args.chunk_size) as extractor:
+        # 预热：确保工作进程已完成词典加载，不计入耗时
+        extractor.extract_batch(texts[:max(1, args.workers)])
+        extractor.docs = extractor.chars = 0
+
+        start = time.perf_counter()
+        extractor.extract_batch(texts)
+        elapsed = time.perf_counter() - start
+
+    print(f"workers={args.workers} docs={extractor.docs} chars={extractor.chars} "
+          f"elapsed={elapsed:.2f}s throughput={extractor.docs / elapsed:.1f} docs/s "
+          f"({extractor.chars / elapsed / 1000:.1f} k chars/s)")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    _benchmark()
@@ -3,49 +3,98 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import logging
+import time
+from collections import Counter
+from urllib.parse import urlparse
+
 from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http import HtmlResponse, Request
+from scrapy.utils.httpobj import urlparse_cached
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
 
+from ustc_spider.archive import ResponseArchive, row_key_for
+from ustc_spider.crawl_state import CrawlStateStore
+from ustc_spider.frontier import LinkScorer
+from ustc_spider.telemetry import REGISTRY
+
+
+# ---------- 爬取遥测指标 (ustc_spider/telemetry.py，Prometheus 文本格式导出) ----------
+REQUEST_LATENCY = REGISTRY.histogram(
+    'crawl_request_latency_seconds', '从发出请求到收到完整响应的耗时', ['domain'])
+RESPONSES = REGISTRY.counter('crawl_responses_total', '按状态码统计的响应数', ['domain', 'status'])
+RESPONSE_BYTES = REGISTRY.counter('crawl_response_bytes_total', '下载的响应体字节数', ['domain'])
+RETRIES = REGISTRY.counter('crawl_retries_total', '重试请求数 (RetryMiddleware 重新发出的请求)', ['domain'])
+TIMEOUTS = REGISTRY.counter('crawl_timeouts_total', '下载超时次数', ['domain'])
+DOWNLOAD_ERRORS = REGISTRY.counter('crawl_download_errors_total', '超时以外的下载异常', ['domain', 'exception'])
+SCHEDULER_DEPTH = REGISTRY.gauge('crawl_scheduler_queue_depth', '调度器中等待的请求数')
+DOWNLOADER_SLOTS = REGISTRY.gauge(
+    'crawl_downloader_slot_requests', '下载器各 slot (域名) 中的请求数', ['slot', 'state'])
+PAGES_PARSED = REGISTRY.counter('crawl_pages_parsed_total', '进入爬虫回调的响应数', ['domain'])
+PARSE_SECONDS = REGISTRY.histogram('crawl_parse_seconds', '爬虫回调处理单个响应的耗时', ['domain'])
+ITEMS_YIELDED = REGISTRY.counter('crawl_items_yielded_total', '回调产出的 item 数', ['domain'])
+REQUESTS_YIELDED = REGISTRY.counter('crawl_requests_yielded_total', '回调产出的新请求数', ['domain'])
+SPIDER_EXCEPTIONS = REGISTRY.counter('crawl_spider_exceptions_total', '回调抛出的异常', ['domain', 'exception'])
+
 
 class UstcSpiderSpiderMiddleware:
-    # Not all methods need to be defined. If a method is not defined,
-    # scrapy acts as if the spider middleware does not modify the
-    # passed objects.
+    """
+    爬虫侧遥测：按域名统计解析的页面数、解析耗时、产出的 item / 请求数与回调异常。
+    TELEMETRY_ENABLED = False 时不启用。
+    """
 
     @classmethod
     def from_crawler(cls, crawler):
-        # This method is used by Scrapy to create your spiders.
+        if not crawler.settings.getbool('TELEMETRY_ENABLED'):
+            raise NotConfigured
         s = cls()
         crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
         return s
 
     def process_spider_input(self, response, spider):
-        # Called for each response that goes through the spider
-        # middleware and into the spider.
-
-        # Should return None or raise an exception.
+        PAGES_PARSED.inc(domain=urlparse_cached(response).netloc)
         return None
 
     def process_spider_output(self, response, result, spider):
-        # Called with the results returned from the Spider, after
-        # it has processed the response.
+        domain = urlparse_cached(response).netloc
+        elapsed = 0.0
+        iterator = iter(result)
+        while True:
+            # 只计算回调 (及其后的中间件) 生成结果的时间，不含下游消费结果的时间
+            start = time.perf_counter()
+            try:
+                r = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                elapsed += time.perf_counter() - start
+            self._count(r, domain)
+            yield r
+        PARSE_SECONDS.observe(elapsed, domain=domain)
 
-        # Must return an iterable of Request, or item objects.
-        for i in result:
-            yield i
+    async def process_spider_output_async(self, response, result, spider):
+        domain = urlparse_cached(response).netloc
+        start = time.perf_counter()
+        async for r in result:
+            self._count(r, domain)
+            yield r
+        PARSE_SECONDS.observe(time.perf_counter() - start, domain=domain)
 
-    def process_spider_exception(self, response, exception, spider):
-        # Called when a spider or process_spider_input() method
-        # (from other spider middleware) raises an exception.
+    @staticmethod
+    def _count(r, domain):
+        if isinstance(r, Request):
+            REQUESTS_YIELDED.inc(domain=domain)
+        else:
+            ITEMS_YIELDED.inc(domain=domain)
 
-        # Should return either None or an iterable of Request or item objects.
-        pass
+    def process_spider_exception(self, response, exception, spider):
+        SPIDER_EXCEPTIONS.inc(domain=urlparse_cached(response).netloc, exception=type(exception).__name__)
+        return None
 
     async def process_start(self, start):
-        # Called with an async iterator over the spider start() method or the
-        # maching method of an earlier spider middleware.
         async for item_or_request in start:
             yield item_or_request
 
@@ -54,47 +103,334 @@ class UstcSpiderSpiderMiddleware:
 
 
 class UstcSpiderDownloaderMiddleware:
-    # Not all methods need to be defined. If a method is not defined,
-    # scrapy acts as if the downloader middleware does not modify the
-    # passed objects.
+    """
+    下载侧遥测 + 指标导出。
+
+    - 按域名记录：请求耗时直方图、状态码计数、响应字节数、重试数、超时数、其他下载异常
+    - 每隔 TELEMETRY_INTERVAL 秒采样调度器队列深度与下载器各 slot 的 active / queued / transferring 数，
+      并把全部指标 (含管道各阶段耗时) 以 Prometheus 文本格式写入 TELEMETRY_TEXTFILE；
+      TELEMETRY_PORT 非 0 时同时在该端口提供 /metrics
+    - 排在下载器中间件链的末端 (紧挨下载器)，耗时不含其他中间件的处理时间
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.textfile = crawler.settings.get('TELEMETRY_TEXTFILE')
+        self.port = crawler.settings.getint('TELEMETRY_PORT', 0)
+        self.interval = crawler.settings.getfloat('TELEMETRY_INTERVAL', 15.0)
+        self.task = None
 
     @classmethod
     def from_crawler(cls, crawler):
-        # This method is used by Scrapy to create your spiders.
-        s = cls()
+        if not crawler.settings.getbool('TELEMETRY_ENABLED'):
+            raise NotConfigured
+        s = cls(crawler)
         crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
         return s
 
     def process_request(self, request, spider):
-        # Called for each request that goes through the downloader
-        # middleware.
-
-        # Must either:
-        # - return None: continue processing this request
-        # - or return a Response object
-        # - or return a Request object
-        # - or raise IgnoreRequest: process_exception() methods of
-        #   installed downloader middleware will be called
+        if request.meta.get('retry_times'):
+            RETRIES.inc(domain=urlparse_cached(request).netloc)
+        request.meta['telemetry_start'] = time.perf_counter()
         return None
 
     def process_response(self, request, response, spider):
-        # Called with the response returned from the downloader.
-
-        # Must either;
-        # - return a Response object
-        # - return a Request object
-        # - or raise IgnoreRequest
+        domain = urlparse_cached(request).netloc
+        start = request.meta.get('telemetry_start')
+        if start is not None:
+            REQUEST_LATENCY.observe(time.perf_counter() - start, domain=domain)
+        RESPONSES.inc(domain=domain, status=response.status)
+        RESPONSE_BYTES.inc(len(response.body), domain=domain)
         return response
 
     def process_exception(self, request, exception, spider):
-        # Called when a download handler or a process_request()
-        # (from other downloader middleware) raises an exception.
+        domain = urlparse_cached(request).netloc
+        name = type(exception).__name__
+        if 'Timeout' in name or 'TimedOut' in name:
+            TIMEOUTS.inc(domain=domain)
+        elif not isinstance(exception, IgnoreRequest):
+            DOWNLOAD_ERRORS.inc(domain=domain, exception=name)
+        return None
+
+    def spider_opened(self, spider):
+        from twisted.internet import task
+
+        if self.port:
+            REGISTRY.serve(self.port)
+            spider.logger.info(f"[Telemetry] Serving metrics on http://127.0.0.1:{self.port}/metrics")
+        self.task = task.LoopingCall(self.export)
+        self.task.start(self.interval, now=False)
+
+    def spider_closed(self, spider):
+        if self.task and self.task.running:
+            self.task.stop()
+        self.export()
+        REGISTRY.shutdown()
+
+    def sample_queues(self):
+        """在 reactor 线程中读取调度器与下载器状态 (只读)。"""
+        engine = self.crawler.engine
+        slot = getattr(engine, '_slot', None) or getattr(engine, 'slot', None)
+        scheduler = getattr(slot, 'scheduler', None)
+        if scheduler is not None:
+            SCHEDULER_DEPTH.set(len(scheduler))
+        DOWNLOADER_SLOTS.clear()
+        for key, download_slot in list(engine.downloader.slots.items()):
+            DOWNLOADER_SLOTS.set(len(download_slot.active), slot=key, state='active')
+            DOWNLOADER_SLOTS.set(len(download_slot.queue), slot=key, state='queued')
+            DOWNLOADER_SLOTS.set(len(download_slot.transferring), slot=key, state='transferring')
+
+    def export(self):
+        try:
+            self.sample_queues()
+            if self.textfile:
+                REGISTRY.write_textfile(self.textfile)
+        except Exception as e:
+            logging.warning(f"[Telemetry] Export failed: {e}")
+
+
+class ConditionalRequestMiddleware:
+    """
+    增量爬取：对上次已抓取过的页面发送条件请求。
+
+    - 请求带上 If-None-Match / If-Modified-Since (取自 crawl_state 中记录的 ETag / Last-Modified)
+    - 服务器返回 304 时直接丢弃该请求，不再解析、提取关键词、写 HBase
+    - 只对深度 >= CONDITIONAL_MIN_DEPTH 的请求生效：304 响应没有正文，
+      列表/导航页若返回 304 会导致其下的子页面本轮无法被发现，因此默认只对叶子层页面使用；
+      站点地图 / 订阅源发现的页面 (meta['leaf_page']) 不跟进链接，不受深度限制
+    """
 
-        # Must either:
-        # - return None: continue processing this exception
-        # - return a Response object: stops process_exception() chain
-        # - return a Request object: stops process_exception() chain
-        pass
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.min_depth = crawler.settings.getint(
+            'CONDITIONAL_MIN_DEPTH', crawler.settings.getint('DEPTH_LIMIT', 0))
+        self.state = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('CONDITIONAL_RECRAWL_ENABLED'):
+            raise NotConfigured
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
 
     def spider_opened(self, spider):
-        spider.logger.info("Spider opened: %s" % spider.name)
+        self.state = CrawlStateStore.from_settings(self.crawler.settings)
+
+    def spider_closed(self, spider):
+        if self.state:
+            self.state.release()
+
+    def process_request(self, request, spider):
+        if request.meta.get('dont_conditional'):
+            return None
+        if request.meta.get('depth', 0) < self.min_depth and not request.meta.get('leaf_page'):
+            return None
+        previous = self.state.get(request.url)
+        if not previous:
+            return None
+        if previous['etag']:
+            request.headers.setdefault('If-None-Match', previous['etag'])
+        if previous['last_modified']:
+            request.headers.setdefault('If-Modified-Since', previous['last_modified'])
+        return None
+
+    def process_response(self, request, response, spider):
+        if response.status == 304 and (b'If-None-Match' in request.headers
+                                       or b'If-Modified-Since' in request.headers):
+            self.state.record_not_modified(request.url)
+            self.crawler.stats.inc_value('conditional/not_modified')
+            raise IgnoreRequest(f"Not modified: {request.url}")
+        return response
+
+
+class ArchiveMiddleware:
+    """
+    原始网页归档：把下载到的 HTML 响应 (200，已解压) 压缩追加到 ARCHIVE_DIR 的分段文件中，
+    以 URL 的 MD5 (即 HBase RowKey) 建立偏移索引，供 `scrapy reprocess` 回放。
+
+    - 位于 HttpCompressionMiddleware(590) 与 ConditionalRequestMiddleware(590) 之后处理响应：
+      拿到的是解压后的正文，304 已被丢弃
+    - Content-Encoding / Content-Length 不再对应归档的正文，不保存
+    """
+
+    SKIP_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding'}
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.archive = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('ARCHIVE_ENABLED') or crawler.settings.getbool('ARCHIVE_REPLAY'):
+            raise NotConfigured
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    @staticmethod
+    def open_archive(settings, readonly=False):
+        return ResponseArchive(
+            settings.get('ARCHIVE_DIR'),
+            segment_size=settings.getint('ARCHIVE_SEGMENT_MB', 256) * 1024 * 1024,
+            compression=settings.get('ARCHIVE_COMPRESSION', 'zlib'),
+            level=settings.getint('ARCHIVE_COMPRESSION_LEVEL', 6),
+            readonly=readonly,
+        )
+
+    def spider_opened(self, spider):
+        self.archive = self.open_archive(self.crawler.settings)
+        spider.logger.info(f"[Archive] Archiving responses to {self.archive.directory} ({len(self.archive)} records)")
+
+    def spider_closed(self, spider):
+        if self.archive:
+            self.archive.close()
+
+    def process_response(self, request, response, spider):
+        if response.status != 200 or not isinstance(response, HtmlResponse) or 'cached' in response.flags:
+            return response
+        headers = {
+            k.decode('latin-1'): [v.decode('latin-1') for v in values]
+            for k, values in response.headers.items()
+            if k.decode('latin-1').lower() not in self.SKIP_HEADERS
+        }
+        try:
+            self.archive.append(response.url, response.status, headers, response.body,
+                                row_key=row_key_for(response.url))
+            self.crawler.stats.inc_value('archive/stored')
+            self.crawler.stats.inc_value('archive/stored_bytes', len(response.body))
+        except Exception as e:
+            self.crawler.stats.inc_value('archive/errors')
+            spider.logger.warning(f"[Archive] Failed to archive {response.url}: {e}")
+        return response
+
+
+class ArchiveReplayMiddleware:
+    """
+    回放 (ARCHIVE_REPLAY，由 `scrapy reprocess` 开启)：请求带有 meta['archive_row_key'] 时
+    直接从归档中读出响应返回，不访问网络。
+
+    不在归档中的请求 (附件等) 默认忽略；ARCHIVE_REPLAY_ALLOW_NETWORK 时照常下载。
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.allow_network = crawler.settings.getbool('ARCHIVE_REPLAY_ALLOW_NETWORK')
+        self.archive = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('ARCHIVE_REPLAY'):
+            raise NotConfigured
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def spider_opened(self, spider):
+        self.archive = ArchiveMiddleware.open_archive(self.crawler.settings, readonly=True)
+
+    def spider_closed(self, spider):
+        if self.archive:
+            self.archive.close()
+
+    def process_request(self, request, spider):
+        row_key = request.meta.get('archive_row_key')
+        if row_key is None:
+            if self.allow_network:
+                return None
+            raise IgnoreRequest(f"Not in archive: {request.url}")
+        record = self.archive.get(row_key)
+        if record is None:
+            self.crawler.stats.inc_value('archive/replay_missing')
+            raise IgnoreRequest(f"Archive record missing: {request.url}")
+        self.crawler.stats.inc_value('archive/replayed')
+        return HtmlResponse(
+            url=record['url'],
+            status=record['status'],
+            headers=record['headers'],
+            body=record['body'],
+            request=request,
+            flags=['archived'],
+        )
+
+
+class FrontierMiddleware:
+    """
+    优先级爬取前沿 (spider middleware，位于 DepthMiddleware 之后)。
+
+    - 用 LinkScorer 给页面产出的每个请求打分，加到 request.priority 上
+      (含附件页面上的链接、通知/下载页优先，日历/翻页/深层页面靠后，历史上常变化的页面优先)
+    - 每个域名的页面预算 FRONTIER_DOMAIN_BUDGET：某域名已下载的页面数达到预算后，
+      只继续调度分数 >= FRONTIER_BUDGET_MIN_SCORE 的链接，其余丢弃
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.scorer = LinkScorer.from_settings(crawler.settings)
+        self.domain_budget = crawler.settings.getint('FRONTIER_DOMAIN_BUDGET', 0)
+        self.budget_min_score = crawler.settings.getint('FRONTIER_BUDGET_MIN_SCORE', LinkScorer.NOTICE)
+        self.pages = Counter()  # 域名 -> 已下载页面数
+        self.state = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('FRONTIER_ENABLED', True):
+            raise NotConfigured
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def spider_opened(self, spider):
+        self.state = CrawlStateStore.from_settings(self.crawler.settings)
+
+    def spider_closed(self, spider):
+        if self.state:
+            self.state.release()
+        over = [domain for domain, count in self.pages.items() if self.domain_budget and count >= self.domain_budget]
+        if over:
+            spider.logger.info(f"[Frontier] Domains that reached FRONTIER_DOMAIN_BUDGET: {', '.join(sorted(over))}")
+
+    def process_spider_input(self, response, spider):
+        self.pages[urlparse(response.url).netloc] += 1
+        return None
+
+    def process_spider_output(self, response, result, spider):
+        # 先收集本页产出的请求，批量查询变化统计 (一次 SQL，而不是每个链接一次)
+        results = list(result)
+        yield from self._prioritize(response, results)
+
+    async def process_spider_output_async(self, response, result, spider):
+        results = [r async for r in result]
+        for r in self._prioritize(response, results):
+            yield r
+
+    def _prioritize(self, response, results):
+        requests = [r for r in results if isinstance(r, Request)]
+        stats = self.state.get_change_stats(r.url for r in requests) if requests and self.state else {}
+        over_budget = self.domain_budget and self.pages[urlparse(response.url).netloc] >= self.domain_budget
+        # 本页的附件数 (parse_item 产出的 item 与跟进链接在同一批结果中)
+        attachments = sum(len(ItemAdapter(r).get('file_urls') or ()) for r in results if ItemAdapter.is_item(r))
+
+        for r in results:
+            if not isinstance(r, Request):
+                yield r
+                continue
+            score = self.scorer.score(
+                r.url,
+                anchor_text=r.meta.get('link_text', ''),
+                depth=r.meta.get('depth', 0),
+                stats=stats.get(r.url),
+                page_attachments=attachments,
+            )
+            if over_budget and score < self.budget_min_score:
+                self.crawler.stats.inc_value('frontier/budget_dropped')
+                continue
+            if score >= self.budget_min_score:
+                self.crawler.stats.inc_value('frontier/high_priority')
+            r.priority += score
+            yield r
@@ -0,0 +1,112 @@
+# passages.py
+"""
+段落级索引 (RAG 上下文检索用)
+
+页面正文按段落切成 200~500 字的片段，单独存储并建立词项索引，问答时只把与问题最相关的几段送给大模型，
+不再使用页面开头 200 字的摘要 (多半是导航文字)。
+批量构建 (etl/build_passage_index.py) 与 Web 端检索 (rag/search_engine.py) 共用这里的切分与编码：
+
+    ustc_passages        RowKey = {DocID}#{序号:04d}
+                         p:text 段落正文, p:doc 所属文档, p:title / p:url / p:type 来源信息,
+                         p:terms 段落词项 (JSON，重建时据此删除旧 posting)
+    ustc_passage_index   RowKey = 词项 (UTF-8)
+                         列 = p:{段落 RowKey}, 值 = JSON {"f": 词频, "l": 段落词项总数}
+
+不依赖 Scrapy。
+"""
+import json
+import re
+from collections import Counter
+
+import jieba
+
+from ustc_spider.indexing import MIN_WORD_LENGTH, STOP_WORDS
+
+PASSAGE_TABLE = 'ustc_passages'
+PASSAGE_INDEX_TABLE = 'ustc_passage_index'
+PASSAGE_FAMILIES = {'p': dict()}
+
+TARGET_CHARS = 300
+MAX_CHARS = 500
+
+_SENTENCE_END_RE = re.compile(r'(?<=[。！？；!?;])')
+_CJK_RE = re.compile(r'[㐀-鿿豈-﫿]')
+_SPACES_RE = re.compile(r'[ \t\r\f\v]+')
+
+
+def passage_id(doc_id, n):
+    return f'{doc_id}#{n:04d}'
+
+
+def doc_of(pid):
+    return pid.rsplit('#', 1)[0]
+
+
+def _pieces(paragraph, max_chars):
+    """过长的段落先按句末标点切开，单句仍超长时硬切。"""
+    if len(paragraph) <= max_chars:
+        yield paragraph
+        return
+    for sentence in _SENTENCE_END_RE.split(paragraph):
+        for start in range(0, len(sentence), max_chars):
+            piece = sentence[start:start + max_chars]
+            if piece:
+                yield piece
+
+
+def split_passages(text, target_chars=TARGET_CHARS, max_chars=MAX_CHARS):
+    """
+    按段落 (换行) 切分正文：短段落向后合并直到接近 target_chars，长段落按句子切开，
+    每段不超过 max_chars。返回段落字符串列表。
+    """
+    passages = []
+    current = ''
+    for line in (text or '').split('\n'):
+        line = _SPACES_RE.sub(' ', line).strip()
+        if not line:
+            continue
+        for piece in _pieces(line, max_chars):
+            if current and len(current) + len(piece) + 1 > max_chars:
+                passages.append(current)
+                current = ''
+            current = f'{current}\n{piece}' if current else piece
+            if len(current) >= target_chars:
+                passages.append(current)
+                current = ''
+    if current:
+        # 结尾的零碎内容并入上一段 (不超过上限时)，避免出现只有几个字的段落
+        if passages and len(current) < target_chars // 3 and len(passages[-1]) + len(current) + 1 <= max_chars:
+            passages[-1] = f'{passages[-1]}\n{current}'
+        else:
+            passages.append(current)
+    return passages
+
+
+def tokenize(text):
+    """检索用分词 (与查询一致使用 cut_for_search)，过滤单字与停用词。"""
+    return [w for w in jieba.cut_for_search(text or '')
+            if len(w.strip()) >= MIN_WORD_LENGTH and w not in STOP_WORDS]
+
+
+def passage_terms(text):
+    """返回 (Counter 词频, 词项总数)。"""
+    words = tokenize(text)
+    return Counter(words), len(words)
+
+
+def posting_column(pid):
+    return f'p:{pid}'.encode('utf-8')
+
+
+def posting_value(tf, length):
+    return json.dumps({'f': tf, 'l': length}).encode('utf-8')
+
+
+def estimate_tokens(text):
+    """
+    粗略估计大模型 token 数：汉字按 1 个 token 计 (Qwen 词表中常见词更省，这里偏保守)，
+    其余字符约 4 个一个 token。
+    """
+    text = text or ''
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
@@ -1,35 +1,306 @@
 # pipelines.py
-import happybase
 import hashlib
 import json
 import logging
 import os
-import jieba.analyse
+import time
+from io import BytesIO
 from urllib.parse import unquote, urlparse
+from scrapy.exceptions import DropItem
 from scrapy.pipelines.files import FilesPipeline
 from scrapy.utils.project import get_project_settings
+from twisted.internet import defer, threads
+from twisted.python.threadpool import ThreadPool
+from ustc_spider.crawl_state import CrawlStateStore, content_fingerprint
+from ustc_spider.filestore import AttachmentIndex, file_ext, object_relpath
+from ustc_spider.hbase_writer import BufferedHBaseWriter
+from ustc_spider.indexing import (CHANGED_AT_FORMAT, INDEX_FAMILIES, INDEX_TABLE, build_postings, iter_keywords,
+                                  posting_column)
+from ustc_spider.keywords import KeywordExtractor
+from ustc_spider.simhash import SimHashIndex, simhash
+from ustc_spider.telemetry import REGISTRY
+
+# 管道各阶段耗时 (由 UstcSpiderDownloaderMiddleware 定期导出)
+PIPELINE_STAGE_SECONDS = REGISTRY.histogram(
+    'crawl_pipeline_stage_seconds', '管道各阶段耗时 (file_download / keyword_extraction / hbase_write)', ['stage'])
+INDEX_POSTINGS = REGISTRY.counter('crawl_index_postings_total', '流式索引写入 / 删除的 posting 数', ['op'])
+
+
+def deferred_from_future(future):
+    """把 concurrent.futures.Future 包装成 Deferred，回调在 reactor 线程中触发。"""
+    from twisted.internet import reactor
+
+    d = defer.Deferred()
+
+    def _done(f):
+        try:
+            result = f.result()
+        except Exception as e:
+            reactor.callFromThread(d.errback, e)
+        else:
+            reactor.callFromThread(d.callback, result)
+
+    future.add_done_callback(_done)
+    return d
+
+
+# --- 阶段零：增量爬取 / 变化检测 ---
+class ChangeDetectionPipeline:
+    """
+    计算规范化正文指纹，与上一轮爬取记录比较：
+    - 指纹未变：刷新 ETag/Last-Modified 后丢弃 item，跳过附件下载、关键词提取和 HBase 写入
+    - 新页面或已变化：填入 item['fingerprint'] 继续向后传递，
+      由 HBasePipeline 在该行确认提交到 HBase 后登记到 crawl_state，并在 HBase 行上标记 info:changed_at
+    """
+    def __init__(self):
+        self.settings = get_project_settings()
+        self.enabled = self.settings.getbool('CONDITIONAL_RECRAWL_ENABLED')
+        self.state = None
+        self.unchanged = 0
+
+    def open_spider(self, spider):
+        # 以爬虫实际生效的配置为准 (scrapy reprocess 通过命令行优先级关闭了增量爬取)
+        self.enabled = spider.settings.getbool('CONDITIONAL_RECRAWL_ENABLED')
+        if self.enabled:
+            self.state = CrawlStateStore.from_settings(spider.settings)
+
+    def close_spider(self, spider):
+        if self.state:
+            logging.info(f"[CrawlState] Skipped {self.unchanged} unchanged pages")
+            self.state.release()
+
+    def process_item(self, item, spider):
+        item['fingerprint'] = content_fingerprint(
+            item.get('title', ''), item.get('parsed_text', ''), item.get('file_urls') or ())
+        if not self.state:
+            return item
+
+        previous = self.state.get(item['url'])
+        if previous and previous['fingerprint'] == item['fingerprint']:
+            self.state.record_unchanged(item['url'], item.get('etag'), item.get('last_modified'))
+            self.unchanged += 1
+            spider.crawler.stats.inc_value('conditional/unchanged_fingerprint')
+            raise DropItem(f"Unchanged since last crawl: {item['url']}")
+        return item
+
+
+# --- 阶段零 (续)：近似重复抑制 ---
+class NearDuplicatePipeline:
+    """
+    基于 SimHash 的近似重复检测 (列表分页、打印版、多个学院站点转载的同一通知)。
+
+    对 parsed_text 计算 64 位 SimHash，在分段索引中查找汉明距离 <= NEAR_DUP_MAX_DISTANCE 的已有页面：
+    - NEAR_DUP_ACTION = 'drop': 直接丢弃，不下载附件、不提取关键词、不写 HBase
+    - NEAR_DUP_ACTION = 'link': 只写一条带 info:canonical 的轻量行，不提取关键词、不进入索引
+    新页面的指纹放在 item['simhash'] 中，由 HBasePipeline 在该行确认提交后登记到 crawl_state，跨轮次有效。
+    """
+    def __init__(self):
+        self.settings = get_project_settings()
+        self.action = self.settings.get('NEAR_DUP_ACTION', 'drop')
+        self.min_chars = self.settings.getint('NEAR_DUP_MIN_CHARS', 200)
+        self.index = SimHashIndex(max_distance=self.settings.getint('NEAR_DUP_MAX_DISTANCE', 3))
+        self.state = None
+        self.suppressed = 0
+
+    def open_spider(self, spider):
+        self.state = CrawlStateStore.from_settings(spider.settings)
+        for url, h in self.state.load_simhashes():
+            self.index.add(url, h)
+        logging.info(f"[NearDup] Loaded {len(self.index)} fingerprints")
+
+    def close_spider(self, spider):
+        logging.info(f"[NearDup] Suppressed {self.suppressed} near-duplicate pages (action={self.action})")
+        self.state.release()
+
+    def process_item(self, item, spider):
+        text = item.get('parsed_text', '')
+        # 过短的页面 (导航页、空壳页) 指纹不可靠，不参与判重
+        if len(text) < self.min_chars:
+            return item
+
+        url = item['url']
+        h = simhash(text)
+        match = self.index.find(h, exclude=url)
+        if match is None:
+            # 内存索引立即生效 (本轮内后续页面即可命中)；持久化要等该行落库
+            self.index.add(url, h)
+            item['simhash'] = h
+            return item
+
+        canonical_url, distance = match
+        self.suppressed += 1
+        spider.crawler.stats.inc_value('neardup/suppressed')
+        if self.action == 'link':
+            item['canonical_url'] = canonical_url
+            return item
+        raise DropItem(f"Near-duplicate of {canonical_url} (distance {distance}): {url}")
+
 
 # --- 阶段一：文件下载管道 ---
 class MyFilesPipeline(FilesPipeline):
     """
     负责将 file_urls 里的链接下载到本地。
     执行完毕后，会将本地路径填入 item['files']。
+
+    存储采用内容寻址 (ustc_spider/filestore.py)：
+    - 文件实体按 SHA-256 存在 FILES_STORE/objects/ab/cd/ 下，相同内容只存一份
+    - item['files'] 中的 path 仍是 project/文件名 形式的友好路径 (硬链接到对象)，
+      同名不同内容的文件自动加哈希后缀，不再互相覆盖
+    - 已下载过的 URL (FILES_EXPIRES 天内) 直接复用，不再发起下载
+    FILES_STORE 不是本地目录 (如 s3://) 时退回原来的 project/文件名 直接存储。
     """
-    def file_path(self, request, response=None, info=None, *, item=None):
-        # 1. 获取项目名 (用于创建子文件夹)
-        project_name = item.get('project', 'default')
-        
-        # 2. 提取原始文件名
+    def __init__(self, store_uri, *args, **kwargs):
+        super().__init__(store_uri, *args, **kwargs)
+        basedir = getattr(self.store, 'basedir', None)
+        self.index = AttachmentIndex(basedir) if basedir else None
+        self._started = {}  # id(item) -> 开始下载附件的时间
+
+    def close_spider(self, spider):
+        if self.index:
+            self.index.close()
+
+    def get_media_requests(self, item, info):
+        requests = super().get_media_requests(item, info)
+        if requests:
+            self._started[id(item)] = time.perf_counter()
+        return requests
+
+    def item_completed(self, results, item, info):
+        start = self._started.pop(id(item), None)
+        if start is not None:
+            PIPELINE_STAGE_SECONDS.observe(time.perf_counter() - start, stage='file_download')
+        return super().item_completed(results, item, info)
+
+    @staticmethod
+    def _filename(request):
+        # 提取原始文件名
         url_path = urlparse(request.url).path
         decoded_path = unquote(url_path)
         filename = os.path.basename(decoded_path)
         
-        # 3. 容错处理
+        # 容错处理
         if not filename:
             filename = hashlib.md5(request.url.encode()).hexdigest() + ".file"
-            
-        # 最终保存在: FILES_STORE/project_name/filename
-        return f'{project_name}/{filename}'
+        return filename
+
+    @staticmethod
+    def _sha256(request, response):
+        # 同一响应在 file_path / file_downloaded 中都要用到，只计算一次
+        sha = request.meta.get('file_sha256')
+        if sha is None:
+            sha = request.meta['file_sha256'] = hashlib.sha256(response.body).hexdigest()
+        return sha
+
+    def file_path(self, request, response=None, info=None, *, item=None):
+        # 1. 获取项目名 (用于创建子文件夹)
+        project_name = item.get('project', 'default') if item else 'default'
+        filename = self._filename(request)
+
+        # 2. 友好路径: FILES_STORE/project_name/filename (被其他内容占用时加哈希后缀)
+        if self.index is None or response is None:
+            return f'{project_name}/{filename}'
+        return self.index.friendly_path(project_name, filename, self._sha256(request, response))
+
+    def media_to_download(self, request, info, *, item=None):
+        if self.index is None:
+            return super().media_to_download(request, info, item=item)
+
+        known = self.index.lookup_url(request.url)
+        if not known:
+            return None
+        sha, ext, fetched_at = known
+        age_days = (time.time() - (fetched_at or 0)) / 86400
+        if age_days > self.expires or not os.path.exists(self.index.object_abspath(sha, ext)):
+            return None
+
+        # 已知 URL：不下载，只保证当前学院目录下有对应的友好路径
+        project_name = item.get('project', 'default') if item else 'default'
+        path = self.index.friendly_path(project_name, self._filename(request), sha)
+        self.index.ensure_link(path, sha, ext)
+        info.spider.crawler.stats.inc_value('files/dedup_url')
+        return {'url': request.url, 'path': path, 'checksum': sha, 'status': 'uptodate'}
+
+    def file_downloaded(self, response, request, info, *, item=None):
+        if self.index is None:
+            return super().file_downloaded(response, request, info, item=item)
+
+        sha = self._sha256(request, response)
+        known = self.index.lookup_object(sha)
+        ext = known[0] if known else file_ext(self._filename(request))
+        if known and os.path.exists(self.index.object_abspath(sha, ext)):
+            # 不同 URL 下载到了相同内容：不再重复存储
+            info.spider.crawler.stats.inc_value('files/dedup_content')
+        else:
+            self.store.persist_file(object_relpath(sha, ext), BytesIO(response.body), info)
+            self.index.add_object(sha, ext, len(response.body))
+
+        self.index.ensure_link(self.file_path(request, response, info, item=item), sha, ext)
+        self.index.add_url(request.url, sha)
+        return sha
+
+
+class StreamingIndexer:
+    """
+    流式倒排索引：页面入库的同时把 posting 写入 ustc_keyword_index，无需再跑一遍
+    build_inverted_index.py 的全表扫描，新页面在一个 STREAMING_INDEX_FLUSH_INTERVAL 内即可被检索到。
+
+    - posting 编码与批量构建完全一致 (ustc_spider/indexing.py)
+    - 页面重新抓取后关键词变化时，删除旧关键词下该文档的 posting：
+      旧关键词取自 crawl_state 中记录的上次索引结果；启用流式索引前就已入库的页面没有记录，
+      此时从 ustc_web_data 读取旧的 info:keywords (必须在新数据写入之前读取)
+    - 新的关键词列表在该文档的 posting 变更全部提交后才记入 crawl_state
+    - 所有方法都在 HBasePipeline 的写线程中调用
+    """
+
+    def __init__(self, settings, state, source):
+        self.state = state
+        self.source = source  # ustc_web_data 的写入器，用于读取旧关键词
+        self.writer = BufferedHBaseWriter.from_settings(settings, table_name=INDEX_TABLE, families=INDEX_FAMILIES)
+        self.writer.flush_interval = settings.getfloat('STREAMING_INDEX_FLUSH_INTERVAL', 1.0)
+
+    def open(self):
+        self.writer.open()
+
+    def update(self, doc_id, keywords, doc_type='web', known=False):
+        """known: 该页面此前已写入过 ustc_web_data (重新抓取)。"""
+        postings = build_postings(doc_id, keywords, doc_type)
+
+        old_words = self.state.get_indexed_words(doc_id)
+        if old_words is None and known:
+            row = self.source.row(doc_id, columns=[b'info:keywords'])
+            try:
+                old_words = [w for w, _ in iter_keywords(json.loads(row.get(b'info:keywords', b'[]')))]
+            except ValueError:
+                old_words = []
+
+        column = posting_column(doc_id)
+        stale = set(old_words or ()) - postings.keys()
+        # 本次的关键词要等所有 posting 变更都确认提交后才登记，否则崩溃后下次更新会与从未写入的关键词比较
+        on_written = self._record_when_written(doc_id, list(postings), len(stale) + len(postings))
+        for word in stale:
+            self.writer.delete(word.encode('utf-8'), columns=[column], on_written=on_written)
+        for word, (col, value) in postings.items():
+            self.writer.put(word.encode('utf-8'), {col: value}, on_written=on_written)
+        INDEX_POSTINGS.inc(len(postings), op='put')
+        INDEX_POSTINGS.inc(len(stale), op='delete')
+
+    def _record_when_written(self, doc_id, words, mutations):
+        """返回 on_written 回调：该文档的 mutations 条变更全部提交后登记关键词；没有变更时立即登记。"""
+        if not mutations:
+            self.state.record_indexed_words(doc_id, words)
+            return None
+        remaining = [mutations]
+
+        def on_written():
+            # 回调都在写入器的刷新线程中 (_flush_lock 内) 依次调用
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                self.state.record_indexed_words(doc_id, words)
+
+        return on_written
+
+    def close(self):
+        self.writer.close()
 
 
 # --- 阶段二：处理与入库管道 ---
@@ -39,49 +310,112 @@ class HBasePipeline:
     1. 连接 HBase
     2. 对文本进行 TF-IDF 关键词提取 (含权重)
     3. 将元数据、关键词、文件路径存入 HBase
+
+    process_item 返回 Deferred，不在 reactor 线程里做任何阻塞操作：
+    - 关键词提取交给 KeywordExtractor 的进程池
+    - 写入交给 BufferedHBaseWriter 的写缓冲，按 HBASE_WRITE_BATCH_SIZE /
+      HBASE_WRITE_FLUSH_INTERVAL 批量提交，传输错误时自动重连重试
+    - 缓冲满时的同步 flush 在专用写线程中执行，不会卡住 reactor
+    - 同时在处理中的 item 数受 HBASE_PIPELINE_MAX_INFLIGHT 限制，
+      超出的 item 在信号量上排队，Scrapy 的 scraper slot 因此保持占用，进而对下载端形成反压
+    - STREAMING_INDEX_ENABLED 时同一写线程中顺带更新倒排索引 (StreamingIndexer)
     """
     def __init__(self):
         self.settings = get_project_settings()
-        self.host = self.settings.get('HBASE_HOST', '127.0.0.1')
-        self.port = self.settings.getint('HBASE_PORT', 9090)
         self.table_name = self.settings.get('HBASE_TABLE', 'ustc_web_data')
-        self.connection = None
-        self.table = None
+        self.max_inflight = self.settings.getint('HBASE_PIPELINE_MAX_INFLIGHT', 32)
+        self.writer = None
+        self.extractor = None
+        self.write_pool = None
+        self.inflight = None
+        self.state = None
+        self.indexer = None
+        self.record_changes = False
 
     def open_spider(self, spider):
         """爬虫启动时建立 HBase 连接"""
-        try:
-            # 必须匹配 hbase thrift start -f -c (Framed Transport + Compact Protocol)
-            self.connection = happybase.Connection(
-                self.host, port=self.port, timeout=20000,
-                transport='framed', protocol='compact'
-            )
-            self.connection.open()
-            
-            # 自动建表逻辑
-            tables = [t.decode('utf-8') for t in self.connection.tables()]
-            if self.table_name not in tables:
-                self.connection.create_table(
-                    self.table_name,
-                    {
-                        'info': dict(),      # 基础信息 (标题, URL, 关键词)
-                        'content': dict(),   # 文本内容
-                        'files': dict()      # 文件路径信息
-                    }
-                )
-            self.table = self.connection.table(self.table_name)
-            logging.info("✅ [HBase] Pipeline Ready.")
-        except Exception as e:
-            logging.error(f"❌ [HBase] Connection Failed: {e}")
+        # 关键词提取进程池 (每个工作进程只加载一次词典与 IDF)
+        self.extractor = KeywordExtractor.from_settings(self.settings)
+        self.inflight = defer.DeferredSemaphore(self.max_inflight)
+        self.write_pool = ThreadPool(minthreads=1, maxthreads=1, name='hbase-writer')
+        self.write_pool.start()
+
+        # 连接失败不再导致 item 被静默丢弃：写入器会在 flush 时自动重连
+        self.writer = BufferedHBaseWriter.from_settings(
+            self.settings,
+            table_name=self.table_name,
+            families={
+                'info': dict(),      # 基础信息 (标题, URL, 关键词)
+                'content': dict(),   # 文本内容
+                'files': dict()      # 文件路径信息
+            },
+        )
+        self.writer.open()
+        # 与 ChangeDetectionPipeline 一样以爬虫实际生效的配置为准：
+        # scrapy reprocess 关闭了增量爬取，回放的响应不应登记 ETag / 指纹
+        self.record_changes = spider.settings.getbool('CONDITIONAL_RECRAWL_ENABLED')
+        streaming_index = spider.settings.getbool('STREAMING_INDEX_ENABLED')
+        near_dup = any(path.endswith('.NearDuplicatePipeline') and order is not None
+                       for path, order in spider.settings.getdict('ITEM_PIPELINES').items())
+        if self.record_changes or streaming_index or near_dup:
+            self.state = CrawlStateStore.from_settings(spider.settings)
+        if streaming_index:
+            self.indexer = StreamingIndexer(self.settings, self.state, self.writer)
+            self.indexer.open()
+        logging.info("✅ [HBase] Pipeline Ready.")
 
     def close_spider(self, spider):
-        if self.connection:
-            self.connection.close()
+        # Scrapy 会等所有 process_item 的 Deferred 完成后才调用 close_spider，
+        # 此时在写线程中做最后一次 flush，确保缓冲区内的数据全部落库
+        from twisted.internet import reactor
+
+        d = threads.deferToThreadPool(reactor, self.write_pool, self._close_writers)
+        d.addErrback(lambda f: logging.error(f"❌ [HBase] Final flush failed: {f.getErrorMessage()}"))
+        d.addBoth(self._shutdown)
+        return d
+
+    def _close_writers(self):
+        if self.indexer:
+            self.indexer.close()
+        self.writer.close()
+
+    def _shutdown(self, _):
+        self.write_pool.stop()
+        self.extractor.close()
+        if self.state:
+            self.state.release()
 
     def process_item(self, item, spider):
-        # 如果连接没成功，直接返回，防止报错崩溃
-        if not self.table:
-            return item
+        return self.inflight.run(self._process_item, item)
+
+    def _state_callback(self, item):
+        """返回该行确认提交后登记 crawl_state (ETag/指纹、SimHash) 的回调；无需登记时返回 None。"""
+        url = item['url']
+        record_changes = self.record_changes
+        etag, last_modified, fingerprint = item.get('etag'), item.get('last_modified'), item.get('fingerprint')
+        h = item.get('simhash')
+        if not record_changes and h is None:
+            return None
+
+        def on_written():
+            if record_changes:
+                self.state.record_changed(url, etag, last_modified, fingerprint)
+            if h is not None:
+                self.state.record_simhash(url, h)
+        return on_written
+
+    def _write(self, row_key, data, keywords_data, known, on_written=None):
+        """
+        写线程中执行：先更新索引 (可能需要读取旧行)，再写入新数据。
+        on_written 在该行随批次确认提交后调用 (只进入缓冲区或写入失败时不调用)。
+        """
+        if self.indexer:
+            self.indexer.update(row_key, keywords_data, known=known)
+        self.writer.put(row_key, data, on_written=on_written)
+
+    @defer.inlineCallbacks
+    def _process_item(self, item):
+        from twisted.internet import reactor
 
         try:
             # === 1. 数据准备 ===
@@ -93,14 +427,16 @@ class HBasePipeline:
             # === 2. 关键词提取与分析 (TF-IDF) ===
             # 提取前 20 个高频词，并保留权重 (withWeight=True)
             # 权重对于后续的“文档检索引擎”计算相关度非常重要
+            # 格式: [{"word": "计算机", "weight": 1.23}, ...]
+            # 近似重复页 (已链接到规范页面) 不提取关键词、不存正文，避免进入索引
+            canonical_url = item.get('canonical_url')
+            if canonical_url:
+                raw_text = ''
             keywords_data = []
             if raw_text:
-                tags = jieba.analyse.extract_tags(
-                    raw_text, topK=20, withWeight=True, 
-                    allowPOS=('n', 'nz', 'v', 'vd', 'vn', 'l', 'a', 'd') # 仅提取实词
-                )
-                # 转换为 [{"word": "计算机", "weight": 1.23}, ...] 格式
-                keywords_data = [{"word": tag[0], "weight": tag[1]} for tag in tags]
+                start = time.perf_counter()
+                keywords_data = yield deferred_from_future(self.extractor.submit(raw_text))
+                PIPELINE_STAGE_SECONDS.observe(time.perf_counter() - start, stage='keyword_extraction')
 
             # === 3. 获取本地文件路径 ===
             local_file_paths = []
@@ -122,17 +458,31 @@ class HBasePipeline:
                 b'content:text': raw_text[:30000].encode('utf-8', 'ignore'),
                 
                 # 存入本地文件的路径列表
-                b'files:path': json.dumps(local_file_paths).encode('utf-8')
+                b'files:path': json.dumps(local_file_paths).encode('utf-8'),
+
+                # 增量处理标记：下游 ETL 可只处理 changed_at 之后变化的行
+                b'info:fingerprint': (item.get('fingerprint') or '').encode('utf-8'),
+                b'info:changed_at': time.strftime(CHANGED_AT_FORMAT).encode('utf-8'),
             }
+            if canonical_url:
+                data[b'info:canonical'] = canonical_url.encode('utf-8')
 
-            # === 5. 写入 HBase ===
-            self.table.put(row_key, data)
+            # === 5. 写入 HBase (进入写缓冲，缓冲满时在写线程中批量提交) ===
+            # 重新抓取的页面：流式索引需要据此处理旧 posting
+            known = bool(self.indexer and self.state.get(url))
+            # 新的指纹、SimHash 与 ETag/Last-Modified 要等该行真正落库后才登记：
+            # 否则进程在下次 flush 前退出时，下一轮会因 304 / 指纹未变 / 近似重复而永远跳过这个页面
+            on_written = self._state_callback(item)
+            start = time.perf_counter()
+            yield threads.deferToThreadPool(reactor, self.write_pool, self._write, row_key, data, keywords_data, known,
+                                            on_written)
+            PIPELINE_STAGE_SECONDS.observe(time.perf_counter() - start, stage='hbase_write')
             
             # 日志展示
             file_count = len(local_file_paths)
             # 打印前3个关键词方便调试
             top_kw = ",".join([k['word'] for k in keywords_data[:3]])
-            logging.info(f"💾 [Saved] {item['title'][:15]}... | Files: {file_count} | Keywords: {top_kw}")
+            logging.info(f"💾 [Queued] {item['title'][:15]}... | Files: {file_count} | Keywords: {top_kw}")
 
         except Exception as e:
             logging.error(f"❌ [Error] {e}")
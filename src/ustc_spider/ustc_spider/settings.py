@@ -6,6 +6,8 @@ BOT_NAME = 'ustc_spider'
 
 SPIDER_MODULES = ['ustc_spider.spiders']
 NEWSPIDER_MODULE = 'ustc_spider.spiders'
+# 自定义命令: scrapy reprocess (ustc_spider/commands/reprocess.py)
+COMMANDS_MODULE = 'ustc_spider.commands'
 
 # --- 2. 伪装与反爬策略 ---
 # 伪装成 Chrome 浏览器
@@ -31,15 +33,61 @@ DOWNLOAD_TIMEOUT = 15
 # --- 4. 核心：数据流管道配置 (Pipelines) ---
 # 数字越小，优先级越高，越先执行。
 ITEM_PIPELINES = {
-   # 阶段一：文件下载 (优先级 1 - 最高)
-   # 必须最先执行，确保文件下载完成后，才把本地路径传给后续步骤
-   'ustc_spider.pipelines.MyFilesPipeline': 1,
+   # 阶段零：变化检测 (优先级 10 - 最高)
+   # 内容指纹未变化的页面在这里直接丢弃，后续的下载、分词、入库全部跳过
+   'ustc_spider.pipelines.ChangeDetectionPipeline': 10,
+   # 近似重复 (SimHash) 抑制，同样在下载附件之前
+   'ustc_spider.pipelines.NearDuplicatePipeline': 20,
+
+   # 阶段一：文件下载 (优先级 100)
+   # 必须先于入库执行，确保文件下载完成后，才把本地路径传给后续步骤
+   'ustc_spider.pipelines.MyFilesPipeline': 100,
    
    # 阶段二：数据处理与入库 (优先级 300)
    # 在这里进行 Jieba 分词和写入 HBase
    'ustc_spider.pipelines.HBasePipeline': 300,
 }
 
+# --- 4.1 下载器中间件 ---
+DOWNLOADER_MIDDLEWARES = {
+   # 回放归档 (scrapy reprocess)：请求直接由归档返回，不访问网络
+   'ustc_spider.middlewares.ArchiveReplayMiddleware': 50,
+   # 原始网页归档：在解压与 304 过滤之后保存响应
+   'ustc_spider.middlewares.ArchiveMiddleware': 580,
+   # 增量爬取：条件请求 / 丢弃 304
+   'ustc_spider.middlewares.ConditionalRequestMiddleware': 590,
+   # 遥测：紧挨下载器，记录每个域名的耗时、状态码、字节数、重试与超时
+   'ustc_spider.middlewares.UstcSpiderDownloaderMiddleware': 950,
+}
+
+# --- 4.2 爬虫中间件 ---
+SPIDER_MIDDLEWARES = {
+   # 遥测：按域名统计解析耗时、产出的 item / 请求数
+   'ustc_spider.middlewares.UstcSpiderSpiderMiddleware': 543,
+   # 优先级爬取前沿：给链接打分写入 request.priority (需在 DepthMiddleware(900) 之后处理输出)
+   'ustc_spider.middlewares.FrontierMiddleware': 800,
+}
+
+# --- 4.3 爬取遥测 (ustc_spider/telemetry.py) ---
+# 每 TELEMETRY_INTERVAL 秒把指标以 Prometheus 文本格式写入 TELEMETRY_TEXTFILE
+# (可交给 node_exporter --collector.textfile.directory 采集)
+TELEMETRY_ENABLED = True
+TELEMETRY_TEXTFILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'crawl_state', 'metrics.prom')
+TELEMETRY_INTERVAL = 15
+# 非 0 时同时在 127.0.0.1:PORT/metrics 提供给 Prometheus 直接抓取
+TELEMETRY_PORT = 0
+
+# 链接打分权重 (ustc_spider/frontier.py)，未列出的使用默认值
+# FRONTIER_WEIGHTS = {'attachment': 100, 'attachment_per_file': 20, 'notice': 40, 'low_value': -30, 'depth': -10, 'change_rate': 30, 'new_url': 10}
+# 每个域名最多下载的页面数 (0 不限)；达到后只调度分数 >= FRONTIER_BUDGET_MIN_SCORE 的链接 (含附件页面上的链接、通知/下载页)
+FRONTIER_DOMAIN_BUDGET = 5000
+FRONTIER_BUDGET_MIN_SCORE = 40
+
+# 站点地图 / 订阅源发现 (ustc_spider/discovery.py)：额外请求各站点的 robots.txt、sitemap.xml 与 RSS/Atom，
+# 其中列出的页面直接作为叶子页抓取 (不受 DEPTH_LIMIT 限制)；lastmod 不晚于上次抓取时间的页面不再请求。
+# sites.yaml 中可为站点指定 sitemaps: [...] / feeds: [...]，默认尝试 /sitemap.xml 与首页声明的订阅源
+DISCOVERY_ENABLED = False
+
 # --- 5. 文件下载专用配置 ---
 # 告诉 Scrapy Item 中哪个字段是“文件下载链接”
 FILES_URLS_FIELD = 'file_urls'
@@ -62,11 +110,76 @@ HBASE_HOST = '127.0.0.1'  # 建议使用 IP
 HBASE_PORT = 9090         # Thrift 端口
 HBASE_TABLE = 'ustc_web_data'
 
+# --- 6.1 关键词提取 (ustc_spider/keywords.py) ---
+# 进程池大小：每个工作进程独立加载 jieba 词典与 IDF，0 表示在爬虫进程内同步提取
+KEYWORDS_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+KEYWORDS_TOPK = 20
+# 每个任务打包的文档数 (批量提交时减少进程间通信次数)
+KEYWORDS_CHUNK_SIZE = 8
+# 自定义 IDF 文件 / 用户词典 (None 使用 jieba 默认)
+KEYWORDS_IDF_PATH = None
+KEYWORDS_USER_DICT = None
+
+# HBasePipeline 同时处理中的 item 上限 (关键词提取 + 写入)，超出后对下载端形成反压
+HBASE_PIPELINE_MAX_INFLIGHT = 32
+
+# 写缓冲 (ustc_spider/hbase_writer.py)：攒够 BATCH_SIZE 条或每隔 FLUSH_INTERVAL 秒批量提交一次
+HBASE_WRITE_BATCH_SIZE = 100
+HBASE_WRITE_FLUSH_INTERVAL = 2.0
+# 传输错误时重连重试的次数与初始退避 (秒，指数增长)
+HBASE_WRITE_MAX_RETRIES = 5
+HBASE_WRITE_RETRY_BACKOFF = 1.0
+# HBase 不可用时缓冲区最多积压的变更数，超过后阻塞写线程形成反压
+HBASE_WRITE_MAX_PENDING = 5000
+
+# 流式索引：入库的同时把 posting 写入 ustc_keyword_index (批量提交)，页面重新抓取时删除旧 posting，
+# 新页面在 STREAMING_INDEX_FLUSH_INTERVAL 秒内即可检索，无需再运行 build_inverted_index.py
+STREAMING_INDEX_ENABLED = True
+STREAMING_INDEX_FLUSH_INTERVAL = 1.0
+
+# --- 6.2 增量爬取 (ustc_spider/crawl_state.py) ---
+# 按 URL 记录 ETag / Last-Modified / 正文指纹，再次爬取时发送条件请求，
+# 304 或指纹未变的页面不再解析、分词、写 HBase
+CONDITIONAL_RECRAWL_ENABLED = True
+CRAWL_STATE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'crawl_state', 'pages.sqlite3')
+# 只对该深度及以下的请求发送条件请求 (默认等于 DEPTH_LIMIT，即叶子页面)；
+# 更浅的列表页需要正文来发现子页面，不使用 304
+# CONDITIONAL_MIN_DEPTH = 2
+
+# --- 6.2.1 原始网页归档 (ustc_spider/archive.py) ---
+# HTML 响应压缩后追加写入 ARCHIVE_DIR 的分段文件，RowKey 偏移索引在 ARCHIVE_DIR/index.sqlite3；
+# 改进抽取/关键词逻辑后用 `scrapy reprocess universal_spider` 从归档回放，无需重爬
+ARCHIVE_ENABLED = True
+ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'archive')
+# 'zlib' (标准库) 或 'zstd' (需 pip install zstandard，压缩更快、体积更小)
+ARCHIVE_COMPRESSION = 'zlib'
+ARCHIVE_COMPRESSION_LEVEL = 6
+# 单个分段文件的大小上限 (MB)
+ARCHIVE_SEGMENT_MB = 256
+
+# --- 6.3 近似重复抑制 (ustc_spider/simhash.py) ---
+# 'drop': 直接丢弃近似重复页；'link': 写入带 info:canonical 的轻量行 (不提取关键词、不进索引)
+NEAR_DUP_ACTION = 'drop'
+# 64 位 SimHash 汉明距离阈值 (分段数 = 阈值 + 1)
+NEAR_DUP_MAX_DISTANCE = 3
+# 正文少于该字符数的页面不参与判重
+NEAR_DUP_MIN_CHARS = 200
+
+# 未变化页面被 DropItem 时不逐条打 WARNING 日志
+DEFAULT_DROPITEM_LOG_LEVEL = 'DEBUG'
+
 # --- 7. 日志配置 (可选) ---
 # 只显示 INFO 及以上级别的日志，减少控制台刷屏
 LOG_LEVEL = 'INFO'
 
-DUPEFILTER_CLASS = 'scrapy.dupefilters.RFPDupeFilter'  # 启用框架去重
+# 请求去重：定长 mmap Bloom filter (ustc_spider/dupefilters.py)，内存占用固定，
+# 设置 JOBDIR 时位数组保存为 JOBDIR/requests.bloom，随断点续爬一起恢复
+DUPEFILTER_CLASS = 'ustc_spider.dupefilters.BloomDupeFilter'
+# 位数组大小 (MB)：64 MB、误判率 1e-4 约可容纳 2800 万个 URL
+DUPEFILTER_BLOOM_MEMORY_MB = 64
+DUPEFILTER_BLOOM_ERROR_RATE = 1e-4
+# 不使用 JOBDIR 时也可指定固定文件；注意这样下一次全新爬取会跳过所有已见过的 URL
+# DUPEFILTER_BLOOM_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'crawl_state', 'requests.bloom')
 # ---------- 深度 2 层上限 ----------
 DEPTH_LIMIT = 2
 
@@ -82,4 +195,9 @@ CLOSESPIDER_TIMEOUT = 0
 
 # ---------- 队列防内存爆炸 ----------
 SCHEDULER_DISK_QUEUE = 'scrapy.squeues.PickleFifoDiskQueue'
-SCHEDULER_MEMORY_QUEUE = 'scrapy.squeues.LifoMemoryQueue'
\ No newline at end of file
+# 同一优先级内先进先出：分数相同的链接按发现顺序抓取，不再被最新发现的导航链接抢占
+SCHEDULER_MEMORY_QUEUE = 'scrapy.squeues.FifoMemoryQueue'
+# 严格按优先级出队，链接分数在所有域名之间比较 (FrontierMiddleware)。
+# 不用 DownloaderAwarePriorityQueue：它先挑下载器中最空闲的域名，只在该域名内部按优先级出队，
+# 高分的通知/下载页会排在其他域名的低分页面之后。单个站点的并发由 CONCURRENT_REQUESTS_PER_DOMAIN 限制
+SCHEDULER_PRIORITY_QUEUE = 'scrapy.pqueues.ScrapyPriorityQueue'
\ No newline at end of file
@@ -3,15 +3,20 @@ from scrapy.spiders import CrawlSpider, Rule
 from scrapy.linkextractors import LinkExtractor
 import yaml
 import os
-from urllib.parse import urlparse
+from urllib.parse import urljoin, urlparse
+from scrapy.http import HtmlResponse
+from ustc_spider.crawl_state import CrawlStateStore
+from ustc_spider.discovery import SITEMAP_INDEX, feed_links, parse_document, sitemaps_from_robots
+from ustc_spider.extract import DomainProjectMap, extract_page
 from ustc_spider.items import GeneralSpiderItem
+from ustc_spider.middlewares import ArchiveMiddleware
 
 class UniversalSpider(CrawlSpider):
     name = 'universal_spider'
     
     # 定义通用规则：只要在允许的域名内，就提取所有链接继续爬取
     rules = (
-        Rule(LinkExtractor(allow=()), callback='parse_item', follow=True),
+        Rule(LinkExtractor(allow=()), callback='parse_item', follow=True, process_request='skip_unchanged'),
     )
 
     def __init__(self, *args, **kwargs):
@@ -19,6 +24,7 @@ class UniversalSpider(CrawlSpider):
         
         # 1. 初始化配置列表 (修复 AttributeError 的关键)
         self.project_configs = []
+        self.domain_map = DomainProjectMap()
         self.start_urls = []
         self.allowed_domains = []
 
@@ -50,51 +56,145 @@ class UniversalSpider(CrawlSpider):
         except Exception as e:
             print(f"========== [FATAL] Error loading config: {e} ==========")
 
+        # 3. 域名 -> 学院 查找表 (parse_item 中按后缀查找，不再逐条 urlparse 配置)
+        self.domain_map = DomainProjectMap(self.project_configs)
+
+        # 4. 站点地图 / 订阅源发现：lastmod 不晚于上次抓取时间、被跳过的 URL (跟进链接时也不再请求)
+        self.unchanged_urls = set()
+        self.state = None
+
+    async def start(self):
+        # scrapy reprocess：只回放归档中的页面 (按写入顺序，基本是顺序读盘)，
+        # 由 ArchiveReplayMiddleware 从本地返回响应，直接交给 parse_item，不再跟进链接
+        if self.settings.getbool('ARCHIVE_REPLAY'):
+            archive = ArchiveMiddleware.open_archive(self.settings, readonly=True)
+            try:
+                keys = archive.keys(since=self.settings.get('ARCHIVE_REPLAY_SINCE'),
+                                    limit=self.settings.getint('ARCHIVE_REPLAY_LIMIT', 0))
+            finally:
+                archive.close()
+            self.logger.info(f"[Archive] Replaying {len(keys)} archived responses")
+            for row_key, url in keys:
+                yield scrapy.Request(url, callback=self.parse_item, dont_filter=True,
+                                     meta={'archive_row_key': row_key})
+            return
+
+        async for request in super().start():
+            yield request
+
+        # 站点地图 / 订阅源发现 (DISCOVERY_ENABLED)：与种子页并行抓取
+        if self.settings.getbool('DISCOVERY_ENABLED'):
+            for request in self.discovery_requests():
+                yield request
+
+    def closed(self, reason):
+        if self.state:
+            self.state.release()
+            self.state = None
+
+    # ---------- 站点地图 / 订阅源发现 (ustc_spider/discovery.py) ----------
+    def discovery_requests(self):
+        """
+        每个站点请求 robots.txt (其中的 Sitemap: 条目) 与站点地图 (sites.yaml 中的 sitemaps，默认 /sitemap.xml)，
+        以及 sites.yaml 中配置的 feeds；首页声明的订阅源在 parse_start_url 中发现。
+        """
+        meta = {'dont_conditional': True}
+        for site in self.project_configs or []:
+            base = site['url']
+            yield scrapy.Request(urljoin(base, '/robots.txt'), callback=self.parse_robots, meta=dict(meta))
+            for url in site.get('sitemaps') or ['/sitemap.xml']:
+                yield scrapy.Request(urljoin(base, url), callback=self.parse_discovery, meta=dict(meta))
+            for url in site.get('feeds') or []:
+                yield scrapy.Request(urljoin(base, url), callback=self.parse_discovery, meta=dict(meta))
+
+    def parse_start_url(self, response, **kwargs):
+        if not self.settings.getbool('DISCOVERY_ENABLED') or not isinstance(response, HtmlResponse):
+            return []
+        return [scrapy.Request(response.urljoin(href), callback=self.parse_discovery, meta={'dont_conditional': True})
+                for href in feed_links(response.selector.root)]
+
+    def parse_robots(self, response):
+        for url in sitemaps_from_robots(response.body.decode('utf-8', 'ignore')):
+            yield scrapy.Request(response.urljoin(url), callback=self.parse_discovery, meta={'dont_conditional': True})
+
+    def parse_discovery(self, response):
+        try:
+            kind, entries = parse_document(response.body)
+        except Exception as e:
+            self.logger.warning(f"[Discovery] Failed to parse {response.url}: {e}")
+            return
+        if not kind:
+            return
+
+        # 站点地图 / 订阅源本身不占链接层级：其中列出的页面与起始页同为第 0 层，不会被 DEPTH_LIMIT 截断
+        # (depth_reset 由 DepthMiddleware 处理；直接写 meta['depth'] 会被它按 response 深度 + 1 覆盖)
+        stats = self.crawler.stats
+
+        if kind == SITEMAP_INDEX:
+            for url, _ in entries:
+                yield scrapy.Request(response.urljoin(url), callback=self.parse_discovery,
+                                     meta={'dont_conditional': True, 'depth_reset': True})
+            return
+
+        # lastmod 不晚于上次抓取时间的页面视为未变化，不发请求
+        urls = [response.urljoin(url) for url, _ in entries]
+        fetched = self.crawl_state().get_fetch_times(urls) if self.crawl_state() else {}
+        for url, (_, lastmod) in zip(urls, entries):
+            previous = fetched.get(url)
+            if previous and lastmod and lastmod <= previous:
+                self.unchanged_urls.add(url)
+                stats.inc_value('discovery/skipped_unchanged')
+                continue
+            stats.inc_value('discovery/seeded')
+            # 文章页不需要再跟进链接，直接交给 parse_item
+            yield scrapy.Request(url, callback=self.parse_item,
+                                 meta={'leaf_page': True, 'lastmod': lastmod, 'depth_reset': True})
+
+    def crawl_state(self):
+        # 未开启增量爬取时没有抓取记录可比较，所有条目都会被请求
+        if self.state is None and self.settings.getbool('CONDITIONAL_RECRAWL_ENABLED'):
+            self.state = CrawlStateStore.from_settings(self.settings)
+        return self.state
+
+    def skip_unchanged(self, request, response):
+        # 跟进链接时遇到已由站点地图判定为未变化的页面，同样不再请求
+        if request.url in self.unchanged_urls:
+            self.crawler.stats.inc_value('discovery/skipped_unchanged_links')
+            return None
+        return request
+
     def parse_item(self, response):
-        # 1. 确定当前页面属于哪个学院 (Project)
-        project_name = 'unknown'
-        current_domain = urlparse(response.url).netloc
-        
-        for config in self.project_configs:
-            # 如果配置里的域名出现在当前 URL 的域名中
-            config_domain = urlparse(config['url']).netloc
-            if config_domain in current_domain:
-                project_name = config['name']
-                break
-        
-        # 2. 提取基础信息
+        # 非 HTML 响应 (链接直接指向 PDF 等) 没有 DOM，附件由 FilesPipeline 负责
+        if not isinstance(response, HtmlResponse):
+            return
+
+        # 1. 确定当前页面属于哪个学院 (Project)：预先构建的域名后缀表
+        project_name = self.domain_map.lookup(response.url)
+
+        # 2. 单次遍历 DOM：标题、正文 (跳过脚本/导航/页脚)、发布日期、附件链接
+        page = extract_page(response.selector.root, response.urljoin)
+
         item = GeneralSpiderItem()
         item['url'] = response.url
         item['project'] = project_name
-        
-        # 提取标题 (优先取 title 标签，取不到就为空)
-        item['title'] = response.xpath('//title/text()').get(default='').strip()
-        
-        # 3. 提取正文 (简单的清洗逻辑)
-        # 提取所有 p 标签和 div 标签的文本，去除空白
-        text_nodes = response.xpath('//body//text()').getall()
-        clean_text = ''.join([t.strip() for t in text_nodes if t.strip()])
-        item['parsed_text'] = clean_text[:50000] # 限制长度防止溢出
-        
+        item['title'] = page['title']
+        item['parsed_text'] = page['text']
+        item['date'] = page['date']
+
         # 保存原始 HTML (用于后续容错)
         # item['html_content'] = response.text 
         # 考虑到 HBase 存储压力，暂不存原始 HTML，如果需要可取消注释
         item['html_content'] = "" 
 
-        # 4. 提取附件链接
-        # 寻找所有 href 结尾是 pdf/doc/docx/xls/xlsx 的链接
-        file_urls = []
-        links = response.css('a::attr(href)').getall()
-        for link in links:
-            lower_link = link.lower()
-            if lower_link.endswith(('.pdf', '.doc', '.docx', '.xls', '.xlsx', '.zip')):
-                # 将相对链接转换为绝对链接
-                abs_url = response.urljoin(link)
-                file_urls.append(abs_url)
-        
+        # 缓存校验字段，供下次爬取发送条件请求 (If-None-Match / If-Modified-Since)
+        item['etag'] = response.headers.get('ETag', b'').decode('latin-1')
+        item['last_modified'] = response.headers.get('Last-Modified', b'').decode('latin-1')
+
+        # 3. 附件链接 (pdf/doc/docx/xls/xlsx/zip，已转为绝对链接并去重)
+        file_urls = page['file_urls']
         item['file_urls'] = file_urls
         
-        # 5. 只有当有内容或者有文件时才 yield
+        # 4. 只有当有内容或者有文件时才 yield
         if item['title'] or item['file_urls']:
             print(f"[Scraper] Found: {item['title']} - Files: {len(file_urls)}")
-            yield item
\ No newline at end of file
+            yield item
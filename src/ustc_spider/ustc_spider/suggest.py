@@ -0,0 +1,210 @@
+# suggest.py
+"""
+搜索框自动补全 (输入前缀 -> 推荐词)
+
+每次按键都要返回，不能去 HBase 扫描 ustc_keyword_index 的行键。这里把词典整理成按字典序排好的数组，
+常驻内存，前缀查询 = 两次二分查找得到一个连续区间，再取区间内权重最高的 k 个：
+- 区间不大 (<= HEAVY_PREFIX_SIZE) 时直接在区间内排序
+- 区间很大的短前缀 ("计"、"研究") 在构建时预先算好前 TOP_K 个 (类似 FST 在节点上缓存 top-k)，
+  因此任何前缀的查询都只处理很少的元素，耗时在微秒级
+
+权重 = log(1 + 文档频率) + QUERY_LOG_WEIGHT * log(1 + 查询次数)：
+文档频率来自倒排索引每行的 posting 数，查询次数来自 Web 服务的查询日志 (QueryLog)，
+出现次数达到 MIN_QUERY_COUNT 的完整查询本身也作为推荐词 (一次性的查询不会被推荐给别人)。
+
+文件 (etl/build_suggest_index.py 生成，写临时文件后 os.replace 原子替换):
+    {"version": 1, "built_at": ..., "terms": [按字典序], "weights": [...], "top": {前缀: [下标, ...]}}
+读端 (SuggestIndex) 检测到文件变化后在后台加载新数据，加载完成后一次性替换引用，查询不会看到半新半旧的数据。
+
+不依赖 Scrapy。
+"""
+import bisect
+import json
+import logging
+import math
+import os
+import threading
+import time
+import unicodedata
+
+TOP_K = 10
+HEAVY_PREFIX_SIZE = 256
+QUERY_LOG_WEIGHT = 2.0
+MIN_QUERY_COUNT = 2
+MAX_TERM_LENGTH = 40
+# 大于任何字符的哨兵，prefix + _MAX_CHAR 是该前缀区间的上界
+_MAX_CHAR = '\U0010ffff'
+
+
+def normalize(text):
+    """全角转半角、小写、去掉首尾空白 (词典与输入使用同一规则)。"""
+    return unicodedata.normalize('NFKC', text or '').strip().lower()
+
+
+def term_weight(df=0, query_count=0):
+    return math.log1p(df) + QUERY_LOG_WEIGHT * math.log1p(query_count)
+
+
+# ---------- 构建 ----------
+def build_suggest_data(weighted_terms, top_k=TOP_K, heavy_prefix_size=HEAVY_PREFIX_SIZE):
+    """
+    weighted_terms: {词: 权重}。返回可写入文件的 dict：
+    按字典序排序的词与权重，以及区间超过 heavy_prefix_size 的前缀的前 top_k 个下标。
+    """
+    terms = sorted(t for t in weighted_terms if t and len(t) <= MAX_TERM_LENGTH)
+    weights = [round(weighted_terms[t], 4) for t in terms]
+
+    top = {}
+    # 逐个前缀长度分组：排序后同一前缀的词是连续的
+    depth = 1
+    while True:
+        found_heavy = False
+        start = 0
+        while start < len(terms):
+            if len(terms[start]) < depth:
+                start += 1
+                continue
+            prefix = terms[start][:depth]
+            end = bisect.bisect_left(terms, prefix + _MAX_CHAR, start)
+            if end - start > heavy_prefix_size:
+                found_heavy = True
+                best = sorted(range(start, end), key=lambda i: -weights[i])[:top_k]
+                top[prefix] = best
+            start = end
+        if not found_heavy:
+            break
+        depth += 1
+
+    return {'version': 1, 'built_at': time.strftime('%Y-%m-%d %H:%M:%S'), 'terms': terms, 'weights': weights,
+            'top': top}
+
+
+def write_suggest_index(path, data):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+# ---------- 查询 ----------
+class _SuggestData:
+    __slots__ = ('terms', 'weights', 'top', 'mtime')
+
+    def __init__(self, raw, mtime):
+        self.terms = raw['terms']
+        self.weights = raw['weights']
+        self.top = raw.get('top', {})
+        self.mtime = mtime
+
+
+class SuggestIndex:
+    def __init__(self, path, check_interval=30):
+        self.path = path
+        self.check_interval = check_interval
+        self._data = self._read()
+        self._checked_at = time.monotonic()
+        self._reloading = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path, **kwargs):
+        """文件不存在 (尚未构建) 时返回 None。"""
+        if not path or not os.path.exists(path):
+            return None
+        return cls(path, **kwargs)
+
+    def __len__(self):
+        return len(self._data.terms)
+
+    def _read(self):
+        mtime = os.stat(self.path).st_mtime
+        with open(self.path, encoding='utf-8') as f:
+            data = _SuggestData(json.load(f), mtime)
+        logging.info(f"[Suggest] Loaded {len(data.terms)} terms ({len(data.top)} precomputed prefixes) "
+                     f"from {self.path}")
+        return data
+
+    def reload_if_changed(self):
+        """每 check_interval 秒检查一次文件是否被替换；有变化时在后台线程加载，完成后替换引用。"""
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if self._reloading or now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+            try:
+                changed = os.stat(self.path).st_mtime != self._data.mtime
+            except OSError:
+                return
+            if not changed:
+                return
+            self._reloading = True
+        threading.Thread(target=self._reload, name='suggest-reload', daemon=True).start()
+
+    def _reload(self):
+        try:
+            self._data = self._read()
+        except Exception as e:
+            logging.warning(f"[Suggest] Reload failed, keeping the previous index: {e}")
+        finally:
+            self._reloading = False
+
+    def suggest(self, prefix, k=TOP_K):
+        """返回 [(词, 权重)]，按权重降序；前缀为空返回 []。"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        data = self._data  # 只读一次引用，重新加载不影响进行中的查询
+        cached = data.top.get(prefix)
+        if cached is not None and k <= len(cached):
+            candidates = cached[:k]
+        else:
+            lo = bisect.bisect_left(data.terms, prefix)
+            hi = bisect.bisect_left(data.terms, prefix + _MAX_CHAR, lo)
+            if hi - lo > HEAVY_PREFIX_SIZE and cached is not None:
+                candidates = cached
+            else:
+                candidates = sorted(range(lo, hi), key=lambda i: -data.weights[i])[:k]
+        return [(data.terms[i], data.weights[i]) for i in candidates]
+
+
+# ---------- 查询日志 ----------
+class QueryLog:
+    """
+    Web 服务的查询日志 (TSV: 时间\t结果数\t归一化查询)，供 build_suggest_index.py 统计热门查询。
+    追加写入，进程内加锁；只记录有结果的查询。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8', buffering=1)
+        self._lock = threading.Lock()
+
+    def append(self, query, result_count):
+        query = normalize(query).replace('\t', ' ').replace('\n', ' ')
+        if not query or not result_count or len(query) > MAX_TERM_LENGTH:
+            return
+        line = f"{time.strftime('%Y-%m-%d %H:%M:%S')}\t{result_count}\t{query}\n"
+        with self._lock:
+            self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    @staticmethod
+    def read_counts(path, since=None):
+        """{归一化查询: 次数}；since 为 'YYYY-MM-DD HH:MM:SS' 时只统计此后的记录。"""
+        counts = {}
+        if not path or not os.path.exists(path):
+            return counts
+        with open(path, encoding='utf-8', errors='ignore') as f:
+            for line in f:
+                parts = line.rstrip('\n').split('\t')
+                if len(parts) != 3 or (since and parts[0] < since):
+                    continue
+                counts[parts[2]] = counts.get(parts[2], 0) + 1
+        return counts
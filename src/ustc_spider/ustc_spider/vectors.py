@@ -0,0 +1,347 @@
+# vectors.py
+"""
+稠密向量索引 (与关键词倒排索引、标题扫描融合打分)
+
+关键词检索只看每篇文档的 20 个关键词，换一种说法提问 ("怎么退课" vs "课程退选办法") 就召回不到。
+这里为段落 (ustc_passages) 建立向量索引，检索时把问题编码成向量，与所有段落做内积 (余弦相似度)。
+
+目录结构 (etl/build_vector_index.py 生成，整体替换，读端检测到 meta.json 变化后自动重新加载):
+    meta.json       维度、条数、编码器、IVF 分区数、构建时间
+    vectors.f16     float16 行主序矩阵 (count x dim)，np.memmap 映射；已 L2 归一化
+    ids.txt         每行一个段落 ID ({DocID}#{序号})，与矩阵行一一对应
+    centroids.npy   (IVF 模式) 分区中心 (nlist x dim, float32)
+    offsets.npy     (IVF 模式) 各分区在矩阵中的起止行 (nlist + 1)，矩阵按分区连续存放
+
+检索：
+- 暴力模式：一次矩阵乘法 (batch x dim) @ (dim x count)，矩阵不大时转成 float32 常驻内存，走 BLAS
+- IVF 模式：先与分区中心比较，只扫描最相近的 nprobe 个分区 (大规模语料时使用)
+
+编码器可插拔 (get_embedder)：
+- 'hashing[:维度]'  确定性的本地编码器 (分词 + 汉字二元组的特征哈希)，无需模型，便于测试与离线环境
+- 'ollama:<模型>'   本地 Ollama 的嵌入模型 (如 bge-m3)，需 langchain-ollama
+
+不依赖 Scrapy。
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from functools import lru_cache
+
+import numpy as np
+
+from ustc_spider.passages import doc_of, tokenize
+
+META_FILENAME = 'meta.json'
+VECTORS_FILENAME = 'vectors.f16'
+IDS_FILENAME = 'ids.txt'
+CENTROIDS_FILENAME = 'centroids.npy'
+OFFSETS_FILENAME = 'offsets.npy'
+
+# 矩阵不超过该大小 (MB，按 float32 计) 时常驻内存，否则按块从 memmap 转换
+DEFAULT_CACHE_MB = 1024
+_SCAN_CHUNK_ROWS = 65536
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+# ---------- 编码器 ----------
+@lru_cache(maxsize=200000)
+def _feature_hash(feature):
+    return int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class HashingEmbedder:
+    """
+    确定性的本地编码器：词项 (与检索同样的分词) 与汉字二元组做带符号特征哈希，再 L2 归一化。
+    没有语义泛化能力，但跨进程、跨机器结果一致，用作测试与无模型环境下的替身。
+    """
+
+    def __init__(self, dim=256):
+        self.dim = dim
+        self.name = f'hashing:{dim}'
+
+    def _features(self, text):
+        words = tokenize(text)
+        chars = [c for c in (text or '') if '一' <= c <= '鿿']
+        return words + [a + b for a, b in zip(chars, chars[1:])]
+
+    def embed(self, texts):
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = _feature_hash(feature)
+                matrix[row, h % self.dim] += 1.0 if (h >> 63) & 1 else -1.0
+        return _normalize(matrix)
+
+    def embed_query(self, text):
+        return self.embed([text])[0]
+
+
+class OllamaEmbedder:
+    """本地 Ollama 嵌入模型 (如 bge-m3、nomic-embed-text)。"""
+
+    def __init__(self, model):
+        from langchain_ollama import OllamaEmbeddings
+
+        self.client = OllamaEmbeddings(model=model)
+        self.name = f'ollama:{model}'
+
+    def embed(self, texts):
+        return _normalize(np.asarray(self.client.embed_documents(list(texts)), dtype=np.float32))
+
+    def embed_query(self, text):
+        return _normalize(np.asarray([self.client.embed_query(text)], dtype=np.float32))[0]
+
+
+def get_embedder(spec):
+    """'hashing' / 'hashing:512' / 'ollama:bge-m3' -> 编码器实例。"""
+    kind, _, arg = (spec or 'hashing').partition(':')
+    if kind == 'hashing':
+        return HashingEmbedder(int(arg) if arg else 256)
+    if kind == 'ollama':
+        return OllamaEmbedder(arg or 'bge-m3')
+    raise ValueError(f"Unknown embedder: {spec}")
+
+
+# ---------- 构建 ----------
+class VectorIndexWriter:
+    """
+    逐批追加向量，finalize() 时 (可选) 训练 IVF 分区并按分区重排，
+    最后把临时目录整体替换为正式目录，读端不会看到写了一半的索引。
+    """
+
+    def __init__(self, directory, dim, embedder_name):
+        self.directory = directory
+        self.dim = dim
+        self.embedder_name = embedder_name
+        self.tmp_dir = f'{directory}.tmp'
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        os.makedirs(self.tmp_dir)
+        self._vectors = open(os.path.join(self.tmp_dir, VECTORS_FILENAME), 'wb')
+        self._ids = []
+
+    def add(self, ids, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.shape != (len(ids), self.dim):
+            raise ValueError(f"Expected {len(ids)} x {self.dim} vectors, got {vectors.shape}")
+        self._vectors.write(_normalize(vectors).astype(np.float16).tobytes())
+        self._ids.extend(ids)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def finalize(self, nlist=0, iterations=10, sample_size=50000, seed=0):
+        self._vectors.close()
+        count = len(self._ids)
+        ids = self._ids
+        meta = {'dim': self.dim, 'count': count, 'embedder': self.embedder_name, 'nlist': 0,
+                'built_at': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+        if nlist and count > nlist:
+            path = os.path.join(self.tmp_dir, VECTORS_FILENAME)
+            vectors = np.memmap(path, dtype=np.float16, mode='r', shape=(count, self.dim))
+            centroids = _train_centroids(vectors, nlist, iterations, sample_size, seed)
+            assign = np.concatenate([
+                np.argmax(np.asarray(vectors[start:start + _SCAN_CHUNK_ROWS], dtype=np.float32) @ centroids.T, axis=1)
+                for start in range(0, count, _SCAN_CHUNK_ROWS)
+            ])
+            order = np.argsort(assign, kind='stable')
+            ordered_path = path + '.ivf'
+            with open(ordered_path, 'wb') as f:
+                for start in range(0, count, _SCAN_CHUNK_ROWS):
+                    f.write(np.asarray(vectors[order[start:start + _SCAN_CHUNK_ROWS]]).tobytes())
+            del vectors
+            os.replace(ordered_path, path)
+            ids = [ids[i] for i in order]
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))]).astype(np.int64)
+            np.save(os.path.join(self.tmp_dir, CENTROIDS_FILENAME), centroids)
+            np.save(os.path.join(self.tmp_dir, OFFSETS_FILENAME), offsets)
+            meta['nlist'] = nlist
+
+        with open(os.path.join(self.tmp_dir, IDS_FILENAME), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(ids))
+        with open(os.path.join(self.tmp_dir, META_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+        old_dir = f'{self.directory}.old'
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(self.directory):
+            os.rename(self.directory, old_dir)
+        os.rename(self.tmp_dir, self.directory)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        return meta
+
+
+def _train_centroids(vectors, nlist, iterations, sample_size, seed):
+    """在采样上做球面 k-means (内积分配、中心归一化)。"""
+    rng = np.random.default_rng(seed)
+    count = vectors.shape[0]
+    sample_idx = np.sort(rng.choice(count, size=min(count, sample_size), replace=False))
+    sample = np.asarray(vectors[sample_idx], dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        for c in range(nlist):
+            members = sample[assign == c]
+            # 空分区重新随机取一个样本作为中心
+            centroids[c] = members.sum(axis=0) if len(members) else sample[rng.integers(len(sample))]
+        centroids = _normalize(centroids)
+    return centroids.astype(np.float32)
+
+
+# ---------- 检索 ----------
+class _VectorData:
+    """一次加载的完整索引；加载后不再修改，重新加载时整体替换引用，检索不会看到新旧混杂的数据。"""
+
+    __slots__ = ('meta', 'dim', 'count', 'embedder', 'ids', 'vectors', 'matrix', 'centroids', 'offsets', 'mtime')
+
+    def __init__(self, directory, cache_mb):
+        meta_path = os.path.join(directory, META_FILENAME)
+        self.mtime = os.stat(meta_path).st_mtime
+        with open(meta_path, encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.dim = self.meta['dim']
+        self.count = self.meta['count']
+        self.embedder = get_embedder(self.meta['embedder'])
+        with open(os.path.join(directory, IDS_FILENAME), encoding='utf-8') as f:
+            self.ids = f.read().split('\n') if self.count else []
+        self.vectors = np.memmap(os.path.join(directory, VECTORS_FILENAME), dtype=np.float16, mode='r',
+                                 shape=(self.count, self.dim)) if self.count else np.zeros((0, self.dim), np.float16)
+        # 放得下就转成 float32 常驻内存：float16 没有 BLAS 支持，逐次转换比矩阵乘法本身还慢
+        self.matrix = (np.asarray(self.vectors, dtype=np.float32)
+                       if self.count * self.dim * 4 <= cache_mb * 1024 * 1024 else None)
+        if self.meta.get('nlist'):
+            self.centroids = np.load(os.path.join(directory, CENTROIDS_FILENAME))
+            self.offsets = np.load(os.path.join(directory, OFFSETS_FILENAME))
+        else:
+            self.centroids = self.offsets = None
+
+    def rows(self, start, stop):
+        if self.matrix is not None:
+            return self.matrix[start:stop]
+        return np.asarray(self.vectors[start:stop], dtype=np.float32)
+
+    def scan(self, queries, start, stop):
+        """返回 queries 与 [start, stop) 行的内积矩阵 (batch x rows)。"""
+        if self.matrix is not None:
+            return queries @ self.matrix[start:stop].T
+        return np.concatenate([queries @ self.rows(s, min(s + _SCAN_CHUNK_ROWS, stop)).T
+                               for s in range(start, stop, _SCAN_CHUNK_ROWS)], axis=1)
+
+
+class VectorIndex:
+    def __init__(self, directory, cache_mb=DEFAULT_CACHE_MB):
+        self.directory = directory
+        self.cache_mb = cache_mb
+        self._data = self._read()
+        self._reloading = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, directory, **kwargs):
+        """目录不存在 (尚未构建) 时返回 None。"""
+        if not directory or not os.path.exists(os.path.join(directory, META_FILENAME)):
+            return None
+        return cls(directory, **kwargs)
+
+    @property
+    def meta(self):
+        return self._data.meta
+
+    @property
+    def count(self):
+        return self._data.count
+
+    @property
+    def dim(self):
+        return self._data.dim
+
+    def _read(self):
+        data = _VectorData(self.directory, self.cache_mb)
+        logging.info(f"[VectorIndex] Loaded {data.count} vectors ({data.meta['embedder']}, "
+                     f"nlist={data.meta.get('nlist', 0)}) from {self.directory}")
+        return data
+
+    def reload_if_changed(self):
+        """
+        ETL 重建索引后 (meta.json 被替换) 在后台线程加载，完成后替换引用；同一时间只有一个线程在加载。
+        调用方自行控制调用频率；返回是否开始了重新加载。
+        """
+        with self._lock:
+            if self._reloading:
+                return False
+            try:
+                changed = os.stat(os.path.join(self.directory, META_FILENAME)).st_mtime != self._data.mtime
+            except OSError:
+                return False
+            if not changed:
+                return False
+            self._reloading = True
+        threading.Thread(target=self._reload, name='vector-reload', daemon=True).start()
+        return True
+
+    def _reload(self):
+        try:
+            self._data = self._read()
+        except Exception as e:
+            logging.warning(f"[VectorIndex] Reload failed, keeping the previous index: {e}")
+        finally:
+            self._reloading = False
+
+    @staticmethod
+    def _top(scores, k):
+        k = min(k, scores.shape[-1])
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        idx = np.argpartition(-scores, k - 1)[:k]
+        return idx[np.argsort(-scores[idx])]
+
+    def search(self, queries, k=50, nprobe=16):
+        """
+        queries: (batch x dim) 已归一化的查询向量 (或单个 dim 维向量)。
+        返回每个查询的 [(id, score), ...] (按分数降序)。
+        """
+        # 只读一次引用，重新加载不影响进行中的检索
+        return self._search(self._data, queries, k, nprobe)
+
+    def _search(self, data, queries, k, nprobe):
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if not data.count:
+            return [[] for _ in queries]
+
+        if data.centroids is None:
+            scores = data.scan(queries, 0, data.count)
+            return [[(data.ids[i], float(row[i])) for i in self._top(row, k)] for row in scores]
+
+        results = []
+        probe = np.argsort(-(queries @ data.centroids.T), axis=1)[:, :nprobe]
+        for query, lists in zip(queries, probe):
+            ranges = [(data.offsets[c], data.offsets[c + 1]) for c in lists if data.offsets[c + 1] > data.offsets[c]]
+            if not ranges:
+                results.append([])
+                continue
+            rows = np.concatenate([np.arange(s, e) for s, e in ranges])
+            scores = np.concatenate([data.scan(query[None, :], s, e)[0] for s, e in ranges])
+            results.append([(data.ids[rows[i]], float(scores[i])) for i in self._top(scores, k)])
+        return results
+
+    def search_docs(self, text, k=50, nprobe=16, min_score=0.0):
+        """把问题编码后检索段落，按文档聚合 (取最高分)，返回 [(doc_id, score)]。"""
+        data = self._data  # 编码与检索使用同一份索引 (重建可能换了编码器或维度)
+        query = data.embedder.embed_query(text)
+        best = {}
+        for pid, score in self._search(data, query, k * 3, nprobe)[0]:
+            if score < min_score:
+                continue
+            doc_id = doc_of(pid)
+            if score > best.get(doc_id, -1.0):
+                best[doc_id] = score
+        return sorted(best.items(), key=lambda x: x[1], reverse=True)[:k]
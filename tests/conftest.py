@@ -0,0 +1,77 @@
+import os
+import sys
+
+import pytest
+
+# 与各脚本相同的导入方式：爬虫包、ETL 脚本与 Web 服务模块分别位于 src 下的三个目录
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+for subdir in ('ustc_spider', 'etl', 'rag'):
+    path = os.path.join(SRC_DIR, subdir)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from ustc_spider.crawl_state import CrawlStateStore  # noqa: E402
+from ustc_spider.hbase_writer import BufferedHBaseWriter  # noqa: E402
+
+
+class FakeBatch:
+    def __init__(self, table):
+        self.table = table
+        self.ops = []
+
+    def put(self, row_key, data):
+        self.ops.append(('put', row_key, data))
+
+    def delete(self, row_key, columns=None):
+        self.ops.append(('delete', row_key, columns))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            if self.table.error:
+                raise self.table.error
+            self.table.committed.extend(self.ops)
+
+
+class FakeTable:
+    def __init__(self):
+        self.committed = []
+        self.error = None  # 设为异常实例时，下一次提交失败
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+@pytest.fixture
+def table():
+    return FakeTable()
+
+
+@pytest.fixture
+def writer(monkeypatch, table):
+    w = BufferedHBaseWriter('localhost', 9090, 'test', batch_size=10, max_retries=0, retry_backoff=0)
+    # 不连接真实 HBase：断开重连时换回同一张内存表
+    monkeypatch.setattr(w, '_connect', lambda: setattr(w, 'table', table))
+    w.table = table
+    return w
+
+
+@pytest.fixture
+def state(tmp_path):
+    store = CrawlStateStore(str(tmp_path / 'state.db'))
+    yield store
+    store.db.close()
+
+
+@pytest.fixture
+def fake_hbase(monkeypatch):
+    """Web 服务端的 happybase 连接替换为压测用的内存 HBase (loadtest.fake_hbase)。"""
+    import happybase
+    from loadtest.fake_hbase import FakeHBase
+
+    hb = FakeHBase(rpc_latency=0)
+    monkeypatch.setattr(happybase, 'ConnectionPool', lambda size, **kwargs: hb.connection_pool(size, **kwargs))
+    monkeypatch.setattr(happybase, 'Connection', lambda *args, **kwargs: hb.connection(**kwargs))
+    return hb
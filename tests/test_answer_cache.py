@@ -0,0 +1,49 @@
+from answer_cache import AnswerCache
+
+
+def test_key_normalizes_question_and_tracks_document_versions():
+    cache = AnswerCache()
+    docs = [('d1', 'v1'), ('d2', None)]
+    assert cache.make_key('选课时间？', docs) == cache.make_key(' 选课 时间', docs)
+    assert cache.make_key('选课时间', docs) != cache.make_key('选课时间', [('d1', 'v2'), ('d2', None)])
+    assert cache.make_key('选课时间', docs) != cache.make_key('选课时间', list(reversed(docs)))
+
+
+def test_lru_eviction_by_bytes():
+    cache = AnswerCache(max_bytes=1000)
+    cache.put('a', ['x' * 100])
+    cache.put('b', ['x' * 100])
+    assert cache.get('a') == ['x' * 100]  # a 最近使用过
+    cache.put('c', ['x' * 100])
+    assert cache.get('b') is None
+    assert cache.get('a') and cache.get('c')
+    assert cache._bytes <= cache.max_bytes
+
+    cache.put('huge', ['x' * 2000])
+    cache.put('empty', [])
+    assert cache.get('huge') is None and cache.get('empty') is None
+
+
+def test_expired_entries_are_dropped(monkeypatch):
+    import answer_cache
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, 'time', lambda: now[0])
+    cache = AnswerCache(ttl=60)
+    cache.put('a', ['回答'])
+    now[0] += 59
+    assert cache.get('a') == ['回答']
+    now[0] += 2
+    assert cache.get('a') is None
+    assert len(cache) == 0 and cache._bytes == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_record_caches_only_complete_answers():
+    cache = AnswerCache()
+    assert list(cache.record('done', iter(['一', '二']))) == ['一', '二']
+    assert cache.get('done') == ['一', '二']
+
+    stream = cache.record('aborted', iter(['一', '二']))
+    next(stream)
+    stream.close()
+    assert cache.get('aborted') is None
@@ -0,0 +1,59 @@
+import pytest
+
+from ustc_spider.passages import PASSAGE_INDEX_TABLE, PASSAGE_TABLE
+
+
+@pytest.fixture
+def etl(fake_hbase):
+    build_passage_index = pytest.importorskip('build_passage_index')
+    connection = fake_hbase.connection()
+    build_passage_index.create_target_tables(connection)
+
+    def run(rows):
+        fake_hbase.apply('ustc_web_data', [('put', k.encode(), v) for k, v in rows.items()])
+        build_passage_index.build_index(connection)
+
+    return run
+
+
+def passages(hbase):
+    return sorted(k.decode() for k in hbase.table_rows(PASSAGE_TABLE))
+
+
+def postings(hbase, term):
+    return sorted(c.decode() for c in hbase.table_rows(PASSAGE_INDEX_TABLE).get(term.encode('utf-8'), {}))
+
+
+def page(text):
+    return {b'content:text': text.encode('utf-8'), b'info:title': '通知'.encode('utf-8'), b'info:type': b'web'}
+
+
+LONG = '\n'.join(['本科生退课办法说明。' * 30, '研究生奖学金评定细则。' * 30, '图书馆开放时间调整。' * 30])
+
+
+def test_full_rebuild_removes_stale_passages_and_postings(etl, fake_hbase):
+    etl({'doc1': page(LONG)})
+    assert passages(fake_hbase) == ['doc1#0000', 'doc1#0001', 'doc1#0002']
+    assert postings(fake_hbase, '图书馆') == ['p:doc1#0002']
+
+    # 页面改短后再做一次全量构建 (不带 --since)
+    etl({'doc1': page('本科生退课办法说明。' * 30)})
+    assert passages(fake_hbase) == ['doc1#0000']
+    assert postings(fake_hbase, '图书馆') == []
+    assert postings(fake_hbase, '奖学金') == []
+    assert postings(fake_hbase, '退课') == ['p:doc1#0000']
+
+
+def test_rewritten_passage_drops_old_terms(etl, fake_hbase):
+    etl({'doc1': page('本科生退课办法说明。' * 30)})
+    etl({'doc1': page('本科生选课办法说明。' * 30)})
+    assert passages(fake_hbase) == ['doc1#0000']
+    assert postings(fake_hbase, '退课') == []
+    assert postings(fake_hbase, '选课') == ['p:doc1#0000']
+
+
+def test_near_duplicate_row_loses_its_passages(etl, fake_hbase):
+    etl({'doc1': page(LONG)})
+    etl({'doc1': {**page(LONG), b'info:canonical': b'https://www.ustc.edu.cn/canonical'}})
+    assert passages(fake_hbase) == []
+    assert postings(fake_hbase, '退课') == []
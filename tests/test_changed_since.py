@@ -0,0 +1,40 @@
+import pytest
+
+from ustc_spider.indexing import changed_at_timestamp, changed_since_filter
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('2025-01-01', '2025-01-01 00:00:00'),
+    ('2025-01-01 08:30', '2025-01-01 08:30:00'),
+    (' 2025-01-01 08:30:05 ', '2025-01-01 08:30:05'),
+    ('2025-01-01T08:30:05', '2025-01-01 08:30:05'),
+])
+def test_since_is_normalized_to_changed_at_format(text, expected):
+    assert changed_at_timestamp(text) == expected
+
+
+@pytest.mark.parametrize('text', [
+    '', 'yesterday', '2025-13-01', '2025-01-01 25:00:00',
+    "2025-01-01', true, true) OR PrefixFilter('x",
+])
+def test_invalid_since_is_rejected(text):
+    with pytest.raises(ValueError):
+        changed_at_timestamp(text)
+
+
+def test_filter_uses_normalized_value():
+    assert changed_since_filter('2025-01-01') == \
+        b"SingleColumnValueFilter('info', 'changed_at', >=, 'binary:2025-01-01 00:00:00', true, true)"
+
+
+def test_filter_rejects_injection():
+    with pytest.raises(ValueError):
+        changed_since_filter("2025-01-01' , true, true)")
+
+
+def test_command_line_rejects_malformed_since(capsys):
+    build_inverted_index = pytest.importorskip('build_inverted_index')
+    assert build_inverted_index.parse_args(['--since', '2025-01-01']).since == '2025-01-01 00:00:00'
+    with pytest.raises(SystemExit):
+        build_inverted_index.parse_args(['--since', "x' OR 'y"])
+    assert '--since' in capsys.readouterr().err
@@ -0,0 +1,59 @@
+import hashlib
+
+from scrapy import Request
+from scrapy.utils.request import RequestFingerprinter
+
+from ustc_spider.dupefilters import BloomDupeFilter, BloomFilter
+
+
+def key(i):
+    return hashlib.sha1(str(i).encode()).digest()
+
+
+def test_no_false_negatives():
+    bloom = BloomFilter(memory_bytes=4096, error_rate=1e-3)
+    assert not any(bloom.add(key(i)) for i in range(500))
+    assert all(key(i) in bloom for i in range(500))
+    assert all(bloom.add(key(i)) for i in range(500))
+    assert bloom.count == 500
+    bloom.close()
+
+
+def test_false_positive_rate_within_budget():
+    bloom = BloomFilter(memory_bytes=16 * 1024, error_rate=1e-2)
+    for i in range(bloom.capacity):
+        bloom.add(key(i))
+    false_positives = sum(key(-i - 1) in bloom for i in range(5000))
+    assert false_positives / 5000 < 0.03
+    assert bloom.current_error_rate() < 0.02
+    bloom.close()
+
+
+def test_persists_across_runs(tmp_path):
+    path = str(tmp_path / 'requests.bloom')
+    bloom = BloomFilter(path, memory_bytes=4096, error_rate=1e-3)
+    for i in range(100):
+        bloom.add(key(i))
+    bloom.close()
+
+    # 重新打开时沿用文件中的参数，不按新设置重建
+    reopened = BloomFilter(path, memory_bytes=8192, error_rate=1e-4)
+    assert (reopened.size, reopened.count) == (4096, 100)
+    assert all(key(i) in reopened for i in range(100))
+    reopened.close()
+
+
+def test_invalid_file_is_recreated(tmp_path):
+    path = tmp_path / 'requests.bloom'
+    path.write_bytes(b'x' * 200)
+    bloom = BloomFilter(str(path), memory_bytes=4096)
+    assert bloom.count == 0 and bloom.size == 4096
+    bloom.close()
+
+
+def test_request_seen():
+    dupefilter = BloomDupeFilter(memory_bytes=4096, fingerprinter=RequestFingerprinter())
+    assert not dupefilter.request_seen(Request('https://www.ustc.edu.cn/a'))
+    assert dupefilter.request_seen(Request('https://www.ustc.edu.cn/a'))
+    assert not dupefilter.request_seen(Request('https://www.ustc.edu.cn/b'))
+    dupefilter.close('finished')
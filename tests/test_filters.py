@@ -0,0 +1,120 @@
+import hashlib
+import json
+
+import pytest
+
+from ustc_spider.filters import (FilterIndex, SearchFilters, build_filter_data, date_month, inherit_attributes,
+                                 parent_row_key, row_attributes, write_filter_index)
+
+PAGE_URL = 'https://www.teach.ustc.edu.cn/notice/1.html'
+PAGE_ID = hashlib.md5(PAGE_URL.encode('utf-8')).hexdigest()
+
+PAGE = {b'info:title': '2024年奖学金申请通知'.encode('utf-8'), b'info:type': b'web', b'info:url': PAGE_URL.encode(),
+        b'info:project': '教务处'.encode('utf-8'), b'info:date': b'2024-05-20'}
+ATTACHMENT = {b'info:title': '奖学金申请表'.encode('utf-8'), b'info:type': b'file',
+              b'info:parent_url': PAGE_URL.encode()}
+OTHER = {b'info:title': '奖学金评审结果'.encode('utf-8'), b'info:type': b'web', b'info:url': b'https://gradschool/1',
+         b'info:project': '研究生院'.encode('utf-8'), b'info:date': b'2021-11-02'}
+
+
+@pytest.mark.parametrize('text, month', [
+    ('2024-12-23', '2024-12'), ('2024/3/5', '2024-03'), ('2024年3月', '2024-03'), (b'2024-13-01', ''), ('', ''),
+])
+def test_date_month(text, month):
+    assert date_month(text) == month
+
+
+def test_year_bounds_cover_whole_year():
+    filters = SearchFilters(date_from='2023', date_to='2024')
+    assert (filters.date_from, filters.date_to) == ('2023-01', '2024-12')
+    assert filters.month_matches('2024-12') and not filters.month_matches('2022-12')
+    assert not filters.month_matches('')
+    assert not SearchFilters(projects=[' ', ''], doc_type='pdf')
+
+
+def test_attachment_inherits_page_attributes():
+    attrs = row_attributes(ATTACHMENT)
+    assert attrs == {'project': '', 'type': 'file', 'month': ''}
+    assert parent_row_key(ATTACHMENT) == PAGE_ID
+    assert inherit_attributes(attrs, row_attributes(PAGE))
+    assert attrs == {'project': '教务处', 'type': 'file', 'month': '2024-05'}
+    # 自身带项目与日期的行不需要读取网页
+    assert parent_row_key({**ATTACHMENT, b'info:project': b'x', b'info:date': b'2024-01-01'}) is None
+    assert parent_row_key(PAGE) is None
+
+
+def test_matches_row_uses_parent_row():
+    filters = SearchFilters(projects=['教务处'], date_from='2024')
+    assert filters.matches_row(PAGE)
+    assert not filters.matches_row(ATTACHMENT)
+    assert filters.matches_row(ATTACHMENT, PAGE)
+    assert not SearchFilters(doc_type='web').matches_row(ATTACHMENT, PAGE)
+    assert not filters.matches_row(OTHER)
+
+
+@pytest.fixture
+def filter_index(tmp_path):
+    documents = {
+        'a': {'project': '教务处', 'type': 'web', 'month': '2024-05'},
+        'b': {'project': '教务处', 'type': 'file', 'month': '2024-05'},
+        'c': {'project': '研究生院', 'type': 'web', 'month': '2021-11'},
+        'd': {'project': '', 'type': 'web', 'month': ''},
+    }
+    path = str(tmp_path / 'filter_index.json')
+    write_filter_index(path, build_filter_data(documents.items()))
+    return FilterIndex.open(path)
+
+
+def test_matcher(filter_index):
+    match = filter_index.matcher(SearchFilters(projects=['教务处'], doc_type='web'))
+    assert [match(d) for d in 'abcd'] == [True, False, False, False]
+    assert match('new-doc') is None
+    match = filter_index.matcher(SearchFilters(date_from='2022'))
+    assert [match(d) for d in 'abcd'] == [True, True, False, False]
+
+
+def test_facets_skip_own_attribute(filter_index):
+    facets = filter_index.facets(['a', 'b', 'c', 'd', 'unknown'], SearchFilters(projects=['教务处']))
+    # 项目分面不应用项目条件；类型与年份分面应用项目条件
+    assert facets['project'] == [['教务处', 2], ['研究生院', 1]]
+    assert facets['type'] == [['web', 1], ['file', 1]] or facets['type'] == [['file', 1], ['web', 1]]
+    assert facets['year'] == [['2024', 2]]
+
+
+def test_missing_index_file():
+    assert FilterIndex.open(None) is None
+    assert FilterIndex.open('/nonexistent/filter_index.json') is None
+
+
+# ---------- 检索：位图路径与逐行核对路径对附件的判断一致 ----------
+@pytest.fixture
+def hbase(fake_hbase):
+    hb = fake_hbase
+    rows = {PAGE_ID: PAGE, 'f' * 32: ATTACHMENT, 'c' * 32: OTHER}
+    hb.apply('ustc_web_data', [('put', k.encode(), v) for k, v in rows.items()])
+    postings = [('put', '奖学金'.encode('utf-8'),
+                 {f'p:{k}'.encode(): json.dumps({'w': 1.0, 't': v[b'info:type'].decode()}).encode()})
+                for k, v in rows.items()]
+    hb.apply('ustc_keyword_index', postings)
+    return hb
+
+
+@pytest.mark.parametrize('indexed', [False, True])
+def test_search_filters_attachments_like_the_bitmaps(hbase, tmp_path, indexed):
+    build_filter_index = pytest.importorskip('build_filter_index')
+    from search_engine import USTCSearchEngine
+
+    path = None
+    if indexed:
+        path = str(tmp_path / 'filter_index.json')
+        documents = build_filter_index.load_attributes(hbase.connection())
+        assert documents['f' * 32]['project'] == '教务处'
+        write_filter_index(path, build_filter_data(documents.items()))
+    engine = USTCSearchEngine(filter_index_path=path)
+
+    results = engine.rank('奖学金', filters=SearchFilters(projects=['教务处']))
+    assert sorted(r['doc_id'] for r in results) == sorted([PAGE_ID, 'f' * 32])
+    results = engine.rank('奖学金', filters=SearchFilters(doc_type='file', date_from='2024-01', date_to='2024-06'))
+    assert [r['doc_id'] for r in results] == ['f' * 32]
+    results = engine.rank('奖学金', filters=SearchFilters(projects=['研究生院']))
+    assert [r['doc_id'] for r in results] == ['c' * 32]
@@ -0,0 +1,21 @@
+from ustc_spider.frontier import LinkScorer
+
+
+def test_links_on_attachment_pages_score_higher():
+    scorer = LinkScorer()
+    url = 'https://example.edu/list2.htm'
+    plain = scorer.score(url, depth=1)
+    assert scorer.score(url, depth=1, page_attachments=2) == plain + 2 * LinkScorer.ATTACHMENT_PER_FILE
+    # 附件再多也不超过 ATTACHMENT
+    assert scorer.score(url, depth=1, page_attachments=50) == plain + LinkScorer.ATTACHMENT
+
+
+def test_notice_links_pass_the_budget_threshold():
+    scorer = LinkScorer()
+    assert scorer.score('https://example.edu/tzgg/list.htm') >= LinkScorer.NOTICE
+    assert scorer.score('https://example.edu/rili/2024/05', anchor_text='下一页') < LinkScorer.NOTICE
+
+
+def test_weights_can_be_overridden():
+    scorer = LinkScorer(attachment=10, attachment_per_file=5)
+    assert scorer.score('https://example.edu/a.htm', page_attachments=3) == 10 + LinkScorer.NEW_URL
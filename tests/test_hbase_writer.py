@@ -0,0 +1,119 @@
+def test_on_written_fires_only_after_flush(writer, table):
+    confirmed = []
+    writer.put(b'r1', {b'info:a': b'1'}, on_written=lambda: confirmed.append('r1'))
+    writer.delete(b'r2', columns=[b'info:a'], on_written=lambda: confirmed.append('r2'))
+    assert confirmed == []
+    assert writer.flush() == 2
+    assert confirmed == ['r1', 'r2']
+    assert [op[1] for op in table.committed] == [b'r1', b'r2']
+
+
+def test_transport_failure_keeps_mutations_and_callbacks(writer, table):
+    confirmed = []
+    writer.put(b'r1', {b'info:a': b'1'}, on_written=lambda: confirmed.append('r1'))
+    table.error = OSError('connection reset')
+    assert writer.flush() == 0
+    assert confirmed == []
+    assert writer.pending_count() == 1
+
+    table.error = None
+    writer.flush()
+    assert confirmed == ['r1']
+    assert writer.pending_count() == 0
+
+
+def test_rejected_batch_never_confirms(writer, table):
+    confirmed = []
+    writer.put(b'r1', {b'info:a': b'1'}, on_written=lambda: confirmed.append('r1'))
+    table.error = ValueError('bad mutation')
+    writer.flush()
+    assert confirmed == []
+    assert writer.pending_count() == 0
+    assert writer.failed == 1
+
+
+def test_callback_error_does_not_break_flush(writer):
+    confirmed = []
+
+    def broken():
+        raise RuntimeError('boom')
+
+    writer.put(b'r1', {b'info:a': b'1'}, on_written=broken)
+    writer.put(b'r2', {b'info:a': b'1'}, on_written=lambda: confirmed.append('r2'))
+    assert writer.flush() == 2
+    assert confirmed == ['r2']
+
+
+def test_full_buffer_flushes_and_confirms(writer):
+    confirmed = []
+    for i in range(10):
+        writer.put(f'r{i}'.encode(), {b'info:a': b'1'}, on_written=lambda i=i: confirmed.append(i))
+    assert confirmed == list(range(10))
+
+
+def test_crawl_state_recorded_only_when_row_is_written(writer, table, state):
+    from ustc_spider.pipelines import HBasePipeline
+
+    pipeline = HBasePipeline()
+    pipeline.writer = writer
+    url = 'https://example.edu/a'
+    on_written = lambda: state.record_changed(url, '"etag"', 'Mon, 01 Jan 2024 00:00:00 GMT', 'fp1')
+
+    table.error = OSError('connection reset')
+    pipeline._write(b'row', {b'info:url': url.encode()}, [], False, on_written)
+    writer.flush()
+    # 仍在缓冲区：下一轮爬取不能发送条件请求，也不能按指纹判为未变化
+    assert state.get(url) is None
+
+    table.error = None
+    writer.flush()
+    record = state.get(url)
+    assert record['fingerprint'] == 'fp1'
+    assert record['etag'] == '"etag"'
+    assert record['change_count'] == 1
+
+
+def test_simhash_recorded_only_when_row_is_written(writer, table, state):
+    from ustc_spider.pipelines import HBasePipeline
+
+    pipeline = HBasePipeline()
+    pipeline.writer = writer
+    pipeline.state = state
+    url = 'https://example.edu/a'
+    on_written = pipeline._state_callback({'url': url, 'simhash': (1 << 63) + 5})
+
+    table.error = OSError('connection reset')
+    pipeline._write(b'row', {b'info:url': url.encode()}, [], False, on_written)
+    writer.flush()
+    # 未落库的页面不能作为下一轮的近似重复判定依据
+    assert state.load_simhashes() == []
+    # 未开启增量爬取：不登记 ETag / 指纹
+    assert state.get(url) is None
+
+    table.error = None
+    writer.flush()
+    assert state.load_simhashes() == [(url, (1 << 63) + 5)]
+    assert state.get(url) is None
+
+
+def test_no_state_callback_when_nothing_to_record():
+    from ustc_spider.pipelines import HBasePipeline
+
+    assert HBasePipeline()._state_callback({'url': 'https://example.edu/a'}) is None
+
+
+def test_crawl_state_round_trips(state):
+    state.record_changed('u', None, None, 'fp1')
+    state.record_unchanged('u', 'e2', 'lm2')
+    state.record_not_modified('u')
+    record = state.get('u')
+    assert (record['etag'], record['last_modified'], record['fingerprint']) == ('e2', 'lm2', 'fp1')
+    assert (record['fetch_count'], record['change_count']) == (3, 1)
+    assert state.get_change_stats(['u', 'missing']) == {'u': (3, 1)}
+
+    state.record_simhash('u', (1 << 64) - 1)
+    assert state.load_simhashes() == [('u', (1 << 64) - 1)]
+
+    assert state.get_indexed_words('doc') is None
+    state.record_indexed_words('doc', ['计算机', '学院'])
+    assert state.get_indexed_words('doc') == ['计算机', '学院']
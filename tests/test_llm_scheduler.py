@@ -0,0 +1,97 @@
+import threading
+import time
+
+import pytest
+
+from llm_scheduler import LLMScheduler
+
+
+def test_admits_in_arrival_order():
+    scheduler = LLMScheduler(max_concurrent=1, max_waiting=2)
+    first, second, third = scheduler.enter(), scheduler.enter(), scheduler.enter()
+    assert first.wait(0) and first.position == 0
+    assert (second.position, third.position) == (1, 2)
+    assert scheduler.enter() is None
+    assert scheduler.stats()['rejected'] == 1
+
+    first.leave()
+    first.leave()  # 可重复调用
+    assert second.wait(0) and third.position == 1
+    assert scheduler.stats()['running'] == 1
+
+
+def test_leaving_queue_frees_the_place():
+    scheduler = LLMScheduler(max_concurrent=1, max_waiting=1)
+    running, waiting = scheduler.enter(), scheduler.enter()
+    waiting.leave()
+    assert not waiting.wait(0)
+    assert scheduler.stats() == {'running': 1, 'waiting': 0, 'admitted': 1, 'rejected': 0, 'timed_out': 0}
+    running.leave()
+    assert scheduler.stats()['running'] == 0
+
+
+def test_wait_wakes_up_when_a_slot_is_freed():
+    scheduler = LLMScheduler(max_concurrent=1)
+    running, waiting = scheduler.enter(), scheduler.enter()
+    threading.Timer(0.05, running.leave).start()
+    assert waiting.wait(timeout=2)
+
+
+def test_timeout_is_recorded_once_per_ticket():
+    scheduler = LLMScheduler(deadline=0)
+    ticket = scheduler.enter()
+    assert ticket.expired()
+    assert scheduler.record_timeout(ticket)
+    assert not scheduler.record_timeout(ticket)
+    assert ticket.timed_out and scheduler.stats()['timed_out'] == 1
+
+
+# ---------- 回答时限在转发端执行 ----------
+class FakeSearchEngine:
+    def fill_snippets(self, results):
+        return {r['doc_id']: '' for r in results}
+
+
+class StalledChain:
+    """输出第一个 token 后长时间不再输出 (模型卡住)。"""
+
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def stream(self, inputs):
+        try:
+            yield '第一段'
+            self.closed.wait(5)
+            yield '迟到的内容'
+        finally:
+            self.closed.set()
+
+
+@pytest.fixture
+def service():
+    pytest.importorskip('langchain_ollama')
+    pytest.importorskip('langchain_core')
+    from answer_cache import AnswerCache
+    from rag_service import RAGService
+
+    svc = RAGService.__new__(RAGService)
+    svc.search_engine = FakeSearchEngine()
+    svc.answer_cache = AnswerCache()
+    svc.llm_scheduler = LLMScheduler(max_concurrent=1, deadline=0.3)
+    svc.build_context = lambda query, results: ''
+    svc.chain = StalledChain()
+    return svc
+
+
+def test_deadline_enforced_while_llm_is_silent(service):
+    results = [{'doc_id': 'd1', 'version': ''}]
+    started = time.monotonic()
+    events = list(service.stream_answer('问题', results))
+    assert time.monotonic() - started < 2
+    assert ('token', '第一段') in events
+    assert events[-1][0] == 'notice' and events[-1][1]['reason'] == 'deadline'
+    assert [e for e in events if e[0] == 'notice'] == [events[-1]]
+    # 名额已空出，下一个请求无需等待
+    assert service.llm_scheduler.stats()['running'] == 0
+    assert service.llm_scheduler.stats()['timed_out'] == 1
+    assert service.llm_scheduler.enter().wait(0)
@@ -0,0 +1,76 @@
+import pytest
+
+from ustc_spider.passages import (MAX_CHARS, PASSAGE_INDEX_TABLE, PASSAGE_TABLE, TARGET_CHARS, doc_of,
+                                  estimate_tokens, passage_id, passage_terms, posting_column, posting_value,
+                                  split_passages)
+
+
+def test_split_respects_limits_and_keeps_text():
+    text = '\n'.join(['短段落。'] * 40 + ['很长的一段话。' * 120] + ['  结尾  '])
+    passages = split_passages(text)
+    assert all(len(p) <= MAX_CHARS for p in passages)
+    assert ''.join(passages).replace('\n', '') == text.replace('\n', '').replace(' ', '')
+    # 除最后一段外都接近目标长度
+    assert all(len(p) >= TARGET_CHARS // 2 for p in passages[:-1])
+
+
+def test_trailing_fragment_is_merged():
+    passages = split_passages('甲' * TARGET_CHARS + '\n尾巴')
+    assert passages == ['甲' * TARGET_CHARS + '\n尾巴']
+    assert split_passages('') == [] and split_passages('\n \n') == []
+
+
+def test_ids_and_token_estimate():
+    pid = passage_id('abc#1', 7)
+    assert pid == 'abc#1#0007' and doc_of(pid) == 'abc#1'
+    assert estimate_tokens('中科大') == 3
+    assert estimate_tokens('abcdefgh') == 2
+
+
+# ---------- 段落 BM25 检索 ----------
+PASSAGES = {
+    'd1': ['本科生退课办法：在选课系统中提交退课申请，由教务处审核。', '图书馆开放时间调整通知。'],
+    'd2': ['研究生奖学金评定细则。', '退课 退课 退课：研究生课程退选需导师同意，退课截止时间为第八周。'],
+    'd3': ['本科生退课须在第四周之前完成。'],
+}
+
+
+@pytest.fixture
+def engine(fake_hbase):
+    from search_engine import USTCSearchEngine
+
+    passage_rows, postings = [], {}
+    for doc_id, texts in PASSAGES.items():
+        for n, text in enumerate(texts):
+            pid = passage_id(doc_id, n)
+            passage_rows.append(('put', pid.encode(), {b'p:text': text.encode('utf-8'), b'p:doc': doc_id.encode(),
+                                                       b'p:title': doc_id.encode(), b'p:type': b'web'}))
+            counts, length = passage_terms(text)
+            for word, tf in counts.items():
+                postings.setdefault(word.encode('utf-8'), {})[posting_column(pid)] = posting_value(tf, length)
+    fake_hbase.apply(PASSAGE_TABLE, passage_rows)
+    fake_hbase.apply(PASSAGE_INDEX_TABLE, [('put', word, cols) for word, cols in postings.items()])
+    return USTCSearchEngine()
+
+
+def test_passages_restricted_to_given_documents(engine):
+    results = engine.search_passages('退课', ['d1', 'd3'])
+    assert {r['doc_id'] for r in results} == {'d1', 'd3'}
+    assert all('退课' in r['text'] for r in results)
+    assert engine.search_passages('退课', []) == []
+    assert engine.search_passages('量子计算', ['d1']) == []
+
+
+def test_bm25_prefers_term_frequency_and_document_rank(engine):
+    results = engine.search_passages('退课', ['d1', 'd2', 'd3'])
+    assert results[0]['passage_id'] == passage_id('d2', 1)
+    assert [r['score'] for r in results] == sorted((r['score'] for r in results), reverse=True)
+    # 同样的段落，所属文档排名越靠前分数越高
+    first = {r['doc_id']: r['score'] for r in engine.search_passages('本科生退课', ['d1', 'd3'])}
+    swapped = {r['doc_id']: r['score'] for r in engine.search_passages('本科生退课', ['d3', 'd1'])}
+    assert first['d1'] > swapped['d1'] and swapped['d3'] > first['d3']
+
+
+def test_missing_passage_index_returns_empty(fake_hbase):
+    from search_engine import USTCSearchEngine
+    assert USTCSearchEngine().search_passages('退课', ['d1']) == []
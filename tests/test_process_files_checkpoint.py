@@ -0,0 +1,162 @@
+import json
+import sys
+import types
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def etl():
+    # 检查点逻辑不调用 Tika；未安装时用空模块占位以便导入脚本 (parse_file 在各测试中替换)
+    try:
+        import tika  # noqa: F401
+    except ImportError:
+        tika = types.ModuleType('tika')
+        tika.parser = types.ModuleType('tika.parser')
+        sys.modules['tika'] = tika
+        sys.modules['tika.parser'] = tika.parser
+    import process_files_content
+    return process_files_content
+
+
+class FakeTable:
+    """只记录写入；fail 中的附件路径写入时抛异常。"""
+
+    def __init__(self, rows=None, fail=()):
+        self.rows = rows or {}
+        self.fail = set(fail)
+        self.written = []
+
+    def put(self, row_key, data):
+        rel_path = json.loads(data[b'files:path'])[0]
+        if rel_path in self.fail:
+            raise IOError(f'rejected {rel_path}')
+        self.written.append(rel_path)
+
+    def scan(self, row_start=None, row_stop=None, **kwargs):
+        # 与 happybase 相同：行键与区间边界均为 bytes
+        for key in sorted(self.rows):
+            key_bytes = key.encode('utf-8')
+            if row_start and key_bytes < row_start:
+                continue
+            if row_stop and key_bytes >= row_stop:
+                break
+            yield key_bytes, self.rows[key]
+
+
+class FakeExtractor:
+    def extract_batch(self, texts):
+        return [[] for _ in texts]
+
+
+def parent_row(files):
+    return {b'files:path': json.dumps(files).encode('utf-8'), b'info:url': b'https://example.edu/p',
+            b'info:title': b'parent'}
+
+
+@pytest.fixture
+def parse_ok(etl, monkeypatch):
+    def parse_file(abs_path, rel_path, parent_url, parent_title):
+        return {'row_key': rel_path, 'rel_path': rel_path, 'parent_url': parent_url, 'title': rel_path,
+                'text': 'text'}
+    monkeypatch.setattr(etl, 'parse_file', parse_file)
+
+
+def make_checkpoint(etl, tmp_path, **kwargs):
+    return etl.ScanCheckpoint(str(tmp_path / 'ckpt.json'), **kwargs)
+
+
+def test_pending_files_for_interrupted_row(etl, tmp_path):
+    ckpt = make_checkpoint(etl, tmp_path)
+    ckpt.current_row = 'r1'
+    ckpt.in_flight = {'b.pdf'}
+    assert ckpt.pending_files('r1', ['a.pdf', 'b.pdf']) == ['b.pdf']
+    assert ckpt.pending_files('r2', ['a.pdf', 'b.pdf']) == ['a.pdf', 'b.pdf']
+
+
+def test_pending_files_empty_when_interrupted_row_was_finished(etl, tmp_path):
+    ckpt = make_checkpoint(etl, tmp_path)
+    ckpt.current_row = 'r1'
+    ckpt.in_flight = set()
+    assert ckpt.pending_files('r1', ['a.pdf', 'b.pdf']) == []
+
+
+def test_scan_start(etl, tmp_path):
+    ckpt = make_checkpoint(etl, tmp_path, row_start='a')
+    assert ckpt.scan_start() == 'a'
+    ckpt.last_row = 'k'
+    assert ckpt.scan_start() == 'k\x00'
+    ckpt.current_row = 'm'
+    assert ckpt.scan_start() == 'm'
+
+
+def test_save_and_load_round_trip(etl, tmp_path):
+    ckpt = make_checkpoint(etl, tmp_path, row_start='a', row_stop='z')
+    ckpt.begin_row('r1', ['a.pdf', 'b.pdf'])
+    ckpt.file_done('a.pdf')
+    ckpt.save()
+
+    restored = make_checkpoint(etl, tmp_path, row_start='a', row_stop='z')
+    assert restored.load()
+    assert restored.current_row == 'r1'
+    assert restored.in_flight == {'b.pdf'}
+    assert restored.files_done == 1
+
+
+def test_load_rejects_other_range(etl, tmp_path):
+    make_checkpoint(etl, tmp_path, row_start='a', row_stop='m').save()
+    with pytest.raises(ValueError):
+        make_checkpoint(etl, tmp_path, row_start='m', row_stop='z').load()
+
+
+def test_process_files_keeps_failed_writes_in_flight(etl, tmp_path, parse_ok):
+    ckpt = make_checkpoint(etl, tmp_path)
+    ckpt.begin_row('r1', ['a.pdf', 'b.pdf'])
+    table = FakeTable(fail={'b.pdf'})
+    assert etl.process_files(['a.pdf', 'b.pdf'], 'u', 't', table, FakeExtractor(), ckpt) is False
+    assert table.written == ['a.pdf']
+    assert ckpt.in_flight == {'b.pdf'}
+    assert ckpt.files_done == 1
+
+
+def test_unparseable_files_count_as_done(etl, tmp_path, monkeypatch):
+    monkeypatch.setattr(etl, 'parse_file', lambda *args: None)
+    ckpt = make_checkpoint(etl, tmp_path)
+    ckpt.begin_row('r1', ['a.pdf'])
+    assert etl.process_files(['a.pdf'], 'u', 't', FakeTable(), FakeExtractor(), ckpt) is True
+    assert ckpt.in_flight == set()
+
+
+def test_scan_stops_at_failed_row_and_resume_retries_it(etl, tmp_path, parse_ok):
+    rows = {'r1': parent_row(['a.pdf']), 'r2': parent_row(['b.pdf', 'c.pdf']), 'r3': parent_row(['d.pdf'])}
+    table = FakeTable(rows, fail={'c.pdf'})
+    ckpt = make_checkpoint(etl, tmp_path)
+    etl.scan_and_process(table, FakeExtractor(), ckpt)
+    ckpt.save()
+
+    # r2 未完成：不推进 last_row，c.pdf 留待重试，r3 尚未处理
+    assert table.written == ['a.pdf', 'b.pdf']
+    assert ckpt.last_row == 'r1'
+    assert ckpt.current_row == 'r2'
+    assert ckpt.in_flight == {'c.pdf'}
+
+    table.fail.clear()
+    resumed = make_checkpoint(etl, tmp_path)
+    assert resumed.load()
+    etl.scan_and_process(table, FakeExtractor(), resumed)
+    assert table.written == ['a.pdf', 'b.pdf', 'c.pdf', 'd.pdf']
+    assert resumed.last_row == 'r3'
+    assert resumed.current_row is None
+
+
+def test_row_exception_does_not_advance_checkpoint(etl, tmp_path, monkeypatch):
+    def parse_file(*args):
+        raise RuntimeError('boom')
+    monkeypatch.setattr(etl, 'parse_file', parse_file)
+    table = FakeTable({'r1': parent_row(['a.pdf'])})
+    ckpt = make_checkpoint(etl, tmp_path)
+    etl.scan_and_process(table, FakeExtractor(), ckpt)
+    assert ckpt.last_row is None
+    assert ckpt.current_row == 'r1'
+    assert ckpt.in_flight == {'a.pdf'}
+    assert ckpt.scan_start() == 'r1'
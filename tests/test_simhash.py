@@ -0,0 +1,73 @@
+import random
+
+import pytest
+
+from ustc_spider.simhash import HASH_BITS, SimHashIndex, hamming_distance, simhash
+
+
+def flip(h, positions):
+    for i in positions:
+        h ^= 1 << i
+    return h
+
+
+@pytest.mark.parametrize('max_distance', [0, 3, 4, 6, 9, 63])
+def test_bands_cover_every_bit_once(max_distance):
+    index = SimHashIndex(max_distance=max_distance)
+    covered = 0
+    for shift, mask in index._band_slices:
+        assert mask
+        assert covered & (mask << shift) == 0
+        covered |= mask << shift
+    assert covered == (1 << HASH_BITS) - 1
+    widths = [mask.bit_length() for _, mask in index._band_slices]
+    assert max(widths) - min(widths) <= 1
+
+
+@pytest.mark.parametrize('max_distance', [-1, HASH_BITS])
+def test_out_of_range_distance_is_rejected(max_distance):
+    with pytest.raises(ValueError):
+        SimHashIndex(max_distance=max_distance)
+
+
+@pytest.mark.parametrize('max_distance', [3, 4, 6])
+def test_find_agrees_with_brute_force(max_distance):
+    rng = random.Random(max_distance)
+    base = [rng.getrandbits(HASH_BITS) for _ in range(50)]
+    index = SimHashIndex(max_distance=max_distance)
+    stored = {}
+    for i, h in enumerate(base):
+        # 每个基准指纹附带几个距离 1..max_distance+2 的变体，包括落在最后几位上的差异
+        for j, distance in enumerate(range(1, max_distance + 3)):
+            positions = rng.sample(range(HASH_BITS), distance) if j % 2 else range(HASH_BITS - distance, HASH_BITS)
+            stored[f'{i}-{j}'] = flip(h, positions)
+    for key, h in stored.items():
+        index.add(key, h)
+
+    for h in base:
+        distances = {key: hamming_distance(h, v) for key, v in stored.items()}
+        within = {key: d for key, d in distances.items() if d <= max_distance}
+        found = index.find(h)
+        if not within:
+            assert found is None
+        else:
+            assert found is not None and found[1] == min(within.values())
+
+
+def test_remove_and_exclude():
+    index = SimHashIndex(max_distance=3)
+    h = simhash('中国科学技术大学研究生院招生简章')
+    index.add('a', h)
+    index.add('b', flip(h, [0, 63]))
+    assert index.find(h) == ('a', 0)
+    assert index.find(h, exclude='a') == ('b', 2)
+    index.remove('a')
+    assert len(index) == 1
+    assert index.find(h) == ('b', 2)
+
+
+def test_simhash_is_stable_and_tolerates_small_edits():
+    text = '中国科学技术大学 2025 年硕士研究生招生简章，报名时间为十月，请考生按时网上报名并确认信息。' * 3
+    assert simhash(text) == simhash(text.replace(' ', '\n'))
+    assert hamming_distance(simhash(text), simhash(text + '附件下载')) <= 6
+    assert simhash('') == 0
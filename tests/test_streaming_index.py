@@ -0,0 +1,95 @@
+import json
+
+import pytest
+from scrapy.settings import Settings
+
+from ustc_spider.indexing import build_postings, posting_column
+from ustc_spider.pipelines import StreamingIndexer
+
+
+class FakeSource:
+    """ustc_web_data 的写入器替身：只提供 row() 读取旧关键词。"""
+
+    def __init__(self, rows=None):
+        self.rows = rows or {}
+
+    def row(self, row_key, columns=None):
+        return self.rows.get(row_key, {})
+
+
+@pytest.fixture
+def indexer(writer, state):
+    idx = StreamingIndexer(Settings(), state, FakeSource())
+    idx.writer = writer
+    return idx
+
+
+def keywords(*words):
+    return [{'word': w, 'weight': 0.5} for w in words]
+
+
+def test_postings_match_batch_encoding(indexer, table):
+    indexer.update('doc1', keywords('计算机', '学院'), doc_type='file')
+    indexer.writer.flush()
+    expected = build_postings('doc1', keywords('计算机', '学院'), 'file')
+    assert {op[1].decode('utf-8'): op[2] for op in table.committed} == \
+        {w: {col: value} for w, (col, value) in expected.items()}
+
+
+def test_indexed_words_recorded_only_after_flush(indexer, table, state):
+    indexer.update('doc1', keywords('计算机', '学院'))
+    assert state.get_indexed_words('doc1') is None
+
+    table.error = OSError('connection reset')
+    indexer.writer.flush()
+    assert state.get_indexed_words('doc1') is None
+
+    table.error = None
+    indexer.writer.flush()
+    assert sorted(state.get_indexed_words('doc1')) == ['学院', '计算机']
+
+
+def test_partial_flush_does_not_record(indexer, table, state):
+    indexer.writer.batch_size = 1
+    table.error = OSError('connection reset')
+    indexer.update('doc1', keywords('计算机', '学院'))
+    assert state.get_indexed_words('doc1') is None
+
+
+def test_update_deletes_stale_postings(indexer, table, state):
+    indexer.update('doc1', keywords('计算机', '学院'))
+    indexer.writer.flush()
+    table.committed.clear()
+
+    indexer.update('doc1', keywords('计算机', '招生'))
+    indexer.writer.flush()
+    deletes = [(op[1].decode('utf-8'), op[2]) for op in table.committed if op[0] == 'delete']
+    assert deletes == [('学院', [posting_column('doc1')])]
+    assert sorted(state.get_indexed_words('doc1')) == ['招生', '计算机']
+
+
+def test_unconfirmed_update_is_diffed_against_last_written_words(indexer, table, state):
+    indexer.update('doc1', keywords('计算机', '学院'))
+    indexer.writer.flush()
+
+    # 第二次更新未能提交 (进程在 flush 前退出)：登记的仍是已落库的关键词
+    indexer.update('doc1', keywords('招生'))
+    indexer.writer._pending.clear()
+    assert sorted(state.get_indexed_words('doc1')) == ['学院', '计算机']
+
+    table.committed.clear()
+    indexer.update('doc1', keywords('招生'))
+    indexer.writer.flush()
+    assert sorted(op[1].decode('utf-8') for op in table.committed if op[0] == 'delete') == ['学院', '计算机']
+
+
+def test_document_without_keywords_records_immediately(indexer, state):
+    indexer.update('doc1', [])
+    assert state.get_indexed_words('doc1') == []
+
+
+def test_old_keywords_read_from_source_for_known_pages(indexer, table, state):
+    indexer.source.rows['doc1'] = {b'info:keywords': json.dumps(keywords('旧词'), ensure_ascii=False).encode('utf-8')}
+    indexer.update('doc1', keywords('新词'), known=True)
+    indexer.writer.flush()
+    assert [op[1].decode('utf-8') for op in table.committed if op[0] == 'delete'] == ['旧词']
@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+from ustc_spider.suggest import (QueryLog, SuggestIndex, build_suggest_data, normalize, term_weight,
+                                 write_suggest_index)
+
+SYLLABLES = '计算机科学技术研究生院教务处学物理化数'
+
+
+def brute_force(terms, prefix, k):
+    matches = [(t, w) for t, w in terms.items() if t.startswith(prefix)]
+    return sorted(matches, key=lambda tw: -tw[1])[:k]
+
+
+@pytest.fixture
+def terms():
+    rng = random.Random(7)
+    words = {''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 5))) for _ in range(10000)}
+    # 权重各不相同，结果顺序唯一
+    return {w: round(i * 0.001 + 0.001, 4) for i, w in enumerate(sorted(words, key=lambda _: rng.random()))}
+
+
+@pytest.mark.parametrize('heavy_prefix_size', [8, 256])
+def test_prefix_lookup_matches_brute_force(tmp_path, terms, heavy_prefix_size):
+    path = str(tmp_path / 'suggest_index.json')
+    data = build_suggest_data(terms, heavy_prefix_size=heavy_prefix_size)
+    assert data['top']  # 短前缀的区间超过阈值，预先计算
+    write_suggest_index(path, data)
+    index = SuggestIndex.open(path)
+    assert len(index) == len(terms)
+    for prefix in ['计', '研究', '教务处', '学物', '化数学', '不存在']:
+        for k in (1, 5, 10):
+            assert index.suggest(prefix, k) == brute_force(terms, prefix, k)
+
+
+def test_prefix_is_normalized(tmp_path):
+    path = str(tmp_path / 'suggest_index.json')
+    write_suggest_index(path, build_suggest_data({'ustc': 1.0, 'ustc 校历': 2.0, '选课': 3.0}))
+    index = SuggestIndex.open(path)
+    assert index.suggest(' ＵＳＴＣ') == [('ustc 校历', 2.0), ('ustc', 1.0)]
+    assert index.suggest('   ') == []
+    assert SuggestIndex.open(str(tmp_path / 'missing.json')) is None
+
+
+def test_query_log_counts(tmp_path):
+    path = str(tmp_path / 'queries.log')
+    log = QueryLog(path)
+    log.append('选课 时间', 12)
+    log.append('选课 时间', 3)
+    log.append('没有结果', 0)
+    log.append('\t', 5)
+    log.close()
+    assert QueryLog.read_counts(path) == {normalize('选课 时间'): 2}
+    assert QueryLog.read_counts(path, since='2999-01-01 00:00:00') == {}
+    assert term_weight(df=3, query_count=2) > term_weight(df=3)
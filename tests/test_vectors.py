@@ -0,0 +1,110 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from ustc_spider.vectors import HashingEmbedder, VectorIndex, VectorIndexWriter
+
+
+def clustered_vectors(count=2000, dim=32, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    vectors = centers[rng.integers(clusters, size=count)] + 0.3 * rng.normal(size=(count, dim))
+    return vectors.astype(np.float32)
+
+
+def build(directory, vectors, nlist=0):
+    writer = VectorIndexWriter(str(directory), vectors.shape[1], 'hashing:32')
+    ids = [f'd{i // 4}#{i % 4:04d}' for i in range(len(vectors))]
+    for start in range(0, len(vectors), 500):
+        writer.add(ids[start:start + 500], vectors[start:start + 500])
+    meta = writer.finalize(nlist=nlist)
+    return VectorIndex(str(directory)), meta
+
+
+def test_brute_force_returns_exact_neighbours(tmp_path):
+    vectors = clustered_vectors()
+    index, meta = build(tmp_path / 'flat', vectors)
+    assert meta['nlist'] == 0 and index.count == len(vectors)
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = normalized[:5]
+    for qi, hits in enumerate(index.search(queries, k=10)):
+        expected = np.argsort(-(normalized @ queries[qi]))[:10]
+        assert [h[0] for h in hits][0] == f'd{qi // 4}#{qi % 4:04d}'
+        # float16 存储会带来极小的误差，只比较集合
+        assert len({h[0] for h in hits} & {f'd{i // 4}#{i % 4:04d}' for i in expected}) >= 9
+        assert [h[1] for h in hits] == sorted((h[1] for h in hits), reverse=True)
+
+
+def test_ivf_agrees_with_brute_force(tmp_path):
+    vectors = clustered_vectors()
+    flat, _ = build(tmp_path / 'flat', vectors)
+    ivf, meta = build(tmp_path / 'ivf', vectors, nlist=16)
+    assert meta['nlist'] == 16 and ivf._data.offsets[-1] == len(vectors)
+    queries = vectors[::100] / np.linalg.norm(vectors[::100], axis=1, keepdims=True)
+
+    # 探测全部分区时与暴力检索一致
+    for exact, approx in zip(flat.search(queries, k=10), ivf.search(queries, k=10, nprobe=16)):
+        assert [h[0] for h in approx] == [h[0] for h in exact]
+
+    # 只探测部分分区时召回率仍然很高
+    recall = np.mean([len({h[0] for h in a} & {h[0] for h in e}) / 10
+                      for e, a in zip(flat.search(queries, k=10), ivf.search(queries, k=10, nprobe=4))])
+    assert recall >= 0.9
+
+
+def test_search_docs_aggregates_passages(tmp_path):
+    embedder = HashingEmbedder(dim=64)
+    texts = ['本科生选课与退课办法', '研究生奖学金评定细则', '图书馆开放时间调整通知']
+    writer = VectorIndexWriter(str(tmp_path / 'idx'), 64, 'hashing:64')
+    writer.add([f'doc{i}#0000' for i in range(3)] + ['doc0#0001'], embedder.embed(texts + ['退课申请流程']))
+    writer.finalize()
+    index = VectorIndex.open(str(tmp_path / 'idx'))
+    results = index.search_docs('怎么退课', k=2)
+    assert results[0][0] == 'doc0'
+    assert len({doc for doc, _ in results}) == len(results)
+
+
+def test_missing_index():
+    assert VectorIndex.open(None) is None
+
+
+def test_writer_rejects_wrong_shape(tmp_path):
+    writer = VectorIndexWriter(str(tmp_path / 'idx'), 8, 'hashing:8')
+    with pytest.raises(ValueError):
+        writer.add(['a'], np.zeros((1, 4)))
+
+
+def test_reload_swaps_in_a_complete_snapshot(tmp_path):
+    directory = tmp_path / 'idx'
+    index, _ = build(directory, clustered_vectors(count=400, seed=1))
+    old = index._data
+    query = clustered_vectors(count=1, seed=1)
+    before = index.search(query, k=5)
+
+    # 重建为不同规模的 IVF 索引；加载完成前检索仍使用旧快照
+    build(directory, clustered_vectors(count=1200, seed=2), nlist=8)
+    os.utime(directory / 'meta.json', (old.mtime + 10, old.mtime + 10))
+    started = threading.Event()
+    release = threading.Event()
+    real_read = index._read
+
+    def slow_read():
+        started.set()
+        release.wait(5)
+        return real_read()
+
+    index._read = slow_read
+    assert index.reload_if_changed()
+    assert started.wait(5)
+    assert not index.reload_if_changed()  # 同一时间只有一个加载线程
+    assert index._data is old and index.search(query, k=5) == before
+    release.set()
+    for _ in range(100):
+        if index._data is not old:
+            break
+        time.sleep(0.05)
+    assert index.count == 1200 and index._data.centroids is not None
+    assert not index.reload_if_changed()